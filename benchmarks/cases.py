@@ -0,0 +1,198 @@
+"""
+Benchmark cases.
+
+Each case takes a scratch directory and a scale factor, does its own setup,
+and returns (seconds, operations) for the measured section only.
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+from aibuddies.buddies import Buddy, BuddyStore, Change
+from aibuddies.config import Paths
+from aibuddies.docs import DocIndex
+from aibuddies.llm import DummyLLM
+from aibuddies.local import LocalClient
+from aibuddies.runtime import RuntimeManager
+from aibuddies.simulate import simulate, synthetic_buddies
+
+from fake_provider import HTTPChatClient, start_server
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+Case = Callable[[Path, float], Tuple[float, int]]
+CASES: Dict[str, Case] = {}
+
+
+def case(name: str) -> Callable[[Case], Case]:
+    def register(fn: Case) -> Case:
+        CASES[name] = fn
+        return fn
+    return register
+
+
+def _n(base: int, scale: float) -> int:
+    return max(1, int(base * scale))
+
+
+def _buddy(i: int) -> Buddy:
+    return Buddy(
+        name=f"Buddy{i:05d}",
+        persona_prompt=f"You are buddy number {i}. Keep the user on track.",
+        autorun_interval="1m",
+        schedule=[f"{h:02d}:00|Check-in {h}" for h in range(8, 20, 2)],
+        context_sources=["window", "clipboard"],
+    )
+
+
+@case("cli_cold_start")
+def cli_cold_start(tmp: Path, scale: float) -> Tuple[float, int]:
+    env = dict(os.environ, HOME=str(tmp), PYTHONPATH=str(SRC_DIR))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "aibuddies", "--help"], env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start, 1
+
+
+@case("store_create")
+def store_create(tmp: Path, scale: float) -> Tuple[float, int]:
+    n = _n(300, scale)
+    store = BuddyStore(Paths(home=tmp))
+    start = time.perf_counter()
+    for i in range(n):
+        store.create(_buddy(i))
+    return time.perf_counter() - start, n
+
+
+@case("store_update")
+def store_update(tmp: Path, scale: float) -> Tuple[float, int]:
+    n = _n(300, scale)
+    store = BuddyStore(Paths(home=tmp))
+    for i in range(n):
+        store.buddies[f"Buddy{i:05d}"] = _buddy(i)
+    store._save()
+    start = time.perf_counter()
+    for i in range(n):
+        store.update(f"Buddy{i:05d}", {"model": "claude-3-5-haiku-20241022"})
+    return time.perf_counter() - start, n
+
+
+@case("store_apply")
+def store_apply(tmp: Path, scale: float) -> Tuple[float, int]:
+    n = _n(10000, scale)
+    store = BuddyStore(Paths(home=tmp))
+    for i in range(n // 2):
+        store.buddies[f"Buddy{i:05d}"] = _buddy(i)
+    store._save()
+    changes = [Change("update", f"Buddy{i:05d}", {"model": "claude-3-5-haiku-20241022"}) for i in range(n // 2)]
+    changes += [Change("create", b.name, dict(b.__dict__)) for b in map(_buddy, range(n // 2, n))]
+    start = time.perf_counter()
+    result = store.apply(changes)
+    elapsed = time.perf_counter() - start
+    assert len(result.created) + len(result.updated) == n
+    return elapsed, n
+
+
+@case("store_load_list")
+def store_load_list(tmp: Path, scale: float) -> Tuple[float, int]:
+    n = _n(5000, scale)
+    paths = Paths(home=tmp)
+    store = BuddyStore(paths)
+    for i in range(n):
+        store.buddies[f"Buddy{i:05d}"] = _buddy(i)
+    store._save()
+    start = time.perf_counter()
+    listed = BuddyStore(paths).list()
+    elapsed = time.perf_counter() - start
+    assert len(listed) == n
+    return elapsed, n
+
+
+@case("proactive_tick")
+def proactive_tick(tmp: Path, scale: float) -> Tuple[float, int]:
+    n = _n(5000, scale)
+    runtime = RuntimeManager(Paths(home=tmp))
+    for i in range(n):
+        b = _buddy(i)
+        runtime.running[b.name] = b
+    start = time.perf_counter()
+    runtime.proactive_tick()
+    return time.perf_counter() - start, n
+
+
+@case("docindex_add_list_clear")
+def docindex_add_list_clear(tmp: Path, scale: float) -> Tuple[float, int]:
+    n = _n(500, scale)
+    src = tmp / "folder"
+    src.mkdir()
+    for i in range(n):
+        (src / f"note{i}.txt").write_bytes(b"lorem ipsum " * 400)
+    index = DocIndex(Paths(home=tmp / "home"))
+    start = time.perf_counter()
+    for p in src.iterdir():
+        index.add("Doctor", p)
+    assert len(index.list("Doctor")) == n
+    index.clear("Doctor")
+    return time.perf_counter() - start, n
+
+
+def _ask_loop(tmp: Path, n: int, factory) -> Tuple[float, int]:
+    runtime = RuntimeManager(Paths(home=tmp), client_factory=factory)
+    b = _buddy(0)
+    runtime.running[b.name] = b
+    start = time.perf_counter()
+    for i in range(n):
+        runtime.ask(b.name, f"question {i}")
+    return time.perf_counter() - start, n
+
+
+@case("runtime_ask_dummy")
+def runtime_ask_dummy(tmp: Path, scale: float) -> Tuple[float, int]:
+    return _ask_loop(tmp, _n(500, scale), lambda cfg, model: DummyLLM())
+
+
+@case("runtime_ask_http")
+def runtime_ask_http(tmp: Path, scale: float) -> Tuple[float, int]:
+    server, base_url = start_server()
+    try:
+        client = HTTPChatClient(base_url)
+        return _ask_loop(tmp, _n(200, scale), lambda cfg, model: client)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@case("local_concurrent")
+def local_concurrent(tmp: Path, scale: float) -> Tuple[float, int]:
+    """16 buddies asking at once against a one-request-at-a-time local server (20 ms per request)."""
+    server, base_url = start_server(latency=0.02, serial=True)
+    try:
+        workers, n = 16, _n(10, scale)
+        template = "<|system|>{system}\n<|user|>{user}\n<|assistant|>"
+        client = LocalClient(base_url + "/v1", "fake", batch_size=16, batch_wait=0.005, chat_template=template)
+
+        def worker(i: int) -> None:
+            for j in range(n):
+                client.ask(f"Buddy{i:05d}", "persona", f"question {j}")
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start, workers * n
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@case("scheduler_sim")
+def scheduler_sim(tmp: Path, scale: float) -> Tuple[float, int]:
+    """One virtual day of the scheduler loop for 1000 synthetic buddies; ops are buddy-ticks."""
+    report = simulate(synthetic_buddies(_n(1000, scale)), days=1, home=tmp)
+    assert not report.problems(), report.problems()
+    return report.wall_seconds, report.passes * report.buddies
@@ -0,0 +1,98 @@
+"""
+Local fake LLM provider for benchmarks.
+
+Serves OpenAI-compatible `/v1/chat/completions` and `/v1/completions` (list
+prompts answered in one pass, like a batching local server) endpoints on
+127.0.0.1 with a configurable artificial latency per request, so the full ask
+path (prompt assembly, HTTP round trip, JSON parsing) can be measured without a
+real provider.
+"""
+import http.client
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from aibuddies.llm import AskOptions, LLMClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    serial: Optional[threading.Lock] = None  # one request at a time, like a CPU inference server
+
+    def do_POST(self) -> None:  # noqa: N802 - http.server API
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.latency:
+            if self.serial is not None:
+                with self.serial:
+                    time.sleep(self.latency)
+            else:
+                time.sleep(self.latency)
+        if self.path.endswith("/completions") and "prompt" in body:
+            prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+            payload = json.dumps({
+                "object": "text_completion",
+                "choices": [{"index": i, "text": f" ok: {p[-40:]}"} for i, p in enumerate(prompts)],
+            }).encode("utf-8")
+            self._reply(payload)
+            return
+        user = body.get("messages", [{}])[-1].get("content", "")
+        payload = json.dumps({
+            "id": "fake",
+            "object": "chat.completion",
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"ok: {user[-40:]}"}}],
+            "usage": {"prompt_tokens": len(user) // 4, "completion_tokens": 8},
+        }).encode("utf-8")
+        self._reply(payload)
+
+    def _reply(self, payload: bytes) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_server(latency: float = 0.0, serial: bool = False) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the fake provider in a daemon thread. Returns (server, base_url)."""
+    handler = type("Handler", (_Handler,), {"latency": latency, "serial": threading.Lock() if serial else None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+class HTTPChatClient(LLMClient):
+    """Minimal keep-alive client for the fake provider."""
+
+    def __init__(self, base_url: str, model: str = "fake") -> None:
+        host_port = base_url.split("://", 1)[1]
+        host, port = host_port.split(":")
+        self.conn = http.client.HTTPConnection(host, int(port), timeout=10)
+        self.model = model
+        self.lock = threading.Lock()
+
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
+        opts = opts or AskOptions()
+        body = json.dumps({
+            "model": self.model,
+            "max_tokens": opts.max_tokens,
+            "messages": [
+                {"role": "system", "content": persona_prompt},
+                {"role": "user", "content": user_text},
+            ],
+        })
+        with self.lock:
+            self.conn.request("POST", "/v1/chat/completions", body, {"Content-Type": "application/json"})
+            resp = self.conn.getresponse()
+            data = json.loads(resp.read())
+        return data["choices"][0]["message"]["content"]
@@ -0,0 +1,111 @@
+"""
+Run the AI Buddies benchmark suite and gate on regressions.
+
+    PYTHONPATH=src python benchmarks/run.py                      # run + compare to baseline
+    PYTHONPATH=src python benchmarks/run.py --update-baseline    # record a new baseline
+    PYTHONPATH=src python benchmarks/run.py --only proactive_tick --scale 0.2
+
+Results are JSON (per case: min/median/p95 seconds per sample and ops/sec). A
+case regresses when its `--metric` (default: min, the least noisy on shared
+machines) is more than `--threshold` (fraction) slower than the baseline's;
+any regression makes the exit code non-zero. Baselines are machine-specific:
+record one on the machine that runs the gate.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parent / "src"))
+
+from cases import CASES  # noqa: E402
+
+DEFAULT_BASELINE = HERE / "baseline.json"
+
+
+def run_case(name: str, repeats: int, scale: float) -> Dict[str, Any]:
+    samples: List[float] = []
+    ops = 0
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory(prefix=f"aib-bench-{name}-") as tmp:
+            elapsed, ops = CASES[name](Path(tmp), scale)
+        samples.append(elapsed)
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        "median_s": round(median, 6),
+        "p95_s": round(samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))], 6),
+        "min_s": round(samples[0], 6),
+        "ops": ops,
+        "ops_per_s": round(ops / median, 1) if median else None,
+        "repeats": repeats,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, metric: str = "min_s") -> List[str]:
+    failures = []
+    base_cases = baseline.get("cases", {})
+    for name, res in results["cases"].items():
+        base = base_cases.get(name)
+        if not base or base.get("scale") != res.get("scale") or not base.get(metric):
+            continue
+        ratio = res[metric] / base[metric]
+        res["baseline_" + metric] = base[metric]
+        res["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            failures.append(f"{name}: {metric} {res[metric]:.4f}s vs baseline {base[metric]:.4f}s ({ratio:.2f}x)")
+    return failures
+
+
+def main(argv: Any = None) -> int:
+    parser = argparse.ArgumentParser(description="AI Buddies benchmarks")
+    parser.add_argument("--only", nargs="+", choices=sorted(CASES), help="Run only these cases")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply workload sizes")
+    parser.add_argument("--out", help="Write JSON results here")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown fraction (0.25 = 25%%)")
+    parser.add_argument("--metric", choices=["min_s", "median_s", "p95_s"], default="min_s")
+    parser.add_argument("--update-baseline", dest="update_baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": {},
+    }
+    for name in args.only or sorted(CASES):
+        res = run_case(name, args.repeats, args.scale)
+        res["scale"] = args.scale
+        results["cases"][name] = res
+        print(f"{name:28s} median {res['median_s'] * 1000:9.2f} ms  p95 {res['p95_s'] * 1000:9.2f} ms  "
+              f"{res['ops_per_s'] or 0:12.1f} ops/s", flush=True)
+
+    baseline_path = Path(args.baseline)
+    failures: List[str] = []
+    if args.update_baseline:
+        merged = json.loads(baseline_path.read_text()) if baseline_path.exists() else {"cases": {}}
+        merged.update({k: v for k, v in results.items() if k != "cases"})
+        merged["cases"].update(results["cases"])
+        baseline_path.write_text(json.dumps(merged, indent=2) + "\n")
+        print(f"Baseline updated: {baseline_path}")
+    elif baseline_path.exists():
+        failures = compare(results, json.loads(baseline_path.read_text()), args.threshold, args.metric)
+    results["regressions"] = failures
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+    for f in failures:
+        print(f"REGRESSION {f}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
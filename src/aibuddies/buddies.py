@@ -1,8 +1,10 @@
-from dataclasses import dataclass, field
+import typing
+from dataclasses import dataclass, field, fields
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from .config import Paths, load_json, save_json
+from .config import Paths, load_json, save_json, save_json_atomic
+from .tracing import span
 
 
 @dataclass
@@ -22,6 +24,8 @@ class Buddy:
     clipboard: bool = False
     context_sources: List[str] = field(default_factory=list)
     docs_enabled: bool = False
+    timeout: float = 0.0  # seconds an ask/chat turn may take (0 = no deadline); see deadline.py
+    pinned_docs: List[str] = field(default_factory=list)  # doc files always sent in the cached prompt prefix
     doc_privacy: Dict[str, Any] = field(default_factory=lambda: {
         "redact_pii_default": True,
         "allow_cloud_with_docs": False,
@@ -46,6 +50,100 @@ class Buddy:
         return self.__dict__
 
 
+class StoreError(ValueError):
+    """Raised when a bulk change set is invalid; `errors` lists every problem found."""
+
+    def __init__(self, errors: List[str]) -> None:
+        shown = errors[:10] + ([f"... and {len(errors) - 10} more"] if len(errors) > 10 else [])
+        super().__init__("Invalid changes:\n" + "\n".join(f"- {e}" for e in shown))
+        self.errors = errors
+
+
+# JSON type each Buddy field must have (List[str] -> list, Dict[str, Any] -> dict).
+_FIELD_TYPES: Dict[str, type] = {f.name: typing.get_origin(f.type) or f.type for f in fields(Buddy)}
+
+
+def _field_errors(name: str, values: Dict[str, Any]) -> List[str]:
+    errors = []
+    for key, value in values.items():
+        expected = _FIELD_TYPES.get(key)
+        if expected is None:
+            errors.append(f"{name}: unknown field {key!r}")
+        elif key == "name" and value != name:
+            errors.append(f"{name}: cannot rename via {key!r} (delete and create instead)")
+        elif expected is float and isinstance(value, int) and not isinstance(value, bool):
+            continue  # an int is fine where a float is expected
+        elif not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            errors.append(f"{name}: {key} must be {expected.__name__}, got {type(value).__name__}")
+        elif expected is list and not all(isinstance(v, str) for v in value):
+            errors.append(f"{name}: {key} must be a list of strings")
+    return errors
+
+
+@dataclass
+class Change:
+    """One bulk operation: `create`, `update` (only the given fields), `upsert` or `delete`."""
+
+    op: str
+    name: str
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ApplyResult:
+    created: List[str] = field(default_factory=list)
+    updated: Dict[str, Dict[str, Tuple[Any, Any]]] = field(default_factory=dict)  # name -> field -> (old, new)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.created)} created, {len(self.updated)} updated, "
+            f"{len(self.deleted)} deleted, {len(self.unchanged)} unchanged"
+        )
+
+    def diff(self, limit: Optional[int] = None) -> List[str]:
+        """`+ name`, `~ name: field old -> new`, `- name` lines (at most `limit` buddies)."""
+        lines: List[str] = []
+        entries = (
+            [("+", name, None) for name in self.created]
+            + [("~", name, changes) for name, changes in self.updated.items()]
+            + [("-", name, None) for name in self.deleted]
+        )
+        for sign, name, changes in entries[:limit]:
+            if changes is None:
+                lines.append(f"{sign} {name}")
+                continue
+            for key, (old, new) in changes.items():
+                lines.append(f"~ {name}: {key} {old!r} -> {new!r}")
+        if limit is not None and len(entries) > limit:
+            lines.append(f"... and {len(entries) - limit} more")
+        return lines
+
+
+def changes_from_document(doc: Any) -> List[Change]:
+    """
+    Change set from an `apply` file: `buddies` (a list of buddy objects, or a name -> fields
+    mapping as in buddies.json) is upserted with only the fields given; `delete` lists names.
+    """
+    if not isinstance(doc, dict):
+        raise StoreError(["top level must be a mapping with `buddies` and/or `delete`"])
+    unknown = sorted(set(doc) - {"buddies", "delete"})
+    if unknown:
+        raise StoreError([f"unknown top-level key {k!r}" for k in unknown])
+    entries = doc.get("buddies") or []
+    if isinstance(entries, dict):
+        entries = [dict(values or {}, name=name) for name, values in entries.items()]
+    if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+        raise StoreError(["`buddies` must be a list of mappings (or a mapping of name to fields)"])
+    deletes = doc.get("delete") or []
+    if not isinstance(deletes, list):
+        raise StoreError(["`delete` must be a list of buddy names"])
+    changes = [Change("upsert", e.get("name"), {k: v for k, v in e.items() if k != "name"}) for e in entries]
+    changes.extend(Change("delete", name) for name in deletes)
+    return changes
+
+
 class BuddyStore:
     """Simple JSON-backed buddy store."""
 
@@ -56,11 +154,13 @@ class BuddyStore:
         self._load()
 
     def _load(self) -> None:
-        data = load_json(self.paths.buddies_file)
-        self.buddies = {name: Buddy.from_dict(cfg) for name, cfg in data.get("buddies", {}).items()}
+        with span("store.load"):
+            data = load_json(self.paths.buddies_file)
+            self.buddies = {name: Buddy.from_dict(cfg) for name, cfg in data.get("buddies", {}).items()}
 
     def _save(self) -> None:
-        save_json(self.paths.buddies_file, {"buddies": {name: b.to_dict() for name, b in self.buddies.items()}})
+        with span("store.save", buddies=len(self.buddies)):
+            save_json(self.paths.buddies_file, {"buddies": {name: b.to_dict() for name, b in self.buddies.items()}})
 
     def list(self) -> List[Buddy]:
         return list(self.buddies.values())
@@ -79,6 +179,82 @@ class BuddyStore:
             self._save()
         return existed
 
+    def apply(self, changes: Iterable[Change], dry_run: bool = False) -> ApplyResult:
+        """
+        Validate and apply many changes as one transaction: either every change is applied and the
+        store is written once (atomically, fsynced), or StoreError is raised and nothing changes.
+        Changes apply in order, so a later change sees the effect of earlier ones.
+        """
+        with span("store.apply"):
+            staged = dict(self.buddies)
+            before: Dict[str, Optional[Buddy]] = {}  # original of every name touched
+            errors: List[str] = []
+            for change in changes:
+                name = change.name
+                if not isinstance(name, str) or not name.strip():
+                    errors.append(f"{change.op}: missing buddy name")
+                    continue
+                current = staged.get(name)
+                op = change.op
+                if op == "upsert":
+                    op = "update" if current is not None else "create"
+                if op not in ("create", "update", "delete"):
+                    errors.append(f"{name}: unknown op {change.op!r}")
+                    continue
+                if op == "delete":
+                    if current is None:
+                        errors.append(f"{name}: delete of a buddy that does not exist")
+                        continue
+                    before.setdefault(name, self.buddies.get(name))
+                    del staged[name]
+                    continue
+                field_errors = _field_errors(name, change.fields)
+                if field_errors:
+                    errors.extend(field_errors)
+                    continue
+                values = {k: v for k, v in change.fields.items() if k != "name"}
+                if op == "create":
+                    if current is not None:
+                        errors.append(f"{name}: create of a buddy that already exists")
+                        continue
+                    if not isinstance(values.get("persona_prompt"), str):
+                        errors.append(f"{name}: create needs persona_prompt")
+                        continue
+                    before.setdefault(name, self.buddies.get(name))
+                    staged[name] = Buddy(name=name, **values)
+                else:
+                    if current is None:
+                        errors.append(f"{name}: update of a buddy that does not exist")
+                        continue
+                    before.setdefault(name, self.buddies.get(name))
+                    # Shallow copy with the new values: untouched fields are shared, never mutated here.
+                    updated = object.__new__(Buddy)
+                    updated.__dict__ = {**current.__dict__, **values}
+                    staged[name] = updated
+            if errors:
+                raise StoreError(errors)
+
+            result = ApplyResult()
+            for name, old in before.items():
+                new = staged.get(name)
+                if old is None and new is not None:
+                    result.created.append(name)
+                elif old is not None and new is None:
+                    result.deleted.append(name)
+                elif old is not None and new is not None:
+                    old_d, new_d = old.__dict__, new.__dict__
+                    diff = {k: (old_d[k], new_d[k]) for k in new_d if old_d[k] != new_d[k]}
+                    if diff:
+                        result.updated[name] = diff
+                    else:
+                        result.unchanged.append(name)
+            if dry_run or not (result.created or result.updated or result.deleted):
+                return result
+            self.buddies = staged
+            with span("store.save", buddies=len(staged)):
+                save_json_atomic(self.paths.buddies_file, {"buddies": {n: b.to_dict() for n, b in staged.items()}})
+            return result
+
     def update(self, name: str, updates: Dict[str, Any]) -> bool:
         buddy = self.buddies.get(name)
         if not buddy:
@@ -2,7 +2,7 @@
 AI Buddies CLI entrypoint (stub implementation).
 
 Split into:
-- Management commands: list/create/edit/delete/run/stop/status/pack/config.
+- Management commands: list/create/edit/apply/delete/run/stop/status/pack/config/metrics/usage.
 - Interaction commands: chat/ask/docs/voice/send.
 
 Note: Runtime + chat are stubs; "run" currently logs intent to open a new terminal window
@@ -10,20 +10,48 @@ for chat. Replace with real daemon + IPC + terminal spawning per OS.
 """
 from pathlib import Path
 import argparse
+import os
+import signal
 import sys
 from typing import Optional
 
-from .buddies import Buddy, BuddyStore
+from .buddies import Buddy, BuddyStore, Change, StoreError, changes_from_document
 from .docs import DocIndex
+from .packs import PackError, export_pack, import_pack
 from .runtime import RuntimeManager
 from .config import get_config, set_config
-from .schedules_llm import generate_schedule
+from .supervisor import Supervisor
+from .schedules_llm import generate_schedule, generate_schedules
+from . import metrics, tracing, voice
 
 
 runtime = RuntimeManager()
 docs_index = DocIndex()
 store = BuddyStore()
 
+DEFAULT_METRICS_PORT = 9464
+
+
+def _metrics_port(override: Optional[int] = None) -> Optional[int]:
+    if override is not None:
+        return override
+    value = get_config().get("metrics_port")
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def _start_metrics_endpoint() -> None:
+    """Expose /metrics on localhost for long-running commands when `metrics_port` is configured."""
+    port = _metrics_port()
+    if not port:
+        return
+    try:
+        metrics.serve(port)
+    except OSError as e:
+        print(f"Metrics endpoint not started on port {port}: {e}")
+
 
 def cmd_list(args: argparse.Namespace) -> None:
     buddies = store.list()
@@ -50,6 +78,7 @@ def cmd_create(args: argparse.Namespace) -> None:
         clipboard=args.clipboard,
         context_sources=args.context or [],
         docs_enabled=args.docs,
+        timeout=args.timeout,
     )
     store.create(buddy)
     print(f"Created buddy {buddy.name} ({buddy.emoji}).")
@@ -62,9 +91,15 @@ def cmd_delete(args: argparse.Namespace) -> None:
         print(f"Buddy {args.name} not found.")
 
 
+def _print_apply(result, dry_run: bool = False, limit: int = 50) -> None:
+    for line in result.diff(limit=limit):
+        print(line)
+    print(f"{'Would apply' if dry_run else 'Applied'}: {result.summary()}.")
+
+
 def cmd_edit(args: argparse.Namespace) -> None:
     updates = {}
-    for field in ("prompt", "system_prompt", "model", "every", "screenshot", "clipboard", "docs", "context"):
+    for field in ("prompt", "system_prompt", "model", "every", "screenshot", "clipboard", "docs", "context", "timeout"):
         val = getattr(args, field)
         if val is not None:
             key = "persona_prompt" if field == "prompt" else (
@@ -76,6 +111,14 @@ def cmd_edit(args: argparse.Namespace) -> None:
     if not updates:
         print("No updates provided.")
         return
+    if args.all:
+        try:
+            result = store.apply([Change("update", name, updates) for name in list(store.buddies)])
+        except StoreError as e:
+            print(e)
+            return
+        _print_apply(result)
+        return
     ok = store.update(args.name, updates)
     if ok:
         print(f"Updated buddy {args.name}.")
@@ -83,6 +126,38 @@ def cmd_edit(args: argparse.Namespace) -> None:
         print(f"Buddy {args.name} not found.")
 
 
+def cmd_apply(args: argparse.Namespace) -> None:
+    """Create/update/delete many buddies from a YAML or JSON file in one transaction."""
+    import json
+
+    path = Path(args.file).expanduser()
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError as e:
+        print(f"Cannot read {path}: {e}")
+        return
+    try:
+        if path.suffix.lower() in (".yaml", ".yml"):
+            try:
+                import yaml  # type: ignore
+            except ImportError:
+                print("YAML files need PyYAML (pip install pyyaml); or pass the same structure as .json.")
+                return
+            doc = yaml.safe_load(text)
+        else:
+            doc = json.loads(text)
+    except Exception as e:  # yaml.YAMLError / json.JSONDecodeError
+        print(f"Cannot parse {path}: {e}")
+        return
+    try:
+        result = store.apply(changes_from_document(doc), dry_run=args.dry_run)
+    except StoreError as e:
+        print(e)
+        print("Nothing was changed.")
+        return
+    _print_apply(result, dry_run=args.dry_run)
+
+
 def cmd_run(args: argparse.Namespace) -> None:
     buddy = store.get(args.name)
     if not buddy:
@@ -113,8 +188,7 @@ def cmd_run(args: argparse.Namespace) -> None:
 
 def cmd_stop(args: argparse.Namespace) -> None:
     if args.name == "all":
-        stopped = list(runtime.running.keys())
-        runtime.running.clear()
+        stopped = [name for name in sorted(set(runtime.registered()) | set(runtime.running)) if runtime.stop(name)]
         if stopped:
             print("Stopped: " + ", ".join(stopped))
         else:
@@ -135,6 +209,37 @@ def cmd_status(_: argparse.Namespace) -> None:
         print(f"- {name}: {state}")
 
 
+def cmd_supervise(args: argparse.Namespace) -> None:
+    names = args.names or [b.name for b in store.list()]
+    buddies = []
+    for name in names:
+        buddy = store.get(name)
+        if not buddy:
+            print(f"Buddy {name} not found.")
+            return
+        buddies.append(buddy)
+    if not buddies:
+        print("No buddies to run.")
+        return
+    sup = Supervisor(
+        workers=args.workers,
+        tick_seconds=args.tick,
+        on_message=lambda name, msg: print(f"[{name}] {msg}", flush=True),
+    )
+    _start_metrics_endpoint()
+    sup.start()
+    for buddy in buddies:
+        wid = sup.add(buddy)
+        print(f"{buddy.name} -> worker {wid}")
+    print(f"Supervising {len(buddies)} buddies on {args.workers} worker(s). Ctrl+C to stop.")
+    try:
+        sup.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping workers...")
+    finally:
+        sup.shutdown()
+
+
 def cmd_chat(args: argparse.Namespace) -> None:
     buddy = store.get(args.name)
     if not buddy:
@@ -144,6 +249,7 @@ def cmd_chat(args: argparse.Namespace) -> None:
     runtime.running.setdefault(buddy.name, buddy)
     runtime._ensure_scheduler()
     runtime._mark_running(buddy, source="chat")
+    _start_metrics_endpoint()
     print(f"Chatting with {buddy.name} {buddy.emoji}. Ctrl+C to exit.")
     import threading
     import time as _time
@@ -153,16 +259,31 @@ def cmd_chat(args: argparse.Namespace) -> None:
             msgs = runtime.drain_queue(buddy.name)
             for m in msgs:
                 print(f"[{buddy.name}] {m}")
-            _time.sleep(5)
+            if buddy.name not in runtime.running:
+                print(f"\n{buddy.name} was stopped.")
+                signal.raise_signal(signal.SIGINT)  # unblock input() in the main thread
+                return
+            _time.sleep(1)
+
+    prompting = threading.Lock()  # a confirmation question is waiting for its answer on stdin
+
+    def confirm_tool(call) -> bool:
+        with prompting:
+            answer = input(f"{buddy.name} wants to run {call.name}({call.arguments}). Allow? [y/N] ")
+        return answer.strip().lower() in ("y", "yes")
 
+    runtime.confirm_tool = confirm_tool
     t = threading.Thread(target=drain_printer, daemon=True)
     t.start()
     try:
         while True:
+            # A turn that timed out may have left a question open; let it have its answer first.
+            with prompting:
+                pass
             user_text = input("> ").strip()
             if not user_text:
                 continue
-            reply = runtime.ask(buddy.name, user_text)
+            reply = runtime.ask(buddy.name, user_text, timeout=args.timeout)
             print(reply)
     except (KeyboardInterrupt, EOFError):
         print("\nBye.")
@@ -174,10 +295,50 @@ def cmd_ask(args: argparse.Namespace) -> None:
         print(f"Buddy {args.name} not found.")
         return
     runtime.running.setdefault(buddy.name, buddy)
-    reply = runtime.ask(buddy.name, args.text)
+    reply = runtime.ask(buddy.name, args.text, timeout=args.timeout)
     print(reply)
 
 
+def cmd_voice(args: argparse.Namespace) -> None:
+    buddy = store.get(args.name)
+    if not buddy:
+        print(f"Buddy {args.name} not found.")
+        return
+    if not args.mic and not args.input:
+        print("Pass --mic or --input file.wav.")
+        return
+    runtime.running.setdefault(buddy.name, buddy)
+    try:
+        stt_kwargs = {"transcript": args.transcript or ""} if args.stt == "stub" else {}
+        stt = voice.STT_ENGINES[args.stt](**stt_kwargs)
+        tts = voice.TTS_ENGINES[args.tts]()
+        source = voice.MicSource() if args.mic else voice.WavFileSource(Path(args.input).expanduser(), realtime=args.realtime)
+        sink = voice.WavFileSink(Path(args.output).expanduser(), tts.sample_rate) if args.output else voice.SpeakerSink(tts.sample_rate)
+    except (KeyError, RuntimeError) as e:
+        print(f"Voice unavailable: {e}")
+        return
+    pipeline = voice.VoicePipeline(
+        stt,
+        tts,
+        lambda text: runtime.stream(buddy.name, text, site="voice"),
+        sink,
+        on_partial=lambda text: print(f"\r(you) {text}", end="", flush=True),
+    )
+    try:
+        turns = pipeline.run(source.frames())
+    except KeyboardInterrupt:
+        turns = pipeline.turns
+    finally:
+        sink.close()
+    for turn in turns:
+        print(f"\n(you) {turn.transcript}\n[{buddy.name}] {''.join(turn.reply)}")
+        stats = turn.summary()
+        print(
+            f"latency: end-of-speech -> first audio {stats['eos_to_first_audio_ms']} ms, "
+            f"first token {stats['eos_to_first_token_ms']} ms, llm done {stats['eos_to_llm_done_ms']} ms"
+        )
+
+
 def cmd_docs_add(args: argparse.Namespace) -> None:
     buddy = store.get(args.name)
     if not buddy:
@@ -212,9 +373,37 @@ def cmd_docs_clear(args: argparse.Namespace) -> None:
     print(f"Cleared {count} file(s) for {args.name}.")
 
 
+def cmd_docs_pin(args: argparse.Namespace) -> None:
+    buddy = store.get(args.name)
+    if not buddy:
+        print(f"Buddy {args.name} not found.")
+        return
+    pinned = list(buddy.pinned_docs)
+    if args.unpin:
+        if args.file not in pinned:
+            print(f"{args.file} is not pinned for {args.name}.")
+            return
+        pinned.remove(args.file)
+        store.update(buddy.name, {"pinned_docs": pinned})
+        print(f"Unpinned {args.file} for {args.name}.")
+        return
+    if args.file not in docs_index.list(buddy.name):
+        print(f"File {args.file} not found for {args.name}. Add it with `docs add` first.")
+        return
+    if args.file not in pinned:
+        pinned.append(args.file)
+        store.update(buddy.name, {"pinned_docs": pinned})
+    print(f"Pinned {args.file} for {args.name}; it is sent in the cached prompt prefix on every turn.")
+    if not buddy.doc_privacy.get("allow_cloud_with_docs", False):
+        print("Note: doc_privacy.allow_cloud_with_docs is false, so pinned docs are not sent to cloud providers.")
+
+
 def cmd_docs_status(args: argparse.Namespace) -> None:
     status = docs_index.status(args.name)
     print(f"Docs: {status['count']} file(s). {status['files']}")
+    buddy = store.get(args.name)
+    if buddy and buddy.pinned_docs:
+        print(f"Pinned: {', '.join(buddy.pinned_docs)}")
 
 
 def cmd_schedule_show(args: argparse.Namespace) -> None:
@@ -233,6 +422,183 @@ def cmd_schedule_show(args: argparse.Namespace) -> None:
             print(entry)
 
 
+def cmd_schedule_generate(args: argparse.Namespace) -> None:
+    if args.all:
+        targets = [b for b in store.list() if args.force or not b.schedule]
+    elif args.name:
+        buddy = store.get(args.name)
+        if not buddy:
+            print(f"Buddy {args.name} not found.")
+            return
+        targets = [buddy]
+    else:
+        print("Pass --name <Buddy> or --all.")
+        return
+    if not targets:
+        print("Every buddy already has a schedule (use --force to regenerate).")
+        return
+    results = generate_schedules(targets, batch_size=args.batch_size, workers=args.workers)
+    for buddy in targets:
+        schedule = results.get(buddy.name)
+        if not schedule:
+            print(f"- {buddy.name}: failed (AI generation failed or unavailable)")
+            continue
+        store.update(buddy.name, {"schedule": schedule})
+        print(f"- {buddy.name}: {len(schedule)} entries")
+    print(f"Generated {len(results)}/{len(targets)} schedule(s).")
+
+
+def cmd_pack_export(args: argparse.Namespace) -> None:
+    buddy = store.get(args.name)
+    if not buddy:
+        print(f"Buddy {args.name} not found.")
+        return
+    try:
+        manifest = export_pack(
+            buddy, Path(args.out).expanduser(), include_docs=args.include_docs, workers=args.workers, level=args.level
+        )
+    except PackError as e:
+        print(str(e))
+        return
+    total = sum(f["size"] for f in manifest["files"])
+    print(f"Exported {buddy.name} to {args.out} ({len(manifest['files'])} doc(s), {total} bytes before compression).")
+
+
+def cmd_pack_import(args: argparse.Namespace) -> None:
+    try:
+        report = import_pack(Path(args.path).expanduser(), store=store, overwrite=args.force)
+    except (PackError, OSError) as e:
+        print(f"Import failed: {e}")
+        return
+    print(
+        f"Imported {report['buddy']}: {report['written']} doc(s) written, "
+        f"{report['reused']} reused from identical docs on disk, {report['unchanged']} unchanged."
+    )
+
+
+def cmd_loadgen(args: argparse.Namespace) -> None:
+    import json
+
+    from .llm import DummyLLM, build_client
+    from .loadgen import run_load
+    from .recording import ReplayClient
+
+    if args.replay:
+        try:
+            replay = ReplayClient(Path(args.replay), speed=args.speed, seed=args.seed)
+        except (OSError, RuntimeError) as e:
+            print(f"Cannot replay {args.replay}: {e}")
+            return
+        factory = lambda cfg, model: replay  # noqa: E731
+        source = f"replay of {len(replay.records)} recorded call(s)"
+    elif args.live:
+        live_cfg = get_config()
+        factory = lambda cfg, model: build_client(live_cfg, model)  # noqa: E731
+        source = "live providers"
+    else:
+        factory = lambda cfg, model: DummyLLM(reason="loadgen")  # noqa: E731
+        source = "stub client (no latency; use --replay for realistic timing)"
+    print(
+        f"Load: {args.buddies} buddies, {args.duration:.0f}s, chat {args.chat_rate}/s and "
+        f"proactive {args.proactive_rate}/s per buddy, {args.workers} workers, {source}.",
+        file=sys.stderr,
+    )
+    report = run_load(
+        factory,
+        buddies=args.buddies,
+        duration=args.duration,
+        chat_rate=args.chat_rate,
+        proactive_rate=args.proactive_rate,
+        workers=args.workers,
+        seed=args.seed,
+    )
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report.format())
+
+
+def cmd_simulate(args: argparse.Namespace) -> None:
+    """Replay the scheduler on a virtual clock; exits 1 if any entry was missed or late."""
+    import json
+    import time as _time
+
+    from .simulate import simulate, synthetic_buddies
+
+    if args.synthetic:
+        buddies = synthetic_buddies(args.synthetic, seed=args.seed)
+    else:
+        buddies = []
+        for name in args.names or [b.name for b in store.list()]:
+            buddy = store.get(name)
+            if not buddy:
+                print(f"Buddy {name} not found.")
+                return
+            buddies.append(buddy)
+    if not buddies:
+        print("No buddies to simulate (create some or use --synthetic N).")
+        return
+    start = None
+    if args.start:
+        try:
+            start = _time.mktime(_time.strptime(args.start, "%Y-%m-%d"))
+        except ValueError:
+            print(f"Invalid --start {args.start!r}; expected YYYY-MM-DD.")
+            return
+    report = simulate(buddies, days=args.days, start=start, tick_seconds=args.tick, lag=args.lag)
+    if args.json:
+        print(json.dumps(dict(report.to_dict(), problems=report.problems(args.max_drift)), indent=2))
+    else:
+        print(report.format(args.max_drift))
+    if report.problems(args.max_drift):
+        sys.exit(1)
+
+
+def cmd_metrics(args: argparse.Namespace) -> None:
+    """Print metrics from a running chat/supervise process, or this process's own registry."""
+    import urllib.error
+    import urllib.request
+
+    port = _metrics_port(args.port) or DEFAULT_METRICS_PORT
+    url = f"http://127.0.0.1:{port}/metrics"
+    try:
+        with urllib.request.urlopen(url, timeout=2) as resp:
+            print(resp.read().decode("utf-8"), end="")
+        return
+    except (urllib.error.URLError, OSError):
+        pass
+    print(f"# No metrics endpoint at {url}; showing this process only.", file=sys.stderr)
+    print(metrics.REGISTRY.render(), end="")
+
+
+def cmd_usage(args: argparse.Namespace) -> None:
+    """Token use, cost and latency per buddy/call site/model from the usage ledger."""
+    import json
+    import time as _time
+
+    since = _time.time() - args.days * 86400
+    rows = runtime.usage.ledger.report(since=since, buddy=args.name)
+    for row in rows:
+        row.max_tokens = runtime.usage.max_tokens(row.buddy, row.site)
+    if args.json:
+        print(json.dumps([row.to_dict() for row in rows], indent=2))
+        return
+    if not rows:
+        print(f"No provider calls recorded in the last {args.days:g} day(s).")
+        return
+    print(
+        f"{'buddy':<16} {'site':<9} {'model':<28} {'calls':>6} {'err':>4} {'in':>9} {'out':>8} "
+        f"{'cached':>9} {'cost $':>9} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max_tok':>7}"
+    )
+    total = 0.0
+    for row in rows:
+        cost = "-" if row.cost_usd is None else f"{row.cost_usd:.4f}"
+        total += row.cost_usd or 0.0
+        print(
+            f"{row.buddy[:16]:<16} {row.site:<9} {row.model[:28]:<28} {row.calls:>6} {row.errors:>4} "
+            f"{row.input_tokens:>9} {row.output_tokens:>8} {row.cache_read_tokens:>9} {cost:>9} "
+            f"{row.latency_ms['p50']:>7.0f} {row.latency_ms['p95']:>7.0f} {row.latency_ms['p99']:>7.0f} {row.max_tokens:>7}"
+        )
+    print(f"Total cost (last {args.days:g} day(s), known models): ${total:.4f}")
+
+
 def cmd_config_set(args: argparse.Namespace) -> None:
     set_config(args.key, args.value)
     print(f"Set {args.key}.")
@@ -249,6 +615,8 @@ def cmd_config_show(_: argparse.Namespace) -> None:
 
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="aibuddies", description="AI Buddies CLI (stub).")
+    parser.add_argument("--profile", action="store_true", help="Print a timing breakdown of the command")
+    parser.add_argument("--trace-file", dest="trace_file", help="Write spans as Chrome trace-event JSON")
     sub = parser.add_subparsers(dest="command")
 
     # Management
@@ -266,14 +634,17 @@ def build_parser() -> argparse.ArgumentParser:
     p_create.add_argument("--clipboard", action="store_true", help="Enable clipboard access")
     p_create.add_argument("--context", nargs="+", help="Context sources (e.g., screenshot window clipboard docs)")
     p_create.add_argument("--docs", action="store_true", help="Enable docs for this buddy")
+    p_create.add_argument("--timeout", type=float, default=0.0, help="Seconds each reply may take (0 = no limit)")
     p_create.set_defaults(func=cmd_create)
 
     p_delete = sub.add_parser("delete", help="Delete a buddy")
     p_delete.add_argument("--name", required=True)
     p_delete.set_defaults(func=cmd_delete)
 
-    p_edit = sub.add_parser("edit", help="Edit a buddy")
-    p_edit.add_argument("--name", required=True)
+    p_edit = sub.add_parser("edit", help="Edit a buddy (or --all buddies in one write)")
+    edit_target = p_edit.add_mutually_exclusive_group(required=True)
+    edit_target.add_argument("--name")
+    edit_target.add_argument("--all", action="store_true", help="Apply the edit to every buddy")
     p_edit.add_argument("--prompt")
     p_edit.add_argument("--system-prompt", dest="system_prompt")
     p_edit.add_argument("--model")
@@ -282,8 +653,14 @@ def build_parser() -> argparse.ArgumentParser:
     p_edit.add_argument("--clipboard", type=bool)
     p_edit.add_argument("--docs", type=bool)
     p_edit.add_argument("--context", nargs="+", help="Replace context sources list")
+    p_edit.add_argument("--timeout", type=float, help="Seconds each reply may take (0 = no limit)")
     p_edit.set_defaults(func=cmd_edit)
 
+    p_apply = sub.add_parser("apply", help="Create/update/delete many buddies from a YAML/JSON file at once")
+    p_apply.add_argument("-f", "--file", required=True, help="File with `buddies:` (upserted) and `delete:` (names)")
+    p_apply.add_argument("--dry-run", dest="dry_run", action="store_true", help="Validate and show the diff only")
+    p_apply.set_defaults(func=cmd_apply)
+
     p_run = sub.add_parser("run", help="Run a buddy (starts loop)")
     p_run.add_argument("--name", required=True)
     p_run.add_argument("--every", help="Override interval")
@@ -299,21 +676,41 @@ def build_parser() -> argparse.ArgumentParser:
     p_status = sub.add_parser("status", help="Show running buddies")
     p_status.set_defaults(func=cmd_status)
 
+    p_sup = sub.add_parser("supervise", help="Run buddies sharded across worker processes")
+    p_sup.add_argument("--names", nargs="+", help="Buddies to run (default: all)")
+    p_sup.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p_sup.add_argument("--tick", type=float, default=60.0, help="Seconds between proactive ticks")
+    p_sup.set_defaults(func=cmd_supervise)
+
     # Interaction
     p_chat = sub.add_parser("chat", help="Chat with a buddy")
     p_chat.add_argument("--name", required=True)
+    p_chat.add_argument("--timeout", type=float, help="Seconds each reply may take (default: the buddy's timeout)")
     p_chat.set_defaults(func=cmd_chat)
 
     p_ask = sub.add_parser("ask", help="One-shot question to a buddy")
     p_ask.add_argument("--name", required=True)
     p_ask.add_argument("text")
+    p_ask.add_argument("--timeout", type=float, help="Seconds the reply may take (default: the buddy's timeout)")
     p_ask.set_defaults(func=cmd_ask)
 
     p_send = sub.add_parser("send", help="Send a message/context to a buddy")
     p_send.add_argument("--name", required=True)
     p_send.add_argument("text")
+    p_send.add_argument("--timeout", type=float, help="Seconds the reply may take (default: the buddy's timeout)")
     p_send.set_defaults(func=cmd_ask)
 
+    p_voice = sub.add_parser("voice", help="Talk to a buddy (STT -> buddy -> TTS)")
+    p_voice.add_argument("--name", required=True)
+    p_voice.add_argument("--mic", action="store_true", help="Capture from the microphone (needs sounddevice)")
+    p_voice.add_argument("--input", help="16-bit mono WAV file to use instead of the mic")
+    p_voice.add_argument("--output", help="Write reply audio to this WAV file instead of the speaker")
+    p_voice.add_argument("--realtime", action="store_true", help="Pace --input frames in real time")
+    p_voice.add_argument("--stt", default="stub", help="STT engine (default: stub)")
+    p_voice.add_argument("--tts", default="stub", help="TTS engine (default: stub)")
+    p_voice.add_argument("--transcript", help="Transcript the stub STT engine should emit")
+    p_voice.set_defaults(func=cmd_voice)
+
     # Docs
     p_docs = sub.add_parser("docs", help="Manage docs for a buddy")
     docs_sub = p_docs.add_subparsers(dest="docs_cmd")
@@ -336,6 +733,12 @@ def build_parser() -> argparse.ArgumentParser:
     d_clear.add_argument("--name", required=True)
     d_clear.set_defaults(func=cmd_docs_clear)
 
+    d_pin = docs_sub.add_parser("pin", help="Always include a document in the buddy's cached prompt prefix")
+    d_pin.add_argument("--name", required=True)
+    d_pin.add_argument("--file", required=True)
+    d_pin.add_argument("--unpin", action="store_true", help="Stop pinning the document")
+    d_pin.set_defaults(func=cmd_docs_pin)
+
     d_status = docs_sub.add_parser("status", help="Docs status")
     d_status.add_argument("--name", required=True)
     d_status.set_defaults(func=cmd_docs_status)
@@ -346,6 +749,66 @@ def build_parser() -> argparse.ArgumentParser:
     s_show = sched_sub.add_parser("show", help="Show schedule entries for a buddy")
     s_show.add_argument("--name", required=True)
     s_show.set_defaults(func=cmd_schedule_show)
+    s_gen = sched_sub.add_parser("generate", help="Generate schedules with AI (batched for --all)")
+    s_gen.add_argument("--name", help="Buddy name")
+    s_gen.add_argument("--all", action="store_true", help="All buddies without a schedule")
+    s_gen.add_argument("--force", action="store_true", help="With --all, regenerate existing schedules too")
+    s_gen.add_argument("--batch-size", dest="batch_size", type=int, default=10, help="Personas per LLM request")
+    s_gen.add_argument("--workers", type=int, default=4, help="Concurrent LLM requests")
+    s_gen.set_defaults(func=cmd_schedule_generate)
+
+    # Packs
+    p_pack = sub.add_parser("pack", help="Export/import Buddy Packs")
+    pack_sub = p_pack.add_subparsers(dest="pack_cmd")
+    k_exp = pack_sub.add_parser("export", help="Export a buddy to a pack file")
+    k_exp.add_argument("--name", required=True)
+    k_exp.add_argument("--out", required=True, help="Output pack path (e.g., doctor_pack.tar)")
+    k_exp.add_argument("--include-docs", dest="include_docs", action="store_true", help="Include docs (needs export_allowed)")
+    k_exp.add_argument("--workers", type=int, help="Parallel compression workers")
+    k_exp.add_argument("--level", type=int, default=6, help="gzip level 1-9")
+    k_exp.set_defaults(func=cmd_pack_export)
+    k_imp = pack_sub.add_parser("import", help="Import a pack file")
+    k_imp.add_argument("path")
+    k_imp.add_argument("--force", action="store_true", help="Overwrite an existing buddy with the same name")
+    k_imp.set_defaults(func=cmd_pack_import)
+
+    # Load testing
+    p_load = sub.add_parser("loadgen", help="Simulate N buddies of chat/proactive traffic and report latency")
+    p_load.add_argument("--buddies", type=int, default=10)
+    p_load.add_argument("--duration", type=float, default=10.0, help="Seconds of traffic to generate")
+    p_load.add_argument("--chat-rate", dest="chat_rate", type=float, default=0.2, help="Chat turns/sec per buddy")
+    p_load.add_argument("--proactive-rate", dest="proactive_rate", type=float, default=0.05, help="Proactive turns/sec per buddy")
+    p_load.add_argument("--workers", type=int, default=16, help="Concurrent in-flight turns")
+    p_load.add_argument("--replay", help="Serve replies from this recording (see llm_record)")
+    p_load.add_argument("--speed", type=float, default=1.0, help="Scale recorded latencies (0 = none)")
+    p_load.add_argument("--live", action="store_true", help="Use the configured providers (real, billed calls)")
+    p_load.add_argument("--seed", type=int)
+    p_load.add_argument("--json", action="store_true", help="Print the report as JSON")
+    p_load.set_defaults(func=cmd_loadgen)
+
+    p_sim = sub.add_parser("simulate", help="Replay days of proactive schedules on a virtual clock and check firings")
+    p_sim.add_argument("names", nargs="*", help="Buddies to simulate (default: all stored buddies)")
+    p_sim.add_argument("--synthetic", type=int, help="Simulate N generated buddies instead of stored ones")
+    p_sim.add_argument("--seed", type=int, default=0, help="Seed for --synthetic")
+    p_sim.add_argument("--days", type=float, default=7.0, help="Virtual days to replay (default 7)")
+    p_sim.add_argument("--start", help="First day, YYYY-MM-DD (default: tomorrow)")
+    p_sim.add_argument("--tick", type=float, default=60.0, help="Scheduler pass period in seconds")
+    p_sim.add_argument("--lag", type=float, default=0.0, help="Virtual seconds each pass takes (models a slow tick)")
+    p_sim.add_argument("--max-drift", dest="max_drift", type=float, default=60.0, help="Allowed lateness in seconds")
+    p_sim.add_argument("--json", action="store_true", help="Print the report as JSON")
+    p_sim.set_defaults(func=cmd_simulate)
+
+    # Metrics
+    p_metrics = sub.add_parser("metrics", help="Print Prometheus metrics from a running buddy process")
+    p_metrics.add_argument("--port", type=int, help=f"Endpoint port (default: config metrics_port or {DEFAULT_METRICS_PORT})")
+    p_metrics.set_defaults(func=cmd_metrics)
+
+    # Usage
+    p_usage = sub.add_parser("usage", help="Token use, cost and latency percentiles per buddy and call site")
+    p_usage.add_argument("--name", help="Only this buddy")
+    p_usage.add_argument("--days", type=float, default=7.0, help="Look back this many days (default 7)")
+    p_usage.add_argument("--json", action="store_true", help="Print the report as JSON")
+    p_usage.set_defaults(func=cmd_usage)
 
     # Config
     p_cfg = sub.add_parser("config", help="Set or show config")
@@ -366,7 +829,20 @@ def main(argv: Optional[list] = None) -> None:
     if not hasattr(args, "func"):
         parser.print_help()
         sys.exit(1)
-    args.func(args)
+    if not (args.profile or args.trace_file):
+        args.func(args)
+        return
+    tracing.enable()
+    try:
+        with tracing.span(f"cli.{args.command}"):
+            args.func(args)
+    finally:
+        if args.profile:
+            print("\n--- profile ---", file=sys.stderr)
+            print(tracing.render_flame(), file=sys.stderr)
+        if args.trace_file:
+            count = tracing.write_chrome_trace(Path(args.trace_file))
+            print(f"Wrote {count} span(s) to {args.trace_file}", file=sys.stderr)
 
 
 if __name__ == "__main__":
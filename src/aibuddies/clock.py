@@ -0,0 +1,61 @@
+"""
+Injectable time source for the runtime.
+
+`RuntimeManager` reads wall time, monotonic time and sleeps through its
+`clock` (default SYSTEM_CLOCK). A `VirtualClock` starts at a chosen wall time
+and moves only when something sleeps on it or calls `advance`, so the scheduler
+loop can replay days of schedules in seconds (see simulate.py).
+"""
+import threading
+import time
+
+
+class Clock:
+    def time(self) -> float:
+        """Wall-clock seconds since the epoch."""
+        raise NotImplementedError
+
+    def monotonic(self) -> float:
+        raise NotImplementedError
+
+    def sleep(self, seconds: float) -> None:
+        raise NotImplementedError
+
+
+class SystemClock(Clock):
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """Simulated time: `sleep` returns immediately after moving the clock forward."""
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.start = start
+        self._now = start
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._now - self.start
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> float:
+        if seconds < 0:
+            raise ValueError("a clock cannot go backwards")
+        with self._lock:
+            self._now += seconds
+            return self._now
+
+
+SYSTEM_CLOCK = SystemClock()
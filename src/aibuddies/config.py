@@ -1,5 +1,7 @@
 import json
+import math
 import os
+from json.encoder import encode_basestring_ascii
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Dict, Optional
@@ -17,20 +19,21 @@ class Paths:
     buddies_file: Path = field(init=False)
     logs_dir: Path = field(init=False)
     docs_dir: Path = field(init=False)
-    running_file: Path = field(init=False)
+    registry_file: Path = field(init=False)
+    usage_file: Path = field(init=False)
 
     def __post_init__(self) -> None:
         self.config_file = self.home / "config.json"
         self.buddies_file = self.home / "buddies.json"
         self.logs_dir = self.home / "logs"
         self.docs_dir = self.home / "docs"
-        self.running_file = self.home / "running.json"
+        self.registry_file = self.home / "registry.db"
+        self.usage_file = self.home / "usage.db"
 
     def ensure(self) -> None:
         self.home.mkdir(parents=True, exist_ok=True)
         self.logs_dir.mkdir(parents=True, exist_ok=True)
         self.docs_dir.mkdir(parents=True, exist_ok=True)
-        self.running_file.parent.mkdir(parents=True, exist_ok=True)
 
 
 def load_json(path: Path) -> Dict[str, Any]:
@@ -43,16 +46,80 @@ def load_json(path: Path) -> Dict[str, Any]:
         return {}
 
 
+def _indented(obj: Any, pad: str) -> str:
+    cls = obj.__class__
+    if cls is str:
+        return encode_basestring_ascii(obj)
+    if cls is dict:
+        if not obj:
+            return "{}"
+        inner = pad + "  "
+        entries = [encode_basestring_ascii(k) + ": " + _indented(v, inner) for k, v in obj.items()]
+        return "{\n" + inner + (",\n" + inner).join(entries) + "\n" + pad + "}"
+    if cls is list:
+        if not obj:
+            return "[]"
+        inner = pad + "  "
+        try:
+            body = (",\n" + inner).join(map(encode_basestring_ascii, obj))  # lists of strings, in C
+        except TypeError:
+            body = (",\n" + inner).join([_indented(v, inner) for v in obj])
+        return "[\n" + inner + body + "\n" + pad + "]"
+    if obj is True:
+        return "true"
+    if obj is False:
+        return "false"
+    if obj is None:
+        return "null"
+    if cls is int:
+        return int.__repr__(obj)
+    if cls is float and math.isfinite(obj):
+        return float.__repr__(obj)
+    raise TypeError(cls.__name__)  # anything else: let the json module handle the whole document
+
+
+def dump_json(data: Any) -> str:
+    """
+    Exactly `json.dumps(data, indent=2)`, the layout users hand-edit, in about half the time:
+    `indent=` makes the json module fall back from its C encoder to pure Python, while this
+    only walks the containers and leaves string escaping to C.
+    """
+    try:
+        return _indented(data, "")
+    except TypeError:
+        return json.dumps(data, indent=2)
+
+
 def save_json(path: Path, data: Dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     with path.open("w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+        f.write(dump_json(data))
+
+
+def save_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    """Write via a temp file, fsync and rename, so readers see either the old or the new file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            f.write(dump_json(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(str(path.parent), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
 
 def get_config(paths: Optional[Paths] = None) -> Dict[str, Any]:
-    paths = paths or Paths()
-    paths.ensure()
-    return load_json(paths.config_file)
+    # Read on every turn and tick: no directory creation here (a missing file is an empty config).
+    return load_json((paths or Paths()).config_file)
 
 
 def set_config(k: str, v: Any, paths: Optional[Paths] = None) -> None:
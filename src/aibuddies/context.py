@@ -1,26 +1,54 @@
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
 
 from .buddies import Buddy
+from .deadline import TIMEOUT_MARKER, Deadline
+from .metrics import DEADLINE_EXCEEDED
+from .tracing import span
 
+# Stub collectors. In future, map each source to a real collector:
+# - screenshot: capture + OCR
+# - window: active window title/app
+# - clipboard: current clipboard text
+# - docs: recent doc snippets
+COLLECTORS: Dict[str, Callable[[Buddy], str]] = {
+    "screenshot": lambda buddy: "[screenshot OCR not implemented]",
+    "window": lambda buddy: "[active window not implemented]",
+    "clipboard": lambda buddy: "[clipboard not implemented]",
+    "docs": lambda buddy: "[docs retrieval not implemented]",
+}
 
-def gather_context(buddy: Buddy) -> Dict[str, str]:
+_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="aibuddies-context")
+    return _POOL
+
+
+def _collect(buddy: Buddy, src: str) -> str:
+    with span("context.collect", source=src):
+        collector = COLLECTORS.get(src)
+        return collector(buddy) if collector else "[unknown source]"
+
+
+def gather_context(buddy: Buddy, deadline: Optional[Deadline] = None) -> Dict[str, str]:
     """
-    Stub context collector. In future, map each source to a real collector:
-    - screenshot: capture + OCR
-    - window: active window title/app
-    - clipboard: current clipboard text
-    - docs: recent doc snippets
+    Collect every context source of the buddy. With a deadline, collectors run concurrently and
+    any still running when it passes are abandoned; their sources read TIMEOUT_MARKER.
     """
+    if not deadline:
+        return {src: _collect(buddy, src) for src in buddy.context_sources}
+    futures = {src: _pool().submit(_collect, buddy, src) for src in buddy.context_sources}
+    wait(list(futures.values()), timeout=deadline.remaining())
     ctx: Dict[str, str] = {}
-    for src in buddy.context_sources:
-        if src == "screenshot":
-            ctx[src] = "[screenshot OCR not implemented]"
-        elif src == "window":
-            ctx[src] = "[active window not implemented]"
-        elif src == "clipboard":
-            ctx[src] = "[clipboard not implemented]"
-        elif src == "docs":
-            ctx[src] = "[docs retrieval not implemented]"
+    for src, future in futures.items():
+        if future.done() and future.exception() is None:
+            ctx[src] = future.result()
         else:
-            ctx[src] = "[unknown source]"
+            future.cancel()
+            ctx[src] = TIMEOUT_MARKER
+            DEADLINE_EXCEEDED.inc(buddy=buddy.name, stage="context")
     return ctx
@@ -0,0 +1,138 @@
+"""
+Per-request deadlines.
+
+An `ask` or `stream` turn gets one `Deadline`, from `--timeout` or the buddy's
+`timeout` field (seconds; 0 means none). It is threaded through every stage:
+
+- context gathering may use CONTEXT_SHARE of what is left; collectors still
+  running after that are abandoned and their sources marked as timed out;
+- waiting for a rate-limit slot gives up when the deadline passes;
+- a round of tool calls (e.g. `retrieve_docs`) may use TOOLS_SHARE of what is left;
+- provider requests are sent with the remaining time as their timeout, and no
+  further fallback models or tool rounds are tried once it has run out.
+
+The runtime stops waiting for the provider when the deadline passes. The worker
+thread is abandoned, since it cannot be killed, but it winds down at its next
+step: no tool is started and no tool round is sent once the deadline has
+passed. The reply is whatever was produced so far (streamed chunks, or the
+model's text before an unfinished tool round), marked with TIMEOUT_MARKER.
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from .metrics import DEADLINE_EXCEEDED
+
+TIMEOUT_MARKER = "[timed out]"
+CONTEXT_SHARE = 0.15
+TOOLS_SHARE = 0.5
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """A point in time after which a request should stop; `Deadline(None)` never expires."""
+
+    def __init__(self, seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.seconds = seconds if seconds and seconds > 0 else None
+        self.clock = clock
+        self.expires = None if self.seconds is None else clock() + self.seconds
+
+    def __bool__(self) -> bool:
+        return self.expires is not None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None without a limit."""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - self.clock())
+
+    def expired(self) -> bool:
+        return self.expires is not None and self.clock() >= self.expires
+
+    def check(self, stage: str) -> None:
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Time to wait for one step: the remaining budget, at most `cap`."""
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(cap, remaining)
+
+    def share(self, fraction: float) -> "Deadline":
+        """A deadline for one stage: `fraction` of the time left, on the same clock."""
+        child = Deadline(None, self.clock)
+        remaining = self.remaining()
+        if remaining is not None:
+            child.seconds = remaining * fraction
+            child.expires = self.clock() + child.seconds
+        return child
+
+
+def timed_out(partial: str, deadline: Deadline) -> str:
+    """The reply for a request that ran out of time: what was produced so far plus the marker."""
+    note = f"{TIMEOUT_MARKER} no complete reply within {deadline.seconds:g}s"
+    return f"{partial.rstrip()}\n{note}" if partial.strip() else note
+
+
+def call_with_deadline(fn: Callable[[], T], deadline: Deadline, stage: str, buddy: str = "") -> T:
+    """Run `fn`, giving up (DeadlineExceeded) when the deadline passes; without one, just call it."""
+    if not deadline:
+        return fn()
+    result: list = []
+    error: list = []
+
+    def run() -> None:
+        try:
+            result.append(fn())
+        except BaseException as e:  # handed to the caller
+            error.append(e)
+
+    worker = threading.Thread(target=run, name=f"deadline-{stage}", daemon=True)
+    worker.start()
+    worker.join(deadline.remaining())
+    if worker.is_alive():
+        DEADLINE_EXCEEDED.inc(buddy=buddy, stage=stage)
+        raise DeadlineExceeded(stage)
+    if error:
+        raise error[0]
+    return result[0]
+
+
+def iter_with_deadline(chunks: Iterator[T], deadline: Deadline, stage: str, buddy: str = "") -> Iterator[T]:
+    """Relay `chunks` until the deadline passes, then raise DeadlineExceeded (chunks so far were yielded)."""
+    if not deadline:
+        yield from chunks
+        return
+    done = object()
+    relay: "queue.Queue[Any]" = queue.Queue()
+
+    def pump() -> None:
+        try:
+            for chunk in chunks:
+                relay.put(chunk)
+        except BaseException as e:
+            relay.put(e)
+        relay.put(done)
+
+    threading.Thread(target=pump, name=f"deadline-{stage}", daemon=True).start()
+    while True:
+        try:
+            item = relay.get(timeout=deadline.remaining())
+        except queue.Empty:
+            DEADLINE_EXCEEDED.inc(buddy=buddy, stage=stage)
+            raise DeadlineExceeded(stage)
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
@@ -1,8 +1,17 @@
+import os
+import shutil
+import tempfile
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from .config import Paths
 
+PINNED_DOC_MAX_CHARS = 100_000
+
+_TEXT_CACHE: Dict[Path, Tuple[int, int, str]] = {}
+_TEXT_LOCK = threading.Lock()
+
 
 class DocIndex:
     """Stubbed doc index to attach per-buddy files."""
@@ -18,7 +27,15 @@ class DocIndex:
         dest_dir = self.buddy_dir(buddy)
         dest_dir.mkdir(parents=True, exist_ok=True)
         dest_path = dest_dir / source_path.name
-        dest_path.write_bytes(source_path.read_bytes())
+        # Write a new file and swap it in: never write through an inode another file may share.
+        fd, tmp = tempfile.mkstemp(dir=dest_dir, prefix=f".{source_path.name}.")
+        os.close(fd)
+        try:
+            shutil.copyfile(source_path, tmp)
+            os.replace(tmp, dest_path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
         return f"Stored {source_path} for {buddy} at {dest_path}"
 
     def list(self, buddy: str) -> List[str]:
@@ -27,6 +44,26 @@ class DocIndex:
             return []
         return [p.name for p in dir_path.iterdir() if p.is_file()]
 
+    def read_text(self, buddy: str, filename: str, max_chars: int = PINNED_DOC_MAX_CHARS) -> Optional[str]:
+        """
+        Doc contents as text (undecodable bytes replaced), truncated to `max_chars`.
+        Cached by mtime/size so repeated turns reuse the exact same string.
+        """
+        path = self.buddy_dir(buddy) / filename
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        with _TEXT_LOCK:
+            cached = _TEXT_CACHE.get(path)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        with path.open("r", encoding="utf-8", errors="replace") as f:
+            text = f.read(max_chars)
+        with _TEXT_LOCK:
+            _TEXT_CACHE[path] = (st.st_mtime_ns, st.st_size, text)
+        return text
+
     def remove(self, buddy: str, filename: str) -> bool:
         target = self.buddy_dir(buddy) / filename
         if target.exists():
@@ -1,15 +1,26 @@
 """
 LLM client adapter.
 
-Prefers Claude (Anthropic) if a claude_api_key is set; otherwise OpenAI.
+Prefers Claude (Anthropic) if a claude_api_key is set; otherwise OpenAI; otherwise a
+local OpenAI-compatible server if local_base_url is set (see local.py). Models named
+`local:<name>` always go to the local server.
 Falls back to DummyLLM when no provider or SDK is available.
 
 Claude Agent SDK support:
 - Uses anthropic Agents API if available (per https://platform.claude.com/docs/en/agent-sdk/overview).
 - Falls back to plain messages if Agents are unavailable.
 """
+import json
+import time
+from contextlib import ExitStack
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .deadline import TOOLS_SHARE, Deadline, DeadlineExceeded
+from .metrics import LLM_FALLBACKS, record_llm_call
+from .ratelimit import PRIORITY_INTERACTIVE, estimate_tokens, get_scheduler
+from .tools import ToolCall, ToolEngine
+from .tracing import span
 
 # Cache agent IDs per buddy/model for stateful conversations
 AGENT_CACHE: Dict[str, str] = {}
@@ -22,10 +33,113 @@ class LLMConfig:
     model: str = "claude-3.5-sonnet"
 
 
+@dataclass
+class AskOptions:
+    """Per-call options threaded from the runtime down to the provider client."""
+
+    priority: int = PRIORITY_INTERACTIVE
+    max_tokens: int = 256
+    tools: Optional[ToolEngine] = None  # when set (and non-empty), clients run a tool loop
+    deadline: Optional[Deadline] = None  # see deadline.py; clients stop retrying and trying fallbacks once it passes
+    label: Optional[str] = None  # buddy label for provider metrics when the caller is not one buddy (digests use "")
+    partial: str = ""  # set by tool loops: the model's text so far, the reply if the turn is cut off
+
+    def metrics_buddy(self, buddy_name: str) -> str:
+        return buddy_name if self.label is None else self.label
+
+    def expired(self) -> bool:
+        return self.deadline is not None and self.deadline.expired()
+
+    def request_kwargs(self) -> Dict[str, Any]:
+        """Per-request SDK options: the time left as `timeout`, when there is a deadline."""
+        remaining = self.deadline.remaining() if self.deadline is not None else None
+        return {} if remaining is None else {"timeout": max(remaining, 0.001)}
+
+
+Usage = Dict[str, int]  # input_tokens, output_tokens, cache_read_tokens, cache_write_tokens
+
+
+def _count(obj: Any, attr: str) -> int:
+    return int(getattr(obj, attr, 0) or 0) if obj is not None else 0
+
+
+def _claude_usage(resp: Any) -> Usage:
+    usage = getattr(resp, "usage", None)
+    return {
+        "input_tokens": _count(usage, "input_tokens"),
+        "output_tokens": _count(usage, "output_tokens"),
+        "cache_read_tokens": _count(usage, "cache_read_input_tokens"),
+        "cache_write_tokens": _count(usage, "cache_creation_input_tokens"),
+    }
+
+
+def _openai_usage(resp: Any) -> Usage:
+    # OpenAI caches matching prompt prefixes automatically; there is no separate write charge.
+    usage = getattr(resp, "usage", None)
+    return {
+        "input_tokens": _count(usage, "prompt_tokens"),
+        "output_tokens": _count(usage, "completion_tokens"),
+        "cache_read_tokens": _count(getattr(usage, "prompt_tokens_details", None), "cached_tokens"),
+        "cache_write_tokens": 0,
+    }
+
+
+def _add_usage(total: Optional[Usage], more: Usage) -> Usage:
+    if total is None:
+        return dict(more)
+    return {k: total.get(k, 0) + more.get(k, 0) for k in more}
+
+
+def _claude_block(block: Any) -> Dict[str, Any]:
+    """Assistant content block as a request dict (to send it back alongside tool results)."""
+    if getattr(block, "type", "text") == "tool_use":
+        return {"type": "tool_use", "id": block.id, "name": block.name, "input": block.input}
+    return {"type": "text", "text": getattr(block, "text", "")}
+
+
+def _claude_text(resp: Any, empty: str = "[empty response]") -> str:
+    parts = [getattr(b, "text", "") for b in getattr(resp, "content", None) or [] if getattr(b, "type", "text") == "text"]
+    return "".join(parts) or empty
+
+
+def _parse_arguments(raw: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(raw, dict):
+        return raw
+    try:
+        value = json.loads(raw or "{}")
+    except (TypeError, ValueError):
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def claude_system(prefix: str) -> List[Dict[str, Any]]:
+    """
+    The stable prefix (system prompt, persona, pinned docs) as one system block marked for
+    prompt caching. Volatile context and the user's text go in the messages after it.
+    """
+    return [{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}]
+
+
 class LLMClient:
-    def ask(self, buddy_name: str, persona_prompt: str, user_text: str) -> str:
+    """
+    `persona_prompt` is the stable per-buddy prefix and must be byte-identical across turns so
+    providers can serve it from their prompt cache; anything that changes per turn belongs in
+    `user_text`. Clients that talk to a provider expose the last call's token usage as `last_usage`.
+    `on_box` clients never send the request off this machine, so docs may be included.
+    """
+
+    last_usage: Optional[Usage] = None
+    on_box: bool = False
+
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
         raise NotImplementedError
 
+    def stream(
+        self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None
+    ) -> Iterator[str]:
+        """Yield the reply in text chunks as they arrive. Default: one chunk with the full `ask` reply."""
+        yield self.ask(buddy_name, persona_prompt, user_text, opts)
+
 
 class DummyLLM(LLMClient):
     """Fallback LLM that echoes with persona context."""
@@ -33,7 +147,8 @@ class DummyLLM(LLMClient):
     def __init__(self, reason: str = "no provider configured") -> None:
         self.reason = reason
 
-    def ask(self, buddy_name: str, persona_prompt: str, user_text: str) -> str:
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
+        record_llm_call((opts or AskOptions()).metrics_buddy(buddy_name), "dummy", "dummy", 0.0)
         return (
             f"[stubbed reply from {buddy_name} ({self.reason})] "
             f"{persona_prompt[:60]}... User asked: {user_text}"
@@ -47,44 +162,80 @@ class ClaudeClient(LLMClient):
         except ImportError:
             raise RuntimeError("anthropic SDK not installed. Install anthropic to use Claude.")
         self.model = model
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.api_key = api_key
+        # Retries are owned by the shared scheduler so 429s back off across all buddies.
+        self.client = anthropic.Anthropic(api_key=api_key, max_retries=0)
+        self.scheduler = get_scheduler()
         # Agent SDK availability check
         self.agent_api = getattr(self.client, "agents", None)
         self.agent_id = None
 
-    def ask(self, buddy_name: str, persona_prompt: str, user_text: str) -> str:
+    def _call(self, fn: Callable[[], Any], tokens: int, opts: AskOptions) -> Any:
+        return self.scheduler.call(
+            "claude", self.api_key, fn, tokens=tokens, priority=opts.priority, deadline=opts.deadline
+        )
+
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
+        opts = opts or AskOptions()
+        started = time.perf_counter()
+        reply, used_model, usage, error = self._ask(buddy_name, persona_prompt, user_text, opts)
+        self.last_usage = usage
+        record_llm_call(opts.metrics_buddy(buddy_name), "claude", used_model, time.perf_counter() - started, error, usage)
+        if error is None and used_model != self.model:
+            LLM_FALLBACKS.inc(provider="claude", requested=self.model, used=used_model)
+        return reply
+
+    def _ask(
+        self, buddy_name: str, persona_prompt: str, user_text: str, opts: AskOptions
+    ) -> Tuple[str, str, Optional[Usage], Optional[str]]:
+        """Returns (reply, model used, token usage, error message or None)."""
+        tokens = estimate_tokens(persona_prompt, user_text) + opts.max_tokens
         try:
-            # Try Agent SDK first
-            if self.agent_api:
+            # Try Agent SDK first (the tool loop below only exists for the messages API)
+            if self.agent_api and not opts.tools:
                 cache_key = f"{buddy_name}:{self.model}"
                 if not self.agent_id and cache_key in AGENT_CACHE:
                     self.agent_id = AGENT_CACHE[cache_key]
                 if not self.agent_id:
                     try:
-                        agent = self.agent_api.create(
-                            name=buddy_name,
-                            model=self.model,
-                            instructions=persona_prompt,
-                            tools=[],  # no tools wired yet
-                        )
+                        with span("claude.agent_create", model=self.model):
+                            agent = self._call(
+                                lambda: self.agent_api.create(
+                                    name=buddy_name,
+                                    model=self.model,
+                                    instructions=persona_prompt,
+                                    tools=[],  # no tools wired yet
+                                    **opts.request_kwargs(),
+                                ),
+                                1,
+                                opts,
+                            )
                         self.agent_id = getattr(agent, "id", None)
                         if self.agent_id:
                             AGENT_CACHE[cache_key] = self.agent_id
                     except Exception as agent_err:
                         agent_err_msg = str(agent_err)
                         if "not_found" not in agent_err_msg:
-                            return f"[Claude agent error] {agent_err_msg}"
+                            return f"[Claude agent error] {agent_err_msg}", self.model, None, agent_err_msg
                 if self.agent_id:
                     try:
-                        msg = self.agent_api.messages.create(
-                            agent_id=self.agent_id,
-                            messages=[{"role": "user", "content": user_text}],
-                            max_output_tokens=256,
-                        )
+                        agent_id = self.agent_id
+                        with span("claude.agent_message", model=self.model):
+                            msg = self._call(
+                                lambda: self.agent_api.messages.create(
+                                    agent_id=agent_id,
+                                    messages=[{"role": "user", "content": user_text}],
+                                    max_output_tokens=opts.max_tokens,
+                                    **opts.request_kwargs(),
+                                ),
+                                tokens,
+                                opts,
+                            )
+                        usage = _claude_usage(msg)
                         content = getattr(msg, "content", None)
                         if content and isinstance(content, list) and hasattr(content[0], "text"):
-                            return content[0].text
-                        return str(msg)
+                            return content[0].text, self.model, usage, None
+                        return str(msg), self.model, usage, None
                     except Exception:
                         # Clear cache on agent errors and fall back
                         AGENT_CACHE.pop(cache_key, None)
@@ -103,20 +254,21 @@ class ClaudeClient(LLMClient):
             for m in candidates:
                 if m in seen:
                     continue
+                if opts.expired():
+                    break  # no time left for (another) fallback model
                 seen.add(m)
+                messages: List[Dict[str, Any]] = [{"role": "user", "content": user_text}]
                 try:
-                    resp = self.client.messages.create(
-                        model=m,
-                        max_tokens=256,
-                        system=persona_prompt,
-                        messages=[
-                            {"role": "user", "content": user_text},
-                        ],
-                    )
-                    return resp.content[0].text if getattr(resp, "content", None) else "[empty response]"
+                    resp, usage = self._messages(m, persona_prompt, messages, tokens, opts)
                 except Exception as e:
                     last_err = str(e)
                     continue
+                # The model answered: stay on it for any tool rounds (errors there are not model fallbacks).
+                if opts.tools:
+                    resp, usage = self._tool_loop(m, persona_prompt, messages, resp, usage, opts)
+                return _claude_text(resp), m, usage, None
+            if opts.expired() and not last_err:
+                raise DeadlineExceeded("llm")
             raise RuntimeError(last_err or "unknown Claude error")
         except Exception as e:
             msg = str(e)
@@ -126,7 +278,97 @@ class ClaudeClient(LLMClient):
             model_hint = ""
             if "not_found" in msg or "model" in msg:
                 model_hint = " (tried fallbacks: sonnet-20240620, haiku-20241022/20240620, opus-20240229)"
-            return f"[Claude error]{billing_hint}{model_hint} {msg}"
+            return f"[Claude error]{billing_hint}{model_hint} {msg}", self.model, None, msg
+
+    def _messages(
+        self, model: str, persona_prompt: str, messages: List[Dict[str, Any]], tokens: int, opts: AskOptions
+    ) -> Tuple[Any, Usage]:
+        kwargs: Dict[str, Any] = {}
+        if opts.tools:
+            kwargs["tools"] = opts.tools.anthropic_tools()
+        with span("claude.messages", model=model, fallback=model != self.model) as s:
+            resp = self._call(
+                lambda: self.client.messages.create(
+                    model=model,
+                    max_tokens=opts.max_tokens,
+                    system=claude_system(persona_prompt),
+                    messages=messages,
+                    **kwargs,
+                    **opts.request_kwargs(),
+                ),
+                tokens,
+                opts,
+            )
+            usage = _claude_usage(resp)
+            s.set(cache_read=usage["cache_read_tokens"], cache_write=usage["cache_write_tokens"])
+        return resp, usage
+
+    def _tool_loop(
+        self, model: str, persona_prompt: str, messages: List[Dict[str, Any]], resp: Any, usage: Usage,
+        opts: AskOptions,
+    ) -> Tuple[Any, Usage]:
+        """Run requested tools (concurrently, via the engine) and send results back until the model answers."""
+        engine = opts.tools
+        for _ in range(engine.max_rounds):
+            content = getattr(resp, "content", None) or []
+            calls = [
+                ToolCall(b.id, b.name, _parse_arguments(b.input))
+                for b in content
+                if getattr(b, "type", "") == "tool_use"
+            ]
+            if getattr(resp, "stop_reason", None) != "tool_use" or not calls or opts.expired():
+                break
+            opts.partial = _claude_text(resp, "")
+            results = engine.run(calls, opts.deadline.share(TOOLS_SHARE) if opts.deadline else None)
+            if opts.expired():
+                break  # out of time: no round for the results, the reply is the text so far
+            messages.append({"role": "assistant", "content": [_claude_block(b) for b in content]})
+            messages.append({"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": r.call_id, "content": r.content, "is_error": r.is_error}
+                for r in results
+            ]})
+            tokens = estimate_tokens(persona_prompt, json.dumps(messages, default=str)) + opts.max_tokens
+            resp, more = self._messages(model, persona_prompt, messages, tokens, opts)
+            usage = _add_usage(usage, more)
+        return resp, usage
+
+    def stream(
+        self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None
+    ) -> Iterator[str]:
+        opts = opts or AskOptions()
+        if not hasattr(self.client.messages, "stream"):
+            yield self.ask(buddy_name, persona_prompt, user_text, opts)
+            return
+        tokens = estimate_tokens(persona_prompt, user_text) + opts.max_tokens
+
+        def open_stream() -> Tuple[ExitStack, Any]:
+            # The request is sent on enter, so it must happen inside the scheduler to be retried on 429.
+            stack = ExitStack()
+            events = stack.enter_context(self.client.messages.stream(
+                model=self.model,
+                max_tokens=opts.max_tokens,
+                system=claude_system(persona_prompt),
+                messages=[{"role": "user", "content": user_text}],
+                **opts.request_kwargs(),
+            ))
+            return stack, events
+
+        started = time.perf_counter()
+        label = opts.metrics_buddy(buddy_name)
+        usage: Optional[Usage] = None
+        try:
+            stack, events = self._call(open_stream, tokens, opts)
+            with stack:
+                for text in events.text_stream:
+                    yield text
+                final = getattr(events, "get_final_message", None)
+                if final is not None:
+                    usage = self.last_usage = _claude_usage(final())
+        except Exception as e:
+            record_llm_call(label, "claude", self.model, time.perf_counter() - started, str(e))
+            yield f"[Claude error] {e}"
+            return
+        record_llm_call(label, "claude", self.model, time.perf_counter() - started, None, usage)
 
 
 class OpenAIClient(LLMClient):
@@ -136,41 +378,183 @@ class OpenAIClient(LLMClient):
         except ImportError:
             raise RuntimeError("openai SDK not installed. Install openai to use OpenAI models.")
         self.model = model
-        self.client = OpenAI(api_key=api_key)
+        self.api_key = api_key
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        self.scheduler = get_scheduler()
 
-    def ask(self, buddy_name: str, persona_prompt: str, user_text: str) -> str:
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
+        opts = opts or AskOptions()
+        started = time.perf_counter()
+        # Stable system message first so OpenAI's automatic prefix caching can reuse it across turns.
+        messages: List[Dict[str, Any]] = [
+            {"role": "system", "content": persona_prompt},
+            {"role": "user", "content": user_text},
+        ]
         try:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": persona_prompt},
-                    {"role": "user", "content": user_text},
-                ],
-                max_tokens=256,
-            )
+            resp, usage = self._chat(messages, estimate_tokens(persona_prompt, user_text) + opts.max_tokens, opts)
+            if opts.tools:
+                resp, usage = self._tool_loop(messages, resp, usage, opts)
+            self.last_usage = usage
+            record_llm_call(opts.metrics_buddy(buddy_name), "openai", self.model, time.perf_counter() - started, None, usage)
             choice = resp.choices[0]
-            return choice.message.content if choice and choice.message else "[empty response]"
+            return choice.message.content if choice and choice.message and choice.message.content else "[empty response]"
         except Exception as e:
+            record_llm_call(opts.metrics_buddy(buddy_name), "openai", self.model, time.perf_counter() - started, str(e))
             return f"[OpenAI error] {e}"
 
+    def _chat(self, messages: List[Dict[str, Any]], tokens: int, opts: AskOptions) -> Tuple[Any, Usage]:
+        kwargs: Dict[str, Any] = {}
+        if opts.tools:
+            kwargs["tools"] = opts.tools.openai_tools()
+        with span("openai.chat", model=self.model) as s:
+            resp = self.scheduler.call(
+                "openai",
+                self.api_key,
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=opts.max_tokens,
+                    **kwargs,
+                    **opts.request_kwargs(),
+                ),
+                tokens=tokens,
+                priority=opts.priority,
+                deadline=opts.deadline,
+            )
+            usage = _openai_usage(resp)
+            s.set(cache_read=usage["cache_read_tokens"])
+        return resp, usage
+
+    def _tool_loop(
+        self, messages: List[Dict[str, Any]], resp: Any, usage: Usage, opts: AskOptions
+    ) -> Tuple[Any, Usage]:
+        engine = opts.tools
+        for _ in range(engine.max_rounds):
+            message = resp.choices[0].message if resp.choices else None
+            tool_calls = list(getattr(message, "tool_calls", None) or [])
+            if not tool_calls or opts.expired():
+                break
+            opts.partial = message.content or ""
+            messages.append({
+                "role": "assistant",
+                "content": message.content,
+                "tool_calls": [
+                    {"id": c.id, "type": "function",
+                     "function": {"name": c.function.name, "arguments": c.function.arguments}}
+                    for c in tool_calls
+                ],
+            })
+            results = engine.run(
+                [ToolCall(c.id, c.function.name, _parse_arguments(c.function.arguments)) for c in tool_calls],
+                opts.deadline.share(TOOLS_SHARE) if opts.deadline else None,
+            )
+            if opts.expired():
+                break  # out of time: no round for the results, the reply is the text so far
+            messages.extend({"role": "tool", "tool_call_id": r.call_id, "content": r.content} for r in results)
+            tokens = estimate_tokens(json.dumps(messages, default=str)) + opts.max_tokens
+            resp, more = self._chat(messages, tokens, opts)
+            usage = _add_usage(usage, more)
+        return resp, usage
+
+    def stream(
+        self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None
+    ) -> Iterator[str]:
+        opts = opts or AskOptions()
+        tokens = estimate_tokens(persona_prompt, user_text) + opts.max_tokens
+        started = time.perf_counter()
+        label = opts.metrics_buddy(buddy_name)
+        usage: Optional[Usage] = None
+        try:
+            chunks = self.scheduler.call(
+                "openai",
+                self.api_key,
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": persona_prompt},
+                        {"role": "user", "content": user_text},
+                    ],
+                    max_tokens=opts.max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},  # a last chunk with no choices carries usage
+                    **opts.request_kwargs(),
+                ),
+                tokens=tokens,
+                priority=opts.priority,
+                deadline=opts.deadline,
+            )
+            for chunk in chunks:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = self.last_usage = _openai_usage(chunk)
+                delta = chunk.choices[0].delta if chunk.choices else None
+                if delta is not None and getattr(delta, "content", None):
+                    yield delta.content
+        except Exception as e:
+            record_llm_call(label, "openai", self.model, time.perf_counter() - started, str(e))
+            yield f"[OpenAI error] {e}"
+            return
+        record_llm_call(label, "openai", self.model, time.perf_counter() - started, None, usage)
+
 
 def build_client(cfg: Dict[str, str], model: str) -> LLMClient:
     """
     Build an LLM client based on available API keys and installed SDKs.
-    Preference: Claude -> OpenAI -> Dummy.
+    Preference: Claude -> OpenAI -> local server -> Dummy; `local:<name>` models always go local.
+    Rate limits for the shared request scheduler are read from the same config.
+    `llm_replay` (a recording path) replaces the provider with recorded traffic;
+    `llm_record` appends every provider call to a recording.
     """
+    replay = cfg.get("llm_replay")
+    if replay:
+        from .recording import get_replay_client
+
+        try:
+            return get_replay_client(replay, float(cfg.get("llm_replay_speed") or 1.0))
+        except Exception as e:
+            return DummyLLM(reason=f"replay unavailable: {e}")
+    client = _provider_client(cfg, model)
+    record = cfg.get("llm_record")
+    if record and not isinstance(client, DummyLLM):
+        from .recording import RecordingClient
+
+        client = RecordingClient(client, record, model)
+    return client
+
+
+def _provider_client(cfg: Dict[str, str], model: str) -> LLMClient:
+    get_scheduler(cfg)
+    local_url = cfg.get("local_base_url")
+    if model.startswith("local:"):
+        if not local_url:
+            return DummyLLM(reason=f"{model} needs local_base_url")
+        return _local_client(cfg, model)
+
     claude_key = cfg.get("claude_api_key")
     if claude_key:
         try:
-            return ClaudeClient(claude_key, model)
+            with span("claude.init"):
+                return ClaudeClient(claude_key, model)
         except Exception as e:
             return DummyLLM(reason=str(e))
 
     openai_key = cfg.get("openai_api_key")
     if openai_key:
         try:
-            return OpenAIClient(openai_key, model)
+            with span("openai.init"):
+                return OpenAIClient(openai_key, model)
         except Exception as e:
             return DummyLLM(reason=str(e))
 
+    if local_url:
+        return _local_client(cfg, "")
+
     return DummyLLM(reason="no API key set; set claude_api_key or openai_api_key via `aibuddies config set`")
+
+
+def _local_client(cfg: Dict[str, str], model: str) -> LLMClient:
+    from .local import local_client
+
+    try:
+        return local_client(cfg, model)
+    except Exception as e:
+        return DummyLLM(reason=f"local provider unavailable: {e}")
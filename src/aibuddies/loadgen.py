@@ -0,0 +1,158 @@
+"""
+Synthetic load generator for capacity testing the runtime.
+
+Simulates N buddies with open-loop (Poisson) chat and proactive traffic against
+a RuntimeManager on a private home directory. Chat turns go through
+`runtime.ask` at interactive priority; proactive turns are enqueued, drained
+and answered at scheduled priority, as a proactive tick would. Latency is
+measured from each request's scheduled arrival, so time spent queued behind
+busy workers counts (no coordinated omission).
+
+Pair with a ReplayClient (see recording.py) to load-test without provider calls.
+"""
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .buddies import Buddy
+from .config import Paths
+from .llm import LLMClient
+from .ratelimit import PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED
+from .recording import is_error_reply
+from .runtime import RuntimeManager
+from .usage import percentile
+
+ClientFactory = Callable[[Dict[str, Any], str], LLMClient]
+
+CHAT_PROMPTS = (
+    "What should I focus on next?",
+    "Can you summarize where we are?",
+    "Any quick tips for this?",
+    "Remind me what we decided earlier.",
+)
+PROACTIVE_PROMPT = "It's time to check in. Share a quick update or I'll suggest something."
+
+
+@dataclass
+class LoadReport:
+    duration_s: float
+    buddies: int
+    requests: Dict[str, int] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+    latency_ms: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return sum(self.requests.values())
+
+    @property
+    def throughput(self) -> float:
+        return self.total / self.duration_s if self.duration_s else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "duration_s": round(self.duration_s, 3),
+            "buddies": self.buddies,
+            "requests": self.requests,
+            "errors": self.errors,
+            "throughput_rps": round(self.throughput, 2),
+            "latency_ms": self.latency_ms,
+        }
+
+    def format(self) -> str:
+        lines = [
+            f"{self.total} requests from {self.buddies} buddies in {self.duration_s:.1f}s "
+            f"({self.throughput:.1f} req/s)"
+        ]
+        for kind in sorted(self.latency_ms):
+            lat = self.latency_ms[kind]
+            lines.append(
+                f"  {kind:10s} n={self.requests.get(kind, 0):<6d} errors={self.errors.get(kind, 0):<5d} "
+                f"p50 {lat['p50']:8.1f} ms  p99 {lat['p99']:8.1f} ms  max {lat['max']:8.1f} ms"
+            )
+        return "\n".join(lines)
+
+
+def _arrivals(rng: random.Random, rate: float, duration: float, names: List[str], kind: str) -> List[Tuple[float, str, str]]:
+    """Poisson arrivals over [0, duration) at `rate` per buddy per second, spread uniformly across buddies."""
+    total_rate = rate * len(names)
+    out: List[Tuple[float, str, str]] = []
+    if total_rate <= 0:
+        return out
+    t = rng.expovariate(total_rate)
+    while t < duration:
+        out.append((t, kind, rng.choice(names)))
+        t += rng.expovariate(total_rate)
+    return out
+
+
+def run_load(
+    client_factory: ClientFactory,
+    buddies: int = 10,
+    duration: float = 10.0,
+    chat_rate: float = 0.2,
+    proactive_rate: float = 0.05,
+    workers: int = 16,
+    seed: Optional[int] = None,
+) -> LoadReport:
+    """Drive `buddies` synthetic buddies for `duration` seconds and report throughput and latency."""
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(prefix="aibuddies-loadgen-") as tmp:
+        runtime = RuntimeManager(Paths(home=Path(tmp)), client_factory=client_factory)
+        names = [f"load-{i:04d}" for i in range(buddies)]
+        for name in names:
+            runtime.running[name] = Buddy(name=name, persona_prompt=f"Synthetic buddy {name}.", autorun_interval="manual")
+
+        schedule = sorted(
+            _arrivals(rng, chat_rate, duration, names, "chat")
+            + _arrivals(rng, proactive_rate, duration, names, "proactive")
+        )
+        latencies: Dict[str, List[float]] = {"chat": [], "proactive": []}
+        errors: Dict[str, int] = {"chat": 0, "proactive": 0}
+        lock = threading.Lock()
+
+        def turn(due: float, kind: str, name: str, prompt: str) -> None:
+            try:
+                if kind == "chat":
+                    reply = runtime.ask(name, prompt, priority=PRIORITY_INTERACTIVE)
+                else:
+                    runtime.enqueue(name, PROACTIVE_PROMPT)
+                    reply = ""
+                    for msg in runtime.drain_queue(name):
+                        reply = runtime.ask(name, msg, priority=PRIORITY_SCHEDULED)
+                failed = is_error_reply(reply)
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - due
+            with lock:
+                latencies[kind].append(elapsed)
+                errors[kind] += int(failed)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="loadgen") as pool:
+            for offset, kind, name in schedule:
+                due = start + offset
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(turn, due, kind, name, rng.choice(CHAT_PROMPTS))
+        elapsed = time.perf_counter() - start
+
+    report = LoadReport(duration_s=max(elapsed, duration), buddies=buddies)
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        report.requests[kind] = len(values)
+        report.errors[kind] = errors[kind]
+        report.latency_ms[kind] = {
+            "p50": round(percentile(values, 0.50) * 1000, 2),
+            "p99": round(percentile(values, 0.99) * 1000, 2),
+            "max": round(values[-1] * 1000, 2),
+        }
+    return report
@@ -0,0 +1,298 @@
+"""
+Local OpenAI-compatible provider (llama.cpp server, vLLM, Ollama, LM Studio, ...).
+
+Buddies whose model is `local:<name>` talk to `local_base_url` (e.g.
+`http://127.0.0.1:8080/v1`). Requests never leave the machine. With
+`local_for_private_docs` on, the runtime therefore also routes buddies with
+docs here when `allow_cloud_with_docs` is off, using `local_model` (see
+RuntimeManager._model_for).
+
+Every LocalClient for the same endpoint shares one `_Backend`. The backend
+keeps a small pool of keep-alive HTTP connections. Requests go to
+`/chat/completions`, where the server applies the model's chat template.
+
+Batching needs that same template on our side, because `/completions` takes
+raw text. It is therefore used only when `local_chat_template` is configured:
+a format string with `{system}` and `{user}` fields that matches the model's
+template, with literal braces doubled. The backend then coalesces concurrent
+requests for the same model and max_tokens. The first request in an open batch
+waits up to `local_batch_wait_ms` for others, then sends them all as one
+`/completions` call with a list `prompt`; the OpenAI API defines list prompts
+for that endpoint. That call times out when the most pressed deadline in the
+batch runs out. Grouping by max_tokens keeps every reply within its own
+limit. A lone request still goes to chat. If the server rejects list prompts,
+batching is switched off for that endpoint and each request falls back to its
+own chat call.
+"""
+import http.client
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .deadline import Deadline, DeadlineExceeded
+from .llm import AskOptions, LLMClient, Usage
+from .metrics import LOCAL_BATCH_SIZE, record_llm_call
+from .ratelimit import estimate_tokens
+from .tracing import span
+
+LOCAL_PREFIX = "local:"
+DEFAULT_LOCAL_MODEL = "default"
+POOL_SIZE = 8
+
+_BACKENDS: Dict[Tuple[str, int, float], "_Backend"] = {}
+_BACKENDS_LOCK = threading.Lock()
+
+
+class LocalHTTPError(RuntimeError):
+    def __init__(self, status: int, body: bytes) -> None:
+        super().__init__(f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}")
+        self.status = status
+
+
+def completion_prompt(template: str, persona_prompt: str, user_text: str) -> str:
+    """The chat turn as `/completions` text, via `local_chat_template` (the server applies none there)."""
+    return template.format(system=persona_prompt, user=user_text)
+
+
+class _Pool:
+    """Keep-alive connections to one host; at most `size` are kept idle."""
+
+    def __init__(self, base_url: str, timeout: float, size: int = POOL_SIZE) -> None:
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if self.https else 80)
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.size = size
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        body = json.dumps(payload)
+        timeout = self.timeout if timeout is None else max(timeout, 0.001)
+        headers = {"Content-Type": "application/json"}
+        for attempt in range(2):
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            reused = conn is not None
+            conn = conn or self._connect()
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request("POST", self.prefix + path, body, headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue  # the server closed an idle keep-alive connection; retry on a fresh one
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                with self._lock:
+                    if len(self._idle) < self.size:
+                        self._idle.append(conn)
+                        conn = None
+                if conn is not None:
+                    conn.close()
+            if resp.status >= 400:
+                raise LocalHTTPError(resp.status, data)
+            return json.loads(data)
+        raise RuntimeError("unreachable")
+
+
+class _Item:
+    def __init__(self, prompt: str, max_tokens: int, deadline: Deadline) -> None:
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.deadline = deadline
+        self.text: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.unbatched = False  # send as its own chat request instead
+        self.done = threading.Event()
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self.items: List[_Item] = []
+        self.full = threading.Event()
+
+
+class _Backend:
+    def __init__(self, base_url: str, batch_size: int, batch_wait: float, timeout: float = 120.0) -> None:
+        self.pool = _Pool(base_url, timeout)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.batching: Optional[bool] = None if batch_size > 1 else False  # None: not tried yet
+        self._open: Dict[Tuple[str, int], _Batch] = {}  # (model, max_tokens) -> batch still accepting requests
+        self._lock = threading.Lock()
+
+    def chat(
+        self, model: str, persona_prompt: str, user_text: str, max_tokens: int, deadline: Optional[Deadline] = None
+    ) -> Tuple[str, Usage]:
+        data = self.pool.post("/chat/completions", {
+            "model": model,
+            "max_tokens": max_tokens,
+            "messages": [
+                {"role": "system", "content": persona_prompt},
+                {"role": "user", "content": user_text},
+            ],
+        }, deadline.timeout() if deadline else None)
+        usage = data.get("usage") or {}
+        choice = (data.get("choices") or [{}])[0]
+        text = (choice.get("message") or {}).get("content") or "[empty response]"
+        return text, {
+            "input_tokens": int(usage.get("prompt_tokens") or 0),
+            "output_tokens": int(usage.get("completion_tokens") or 0),
+            "cache_read_tokens": 0,
+            "cache_write_tokens": 0,
+        }
+
+    def submit(self, model: str, prompt: str, max_tokens: int, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        Join (or open) the batch for this model and max_tokens. Returns the completion, or None
+        when this request should be sent on its own (alone in its batch, or the server does not
+        take batches).
+        Raises DeadlineExceeded if the batch has not answered in time (the batch itself goes on).
+        """
+        deadline = deadline or Deadline()
+        if self.batching is False:
+            return None
+        item = _Item(prompt, max_tokens, deadline)
+        key = (model, max_tokens)  # one limit per batch call, so only requests that share it go together
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            batch.items.append(item)
+            if len(batch.items) >= self.batch_size:
+                self._open.pop(key, None)
+                batch.full.set()
+        if leader:
+            batch.full.wait(deadline.timeout(self.batch_wait))
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._send(model, batch.items)
+        if not item.done.wait(deadline.timeout()):
+            raise DeadlineExceeded("llm")
+        if item.error is not None:
+            raise item.error
+        return None if item.unbatched else item.text
+
+    def _send(self, model: str, items: List[_Item]) -> None:
+        try:
+            if len(items) == 1:
+                items[0].unbatched = True
+                return
+            LOCAL_BATCH_SIZE.observe(len(items))
+            # Sent on the leader's thread: give up when the first member's deadline passes, not
+            # after the pool's default timeout. Members without a deadline impose none.
+            limits = [t for t in (i.deadline.timeout() for i in items) if t is not None]
+            with span("local.batch", model=model, size=len(items)):
+                try:
+                    data = self.pool.post("/completions", {
+                        "model": model,
+                        "prompt": [i.prompt for i in items],
+                        "max_tokens": items[0].max_tokens,
+                    }, min(limits) if limits else None)
+                except LocalHTTPError as e:
+                    if e.status not in (400, 404, 405, 422, 501):
+                        raise
+                    data = None
+            choices = (data or {}).get("choices") or []
+            texts: Dict[int, str] = {int(c.get("index", n)): c.get("text") or "" for n, c in enumerate(choices)}
+            if data is None or len(texts) < len(items):
+                self.batching = False  # list prompts unsupported; everyone goes back to chat
+                for i in items:
+                    i.unbatched = True
+                return
+            self.batching = True
+            for n, i in enumerate(items):
+                i.text = texts[n].strip() or "[empty response]"
+        except BaseException as e:
+            for i in items:
+                i.error = e
+        finally:
+            for i in items:
+                i.done.set()
+
+
+def _backend(base_url: str, batch_size: int, batch_wait: float) -> _Backend:
+    key = (base_url.rstrip("/"), batch_size, batch_wait)
+    with _BACKENDS_LOCK:
+        backend = _BACKENDS.get(key)
+        if backend is None:
+            backend = _BACKENDS[key] = _Backend(key[0], batch_size, batch_wait)
+        return backend
+
+
+class LocalClient(LLMClient):
+    """One buddy turn against the shared backend for `base_url`."""
+
+    on_box = True
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        batch_size: int = 8,
+        batch_wait: float = 0.005,
+        chat_template: Optional[str] = None,
+    ) -> None:
+        self.model = model
+        self.backend = _backend(base_url, batch_size, batch_wait)
+        self.chat_template = chat_template  # without it every request goes to chat (see module docstring)
+
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
+        opts = opts or AskOptions()
+        started = time.perf_counter()
+        try:
+            with span("local.ask", model=self.model):
+                text: Optional[str] = None
+                prompt = ""
+                if self.chat_template:
+                    prompt = completion_prompt(self.chat_template, persona_prompt, user_text)
+                    text = self.backend.submit(self.model, prompt, opts.max_tokens, opts.deadline)
+                if text is None:
+                    if opts.expired():
+                        raise DeadlineExceeded("llm")
+                    text, usage = self.backend.chat(
+                        self.model, persona_prompt, user_text, opts.max_tokens, opts.deadline
+                    )
+                else:
+                    # The batch reports one total; attribute by size.
+                    usage = {"input_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(text),
+                             "cache_read_tokens": 0, "cache_write_tokens": 0}
+            self.last_usage = usage
+            record_llm_call(opts.metrics_buddy(buddy_name), "local", self.model, time.perf_counter() - started, None, usage)
+            return text
+        except Exception as e:
+            record_llm_call(opts.metrics_buddy(buddy_name), "local", self.model, time.perf_counter() - started, str(e))
+            return f"[Local error] {e}"
+
+
+def local_client(cfg: Dict[str, str], model: str) -> LLMClient:
+    """LocalClient for `local:<name>` (or a bare name) from the `local_*` config keys."""
+    name = model[len(LOCAL_PREFIX):] if model.startswith(LOCAL_PREFIX) else model
+    return LocalClient(
+        cfg["local_base_url"],
+        name or cfg.get("local_model") or DEFAULT_LOCAL_MODEL,
+        batch_size=int(cfg.get("local_batch_size") or 8),
+        batch_wait=float(cfg.get("local_batch_wait_ms") or 5) / 1000,
+        # Set from the shell, so a literal `\n` in the config value stands for a newline.
+        chat_template=(cfg.get("local_chat_template") or "").replace("\\n", "\n") or None,
+    )
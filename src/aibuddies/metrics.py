@@ -0,0 +1,363 @@
+"""
+In-process metrics: counters, gauges and fixed-bucket histograms with labels.
+
+Exposed in Prometheus text format via a localhost HTTP endpoint (started by
+long-running commands when `metrics_port` is configured) and printed by
+`aibuddies metrics`. A registry can also pull snapshots from other processes
+(`add_source`): the supervisor merges its workers' counters, gauges and
+histograms into the endpoint it serves.
+"""
+import bisect
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+Snapshot = Dict[str, Tuple[str, Dict[LabelValues, Any]]]  # metric name -> (kind, values by labels)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self, extra: Sequence[Dict[LabelValues, Any]] = ()) -> List[str]:
+        """Prometheus lines for this metric, with `extra` snapshot values (e.g. from workers) added in."""
+        data = self.snapshot()
+        for other in extra:
+            data = self.merge(data, other)
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples(data)
+
+    def snapshot(self) -> Dict[LabelValues, Any]:
+        raise NotImplementedError
+
+    @staticmethod
+    def merge(a: Dict[LabelValues, Any], b: Dict[LabelValues, Any]) -> Dict[LabelValues, Any]:
+        out = dict(a)
+        for k, v in b.items():
+            out[k] = out.get(k, 0.0) + v
+        return out
+
+    def _samples(self, data: Dict[LabelValues, Any]) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in data.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def inc_many(self, keys: Iterable[LabelValues], amount: float = 1.0) -> None:
+        """Add `amount` for each tuple of label values (in `labels` order) under one lock."""
+        with self._lock:
+            for key in keys:
+                self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def snapshot(self) -> Dict[LabelValues, Any]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(_Metric):
+    """Gauge whose values are pulled from registered callbacks at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._sources: List[Callable[[], Optional[Dict[LabelValues, float]]]] = []
+
+    def add_source(self, owner: Any, method_name: str) -> None:
+        """Pull values from `owner.<method_name>()`; held weakly so owners can be collected."""
+        ref = weakref.ref(owner)
+
+        def pull() -> Optional[Dict[LabelValues, float]]:
+            obj = ref()
+            return getattr(obj, method_name)() if obj is not None else None
+
+        with self._lock:
+            self._sources.append(pull)
+
+    def collect(self) -> Dict[LabelValues, float]:
+        out: Dict[LabelValues, float] = {}
+        with self._lock:
+            sources = list(self._sources)
+        for pull in sources:
+            try:
+                values = pull()
+            except Exception:
+                continue
+            for k, v in (values or {}).items():
+                out[k] = out.get(k, 0.0) + v
+        return out
+
+    def snapshot(self) -> Dict[LabelValues, Any]:
+        return self.collect()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[idx] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: Any) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def snapshot(self) -> Dict[LabelValues, Any]:
+        """labels -> (per-bucket counts, sum)."""
+        with self._lock:
+            return {k: (tuple(c), self._sums[k]) for k, c in self._counts.items()}
+
+    @staticmethod
+    def merge(a: Dict[LabelValues, Any], b: Dict[LabelValues, Any]) -> Dict[LabelValues, Any]:
+        out = dict(a)
+        for k, (counts, total) in b.items():
+            if k in out:
+                mine, my_total = out[k]
+                counts, total = tuple(x + y for x, y in zip(mine, counts)), my_total + total
+            out[k] = (tuple(counts), total)
+        return out
+
+    def _samples(self, data: Dict[LabelValues, Any]) -> List[str]:
+        lines = []
+        for key, (counts, total) in data.items():
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="' + _fmt_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {running}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._sources: List[Callable[[], Optional[List[Snapshot]]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def add_source(self, owner: Any, method_name: str) -> None:
+        """Add the snapshots returned by `owner.<method_name>()` to every render; held weakly."""
+        ref = weakref.ref(owner)
+
+        def pull() -> Optional[List[Snapshot]]:
+            obj = ref()
+            return getattr(obj, method_name)() if obj is not None else None
+
+        with self._lock:
+            self._sources.append(pull)
+
+    def snapshot(self) -> Snapshot:
+        """Current values of every metric, picklable, for merging into another process's registry."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: (m.kind, m.snapshot()) for m in metrics}
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            sources = list(self._sources)
+        snapshots: List[Snapshot] = []
+        for pull in sources:
+            try:
+                snapshots.extend(pull() or [])
+            except Exception:
+                continue
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render([snap[m.name][1] for snap in snapshots if m.name in snap]))
+        return "\n".join(lines) + "\n"
+
+
+_MERGE = {"counter": Counter.merge, "gauge": Gauge.merge, "histogram": Histogram.merge}
+
+
+def merge_snapshots(a: Snapshot, b: Snapshot, kinds: Sequence[str] = ("counter", "histogram")) -> Snapshot:
+    """`a` plus `b` for metrics of the given kinds (by default the cumulative ones; gauges are point-in-time)."""
+    out = dict(a)
+    for name, (kind, values) in b.items():
+        if kind in kinds:
+            out[name] = (kind, _MERGE[kind](out.get(name, (kind, {}))[1], values))
+    return out
+
+
+REGISTRY = Registry()
+
+LLM_REQUESTS = REGISTRY.counter(
+    "aibuddies_llm_requests_total", "LLM requests by outcome (ok/error).", ("buddy", "provider", "model", "outcome")
+)
+LLM_ERRORS = REGISTRY.counter(
+    "aibuddies_llm_errors_total", "LLM errors by kind.", ("buddy", "provider", "model", "kind")
+)
+LLM_LATENCY = REGISTRY.histogram(
+    "aibuddies_llm_latency_seconds", "End-to-end provider call latency.", ("buddy", "provider", "model")
+)
+LLM_FALLBACKS = REGISTRY.counter(
+    "aibuddies_llm_fallback_total", "Replies served by a fallback model.", ("provider", "requested", "used")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "aibuddies_llm_tokens_total", "Tokens reported by the provider (prompt/completion/cache_read/cache_write).", ("buddy", "provider", "model", "kind")
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "aibuddies_message_queue_depth", "Undelivered proactive messages per buddy.", ("buddy",)
+)
+PROACTIVE_MESSAGES = REGISTRY.counter(
+    "aibuddies_proactive_messages_total", "Proactive messages enqueued.", ("buddy", "kind")
+)
+PROACTIVE_COALESCED = REGISTRY.counter(
+    "aibuddies_proactive_coalesced_total", "Proactive prompts merged into an identical pending one.", ("buddy",)
+)
+PRECOMPUTE = REGISTRY.counter(
+    "aibuddies_precompute_total", "Ahead-of-time schedule replies by outcome (generated/hit/stale/miss/evicted).",
+    ("outcome",),
+)
+SCHEDULER_LAG = REGISTRY.histogram(
+    "aibuddies_scheduler_lag_seconds", "How late each proactive tick ran versus its target time.", (),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0),
+)
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "aibuddies_deadline_exceeded_total", "Requests (or stages of one) cut short by their deadline.", ("buddy", "stage")
+)
+LOCAL_BATCH_SIZE = REGISTRY.histogram(
+    "aibuddies_local_batch_size", "Requests coalesced into one batched call to the local provider.", (),
+    buckets=(2, 4, 8, 16, 32),
+)
+RATELIMIT_QUEUE = REGISTRY.gauge(
+    "aibuddies_ratelimit_queue_depth", "Requests waiting for a rate-limit slot.", ("bucket", "priority")
+)
+
+
+def classify_error(message: str) -> str:
+    msg = message.lower()
+    if "credit balance" in msg or "insufficient" in msg or "billing" in msg:
+        return "billing"
+    if ("rate" in msg and "limit" in msg) or "429" in msg:
+        return "rate_limit"
+    if "not_found" in msg or "not found" in msg:
+        return "not_found"
+    if "timeout" in msg or "timed out" in msg:
+        return "timeout"
+    if "auth" in msg or "401" in msg or "api key" in msg:
+        return "auth"
+    return "other"
+
+
+_TOKEN_KINDS = (
+    ("input_tokens", "prompt"),
+    ("output_tokens", "completion"),
+    ("cache_read_tokens", "cache_read"),
+    ("cache_write_tokens", "cache_write"),
+)
+
+
+def record_llm_call(
+    buddy: str,
+    provider: str,
+    model: str,
+    seconds: float,
+    error: Optional[str] = None,
+    usage: Optional[Dict[str, int]] = None,
+) -> None:
+    """`usage` keys: input_tokens, output_tokens, cache_read_tokens, cache_write_tokens."""
+    outcome = "error" if error is not None else "ok"
+    LLM_REQUESTS.inc(buddy=buddy, provider=provider, model=model, outcome=outcome)
+    LLM_LATENCY.observe(seconds, buddy=buddy, provider=provider, model=model)
+    if error is not None:
+        LLM_ERRORS.inc(buddy=buddy, provider=provider, model=model, kind=classify_error(error))
+    for key, kind in _TOKEN_KINDS:
+        count = (usage or {}).get(key, 0)
+        if count:
+            LLM_TOKENS.inc(count, buddy=buddy, provider=provider, model=model, kind=kind)
+
+
+def serve(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve `registry` at http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="aibuddies-metrics").start()
+    return server
@@ -0,0 +1,181 @@
+"""
+Proactive notification coalescing.
+
+Interval and schedule prompts go through a `Coalescer` instead of straight onto
+each buddy's message queue. The first batch after a quiet period is delivered
+immediately; after that, at most one digest goes out per `window` seconds,
+covering every buddy with something pending. Identical prompts for the same
+buddy inside a window collapse into one notice with a count.
+
+When proactive replies come from the LLM (`proactive_llm` config), a digest is
+answered with one request per model: each distinct prompt is listed once with
+the buddies it applies to, and the reply is a JSON object of per-buddy messages.
+Buddies missing from the reply fall back to their prompt text.
+"""
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .buddies import Buddy
+from .llm import AskOptions, LLMClient
+from .metrics import PROACTIVE_COALESCED
+from .ratelimit import PRIORITY_SCHEDULED
+
+DEFAULT_WINDOW = 300.0
+DIGEST_MAX_TOKENS = 4096
+
+_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+_DIGEST_PERSONA = "You write short proactive check-in messages for several AI buddies at once."
+
+_DIGEST_PROMPT = (
+    "Each buddy below has pending check-in prompts. For every buddy, write one short message "
+    "(1-2 sentences) in that buddy's voice that covers all of its prompts. Reply with a single JSON "
+    'object mapping each buddy name to its message, e.g. {"GymCoach": "Time to stretch!"}. No extra text.'
+)
+
+
+def _dedup_key(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+@dataclass
+class Notice:
+    text: str
+    kind: str
+    count: int = 1
+    ref: str = ""  # schedule firing (yyyymmdd:HH:MM), for precomputed replies
+
+
+@dataclass
+class Digest:
+    """Everything pending across buddies at flush time, in arrival order per buddy."""
+
+    notices: Dict[str, List[Notice]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.notices)
+
+    def message(self, buddy: str) -> str:
+        """The queued text for one buddy: the notice itself, or a short digest of several."""
+        notices = self.notices.get(buddy, [])
+        if len(notices) == 1 and notices[0].count == 1:
+            return notices[0].text
+        lines = [n.text if n.count == 1 else f"{n.text} (x{n.count})" for n in notices]
+        if len(lines) == 1:
+            return lines[0]
+        return f"{len(lines)} updates:\n" + "\n".join(f"- {line}" for line in lines)
+
+    def prompts(self) -> Dict[str, List[str]]:
+        """Distinct prompt text -> buddies it is pending for (dedup across buddies for the LLM request)."""
+        out: Dict[str, List[str]] = {}
+        for buddy, notices in self.notices.items():
+            for n in notices:
+                out.setdefault(n.text, []).append(buddy)
+        return out
+
+
+class Coalescer:
+    def __init__(self, window: float = DEFAULT_WINDOW, clock: Callable[[], float] = time.monotonic) -> None:
+        self.window = window
+        self.clock = clock
+        self._pending: Dict[str, Dict[str, Notice]] = {}  # buddy -> dedup key -> notice (insertion ordered)
+        self._last_flush: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, buddy: str, text: str, kind: str = "interval", ref: str = "") -> bool:
+        """Queue a notice. Returns False when an identical one is already pending for `buddy`."""
+        return self.extend([(buddy, text, kind, ref)]) == 1
+
+    def extend(self, items: Iterable[Tuple[str, str, str, str]]) -> int:
+        """Queue (buddy, text, kind, ref) notices under one lock. Returns how many were new."""
+        merged: List[str] = []
+        added = 0
+        with self._lock:
+            for buddy, text, kind, ref in items:
+                notices = self._pending.setdefault(buddy, {})
+                key = _dedup_key(text)
+                existing = notices.get(key)
+                if existing is not None:
+                    existing.count += 1
+                    merged.append(buddy)
+                else:
+                    notices[key] = Notice(text, kind, ref=ref)
+                    added += 1
+        for buddy in merged:
+            PROACTIVE_COALESCED.inc(buddy=buddy)
+        return added
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(n) for n in self._pending.values())
+
+    def due(self) -> bool:
+        with self._lock:
+            if not self._pending:
+                return False
+            return self._last_flush is None or self.clock() - self._last_flush >= self.window
+
+    def discard(self, buddy: str) -> None:
+        with self._lock:
+            self._pending.pop(buddy, None)
+
+    def flush(self, force: bool = False) -> Optional[Digest]:
+        """Take everything pending as one digest if the window allows it (or `force`)."""
+        if not force and not self.due():
+            return None
+        with self._lock:
+            if not self._pending:
+                return None
+            digest = Digest({buddy: list(n.values()) for buddy, n in self._pending.items()})
+            self._pending = {}
+            self._last_flush = self.clock()
+        return digest
+
+
+def parse_digest_reply(raw: str, names: List[str]) -> Dict[str, str]:
+    """{buddy: message} from a batched reply; buddies missing or empty in the reply are left out."""
+    m = _JSON_RE.search(raw or "")
+    if not m:
+        return {}
+    try:
+        data = json.loads(m.group(0))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    by_lower = {str(k).strip().lower(): v for k, v in data.items()}
+    out: Dict[str, str] = {}
+    for name in names:
+        value = by_lower.get(name.lower())
+        if isinstance(value, str) and value.strip():
+            out[name] = value.strip()
+    return out
+
+
+def digest_request(digest: Digest, buddies: List[Buddy]) -> str:
+    names = {b.name for b in buddies}
+    listing = "\n".join(f"- {b.name}: {b.persona_prompt.strip()}" for b in buddies)
+    prompts = "\n".join(
+        f"- {text!r} -> {', '.join(who)}"
+        for text, who in ((t, [n for n in w if n in names]) for t, w in digest.prompts().items())
+        if who
+    )
+    return f"{_DIGEST_PROMPT}\n\nBuddies:\n{listing}\n\nPrompts:\n{prompts}"
+
+
+def answer_digest(
+    client: LLMClient, digest: Digest, buddies: List[Buddy], max_tokens: int, priority: int = PRIORITY_SCHEDULED
+) -> Dict[str, str]:
+    """One request for all `buddies` (same model) in the digest. Returns {buddy: message} for those answered."""
+    # Not labelled as any one buddy in the provider metrics; the runtime splits its usage between them.
+    label = buddies[0].name if len(buddies) == 1 else ""
+    opts = AskOptions(priority=priority, max_tokens=min(DIGEST_MAX_TOKENS, max_tokens), label=label)
+    try:
+        raw = client.ask("proactive-digest", _DIGEST_PERSONA, digest_request(digest, buddies), opts)
+    except Exception:
+        return {}
+    return parse_digest_reply(raw, [b.name for b in buddies])
@@ -0,0 +1,332 @@
+"""
+Buddy Pack export/import.
+
+A pack is a plain (uncompressed) tar stream:
+- `buddy.json`          the buddy config
+- `blobs/<sha256>.gz`   one gzip member per unique doc (only with --include-docs)
+- `manifest.json`       written last: per-file name/size/sha256/blob plus the buddy.json hash
+
+Doc files are never held in memory: export hashes and compresses each file in
+chunks on a thread pool (zlib releases the GIL) into a spool file, then appends
+it to the tar. Import streams each blob through a decompressor into a staging
+dir while hashing, checks everything against the manifest, and only then moves
+files into place, skipping content that is already there and cloning (copy-on-write
+where the filesystem supports it) identical content found elsewhere. Files are never
+hard-linked: each buddy's docs must stay independent of every other buddy's.
+
+The manifest is read first (the pack is seekable), so no blob is decompressed
+past the size it declares. Import is all-or-nothing: docs replaced or added
+before a failure are put back as they were.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .buddies import Buddy, BuddyStore
+from .config import Paths
+
+PACK_FORMAT = "aibuddies-pack"
+PACK_VERSION = 1
+CHUNK_SIZE = 1024 * 1024
+_FICLONE = 0x40049409  # ioctl: share extents copy-on-write (btrfs, XFS, ...)
+
+
+class PackError(RuntimeError):
+    """Raised for invalid, corrupt or disallowed packs."""
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _compress_to_spool(src: Path, spool_dir: Path, level: int) -> Tuple[str, int, Path]:
+    """Hash + gzip one file into a spool file. Returns (sha256, size, spool path)."""
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=spool_dir, suffix=".gz")
+    with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level, mtime=0) as gz:
+        with src.open("rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+                size += len(chunk)
+                gz.write(chunk)
+    return h.hexdigest(), size, Path(tmp)
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, fileobj=io.BytesIO(data))
+
+
+def export_pack(
+    buddy: Buddy,
+    out_path: Path,
+    include_docs: bool = False,
+    paths: Optional[Paths] = None,
+    workers: Optional[int] = None,
+    level: int = 6,
+) -> Dict[str, Any]:
+    """Write a pack for `buddy` to `out_path` and return its manifest."""
+    paths = paths or Paths()
+    doc_files: List[Path] = []
+    if include_docs:
+        if not buddy.doc_privacy.get("export_allowed", False):
+            raise PackError(
+                f"{buddy.name} does not allow doc export (doc_privacy.export_allowed is false)."
+            )
+        doc_dir = paths.docs_dir / buddy.name
+        if doc_dir.exists():
+            doc_files = sorted(p for p in doc_dir.iterdir() if p.is_file() and not p.name.startswith("."))
+
+    buddy_json = json.dumps(buddy.to_dict(), indent=2).encode("utf-8")
+    manifest: Dict[str, Any] = {
+        "format": PACK_FORMAT,
+        "version": PACK_VERSION,
+        "buddy": buddy.name,
+        "buddy_sha256": hashlib.sha256(buddy_json).hexdigest(),
+        "created_at": time.time(),
+        "files": [],
+    }
+    workers = workers or min(8, os.cpu_count() or 1)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_out = out_path.with_name(out_path.name + ".partial")
+    written_blobs = set()
+    with tempfile.TemporaryDirectory(dir=out_path.parent, prefix=".pack-spool-") as spool, \
+            ThreadPoolExecutor(max_workers=workers) as pool, \
+            tarfile.open(tmp_out, "w") as tar:
+        _add_bytes(tar, "buddy.json", buddy_json)
+        # Keep at most 2x workers spooled files in flight to bound temp disk usage.
+        window = max(2, workers * 2)
+        pending: List[Tuple[Path, Future]] = []
+
+        def drain(limit: int) -> None:
+            while len(pending) > limit:
+                src, fut = pending.pop(0)
+                sha, size, spooled = fut.result()
+                blob = f"blobs/{sha}.gz"
+                if sha not in written_blobs:
+                    info = tarfile.TarInfo(blob)
+                    info.size = spooled.stat().st_size
+                    info.mtime = int(time.time())
+                    with spooled.open("rb") as f:
+                        tar.addfile(info, fileobj=f)
+                    written_blobs.add(sha)
+                spooled.unlink()
+                manifest["files"].append({"name": src.name, "size": size, "sha256": sha, "blob": blob})
+
+        for src in doc_files:
+            pending.append((src, pool.submit(_compress_to_spool, src, Path(spool), level)))
+            drain(window)
+        drain(0)
+        _add_bytes(tar, "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+    os.replace(tmp_out, out_path)
+    return manifest
+
+
+def _safe_doc_name(name: str) -> bool:
+    return bool(name) and Path(name).name == name and not name.startswith(".")
+
+
+def _iter_members(pack_path: Path) -> Iterator[Tuple[tarfile.TarInfo, Any]]:
+    with tarfile.open(pack_path, "r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            yield member, tar.extractfile(member)
+
+
+def _read_manifest(pack_path: Path) -> Dict[str, Any]:
+    """The manifest, found by seeking over member headers (blob data is skipped, not read)."""
+    try:
+        with tarfile.open(pack_path, "r:") as tar:
+            fobj = tar.extractfile(tar.getmember("manifest.json"))
+            manifest = json.loads(fobj.read().decode("utf-8")) if fobj is not None else None
+    except (KeyError, ValueError, tarfile.TarError):
+        manifest = None
+    if not isinstance(manifest, dict) or manifest.get("format") != PACK_FORMAT:
+        raise PackError("Not an AI Buddies pack (missing manifest).")
+    if manifest.get("version", 0) > PACK_VERSION:
+        raise PackError(f"Pack version {manifest.get('version')} is newer than supported ({PACK_VERSION}).")
+    return manifest
+
+
+def _clone(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone `src` to `dst` (Linux FICLONE). False where unsupported; dst is then absent."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with src.open("rb") as s, dst.open("wb") as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        return True
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+
+
+class _DocLocator:
+    """Lazily hash existing doc files so identical content can be reused instead of rewritten."""
+
+    def __init__(self, docs_dir: Path) -> None:
+        self.by_size: Dict[int, List[Path]] = {}
+        if docs_dir.exists():
+            for p in docs_dir.rglob("*"):
+                hidden = any(part.startswith(".") for part in p.relative_to(docs_dir).parts)
+                if p.is_file() and not hidden:
+                    self.by_size.setdefault(p.stat().st_size, []).append(p)
+        self.hashes: Dict[Path, str] = {}
+
+    def find(self, size: int, sha: str) -> Optional[Path]:
+        for p in self.by_size.get(size, []):
+            if p not in self.hashes:
+                self.hashes[p] = _sha256_file(p)
+            if self.hashes[p] == sha:
+                return p
+        return None
+
+    def add(self, path: Path, size: int, sha: str) -> None:
+        self.by_size.setdefault(size, []).append(path)
+        self.hashes[path] = sha
+
+
+def import_pack(
+    pack_path: Path,
+    paths: Optional[Paths] = None,
+    store: Optional[BuddyStore] = None,
+    overwrite: bool = False,
+) -> Dict[str, Any]:
+    """
+    Verify and import a pack. Returns a report with the buddy name and counts of
+    docs written, reused (cloned or copied from identical content already on disk) and unchanged.
+    """
+    paths = paths or Paths()
+    paths.ensure()
+    store = store or BuddyStore(paths)
+    manifest = _read_manifest(Path(pack_path))
+    declared: Dict[str, int] = {}  # sha -> size the manifest gives its content
+    for entry in manifest.get("files", []):
+        if isinstance(entry.get("size"), int):
+            declared[str(entry.get("sha256", ""))] = entry["size"]
+    staging = Path(tempfile.mkdtemp(dir=paths.docs_dir, prefix=".staging-"))
+    moved: List[Tuple[Path, Optional[Path]]] = []  # (doc put in place, backup of what it replaced)
+    try:
+        buddy_json: Optional[bytes] = None
+        blobs: Dict[str, Tuple[Path, int]] = {}  # sha -> (staged path, size)
+        for member, fobj in _iter_members(Path(pack_path)):
+            if member.name == "buddy.json":
+                buddy_json = fobj.read()
+            elif member.name == "manifest.json":
+                continue  # already read
+            elif member.name.startswith("blobs/") and member.name.endswith(".gz"):
+                claimed = member.name[len("blobs/"):-len(".gz")]
+                if len(claimed) != 64 or any(c not in "0123456789abcdef" for c in claimed):
+                    raise PackError(f"Unexpected pack member: {member.name}")
+                if claimed not in declared:
+                    raise PackError(f"Corrupt pack: blob {member.name} is not in the manifest.")
+                h = hashlib.sha256()
+                size = 0
+                target = staging / claimed
+                with gzip.GzipFile(fileobj=fobj, mode="rb") as gz, target.open("wb") as out:
+                    for chunk in iter(lambda: gz.read(CHUNK_SIZE), b""):
+                        size += len(chunk)
+                        if size > declared[claimed]:
+                            raise PackError(f"Corrupt pack: blob {member.name} is larger than the manifest says.")
+                        h.update(chunk)
+                        out.write(chunk)
+                if h.hexdigest() != claimed:
+                    raise PackError(f"Corrupt pack: blob {member.name} does not match its hash.")
+                blobs[claimed] = (target, size)
+            else:
+                raise PackError(f"Unexpected pack member: {member.name}")
+
+        if buddy_json is None or hashlib.sha256(buddy_json).hexdigest() != manifest.get("buddy_sha256"):
+            raise PackError("Corrupt pack: buddy.json does not match the manifest.")
+        for entry in manifest.get("files", []):
+            if not _safe_doc_name(entry.get("name", "")):
+                raise PackError(f"Unsafe doc name in pack: {entry.get('name')!r}")
+            staged = blobs.get(entry.get("sha256", ""))
+            if staged is None or staged[1] != entry.get("size"):
+                raise PackError(f"Corrupt pack: content for {entry.get('name')} is missing or truncated.")
+
+        try:
+            buddy = Buddy.from_dict(json.loads(buddy_json.decode("utf-8")))
+        except (TypeError, ValueError) as e:
+            raise PackError(f"Invalid buddy.json in pack: {e}")
+        if not _safe_doc_name(buddy.name):
+            raise PackError(f"Unsafe buddy name in pack: {buddy.name!r}")
+        if store.get(buddy.name) and not overwrite:
+            raise PackError(f"Buddy {buddy.name} already exists (use --force to overwrite).")
+
+        report = {"buddy": buddy.name, "written": 0, "reused": 0, "unchanged": 0, "bytes_written": 0}
+        dest_dir = paths.docs_dir / buddy.name
+        created_dir = not dest_dir.exists()
+
+        def put(src: Path, dest: Path) -> None:
+            """Move `src` to `dest`, keeping what was there in staging until the import succeeds."""
+            backup = None
+            if dest.exists():
+                backup = staging / f".backup-{len(moved)}"
+                os.replace(dest, backup)
+            moved.append((dest, backup))
+            os.replace(src, dest)
+
+        try:
+            if manifest.get("files"):
+                dest_dir.mkdir(parents=True, exist_ok=True)
+                locator = _DocLocator(paths.docs_dir)
+                for entry in manifest["files"]:
+                    sha, size = entry["sha256"], entry["size"]
+                    dest = dest_dir / entry["name"]
+                    if dest.exists() and dest.stat().st_size == size and _sha256_file(dest) == sha:
+                        report["unchanged"] += 1
+                        locator.add(dest, size, sha)
+                        continue
+                    existing = locator.find(size, sha)
+                    tmp_dest = dest_dir / f".{entry['name']}.importing"
+                    if existing is not None and _clone(existing, tmp_dest):
+                        put(tmp_dest, dest)
+                        report["reused"] += 1
+                        locator.add(dest, size, sha)
+                        continue
+                    staged_path = blobs[sha][0]
+                    if staged_path.exists():
+                        put(staged_path, dest)
+                        report["written"] += 1
+                    elif existing is not None:
+                        shutil.copyfile(existing, tmp_dest)
+                        put(tmp_dest, dest)
+                        report["reused"] += 1
+                    report["bytes_written"] += size
+                    locator.add(dest, size, sha)
+            store.create(buddy)
+        except BaseException:
+            for dest, backup in reversed(moved):
+                if backup is not None:
+                    os.replace(backup, dest)
+                else:
+                    dest.unlink(missing_ok=True)
+            for leftover in dest_dir.glob(".*.importing"):
+                leftover.unlink(missing_ok=True)
+            if created_dir:
+                shutil.rmtree(dest_dir, ignore_errors=True)
+            raise
+        return report
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
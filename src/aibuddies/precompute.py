@@ -0,0 +1,96 @@
+"""
+Ahead-of-time generation of scheduled proactive replies.
+
+With `proactive_llm` on, a schedule entry's message is written by the LLM when
+the entry fires, so the user waits a round trip at exactly the moment it should
+appear. The runtime instead generates replies for entries due within the lead
+window (`precompute_lead` seconds) in the background, at background priority
+and only while no interactive or scheduled request is waiting for a rate-limit
+slot. Each buddy's next uncached entry goes into a single digest request per
+model (see notify.py).
+
+Replies are held in a bounded LRU `PrecomputeCache` keyed by buddy and firing
+(`yyyymmdd:HH:MM`) and stamped with a fingerprint of everything the reply
+depends on: system prompt, persona, model, schedule and the gathered context.
+At fire time a reply is used only if the fingerprint still matches; otherwise
+it is dropped and the entry goes through the normal digest path.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .buddies import Buddy
+from .metrics import PRECOMPUTE
+
+DEFAULT_LEAD = 600.0
+DEFAULT_CAPACITY = 256
+
+
+def fingerprint(buddy: Buddy, context: Dict[str, str]) -> str:
+    payload = json.dumps(
+        [buddy.system_prompt, buddy.persona_prompt, buddy.model, buddy.schedule, sorted(context.items())],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def firing_ref(day: str, hhmm: str) -> str:
+    return f"{day}:{hhmm}"
+
+
+def upcoming(buddy: Buddy, now: float, lead: float) -> List[Tuple[float, str, str]]:
+    """(fire time, ref, message) of `buddy`'s schedule entries due in (now, now + lead], soonest first."""
+    out = []
+    local = time.localtime(now)
+    for entry in buddy.schedule:
+        ts, msg = entry.split("|", 1) if "|" in entry else (entry, entry)
+        ts = ts.strip()
+        try:
+            hh, mm = (int(x) for x in ts.split(":", 1))
+        except ValueError:
+            continue
+        for days in (0, 1):
+            at = time.mktime((local.tm_year, local.tm_mon, local.tm_mday + days, hh, mm, 0, 0, 0, -1))
+            if now < at <= now + lead:
+                out.append((at, firing_ref(time.strftime("%Y%m%d", time.localtime(at)), ts), msg.strip()))
+    return sorted(out)
+
+
+class PrecomputeCache:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        self._items: "OrderedDict[Tuple[str, str], Tuple[str, str]]" = OrderedDict()  # -> (fingerprint, reply)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def has(self, buddy: str, ref: str, fp: str) -> bool:
+        with self._lock:
+            item = self._items.get((buddy, ref))
+        return item is not None and item[0] == fp
+
+    def put(self, buddy: str, ref: str, fp: str, reply: str) -> None:
+        with self._lock:
+            self._items[(buddy, ref)] = (fp, reply)
+            self._items.move_to_end((buddy, ref))
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+                PRECOMPUTE.inc(outcome="evicted")
+
+    def take(self, buddy: str, ref: str, fp: str) -> Optional[str]:
+        """Remove and return the reply for this firing if it was generated from the same inputs."""
+        with self._lock:
+            item = self._items.pop((buddy, ref), None)
+        if item is None:
+            PRECOMPUTE.inc(outcome="miss")
+            return None
+        if item[0] != fp:
+            PRECOMPUTE.inc(outcome="stale")
+            return None
+        PRECOMPUTE.inc(outcome="hit")
+        return item[1]
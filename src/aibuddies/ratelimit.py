@@ -0,0 +1,316 @@
+"""
+Shared request scheduler for LLM providers.
+
+Every provider call goes through a pair of token buckets per provider/API key
+(requests per minute and tokens per minute). Waiters are admitted strictly in
+priority order, so an interactive chat turn never queues behind a burst of
+scheduled check-ins or background schedule generation.
+
+Rate-limit responses (HTTP 429/529 or SDK RateLimitError) pause the whole key
+for the provider's retry-after (or a jittered exponential backoff) and the
+call is retried.
+"""
+import hashlib
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .deadline import Deadline
+from .metrics import RATELIMIT_QUEUE
+from .tracing import span
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCHEDULED = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_SCHEDULED: "scheduled",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# (requests per minute, tokens per minute); 0 disables that bucket.
+DEFAULT_LIMITS: Dict[str, Tuple[int, int]] = {
+    "claude": (50, 40000),
+    "openai": (60, 60000),
+}
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Cheap prompt size estimate (~4 chars per token) used for TPM accounting."""
+    return sum(len(t) for t in texts if t) // 4 + 1
+
+
+class TokenBucket:
+    """Continuous-refill token bucket holding at most `capacity` tokens per `period` seconds."""
+
+    def __init__(self, capacity: float, period: float = 60.0) -> None:
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period if period > 0 else 0.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (requests larger than capacity wait for a full bucket)."""
+        if self.unlimited:
+            return max(0.0, self.blocked_until - now)
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        blocked = max(0.0, self.blocked_until - now)
+        if self.tokens >= amount:
+            return blocked
+        return max(blocked, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float, now: float) -> None:
+        if self.unlimited:
+            return
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def block(self, seconds: float, now: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class _KeyLimiter:
+    """Buckets, waiters and counters for one provider/key pair."""
+
+    def __init__(self, rpm: int, tpm: int) -> None:
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.cond = threading.Condition()
+        self.waiters: List[Tuple[int, int]] = []
+        self.depth = {p: 0 for p in PRIORITY_NAMES}
+        self.admitted = {p: 0 for p in PRIORITY_NAMES}
+        self.throttled = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+
+def retry_after(exc: BaseException) -> Tuple[bool, Optional[float]]:
+    """
+    Classify an SDK/HTTP exception.
+    Returns (retryable, retry_after_seconds) where retry_after is None if the provider gave no hint.
+    """
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    retryable = status in (429, 529) or "RateLimit" in type(exc).__name__ or "Overloaded" in type(exc).__name__
+    if not retryable:
+        return False, None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return True, float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return True, float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return True, None
+
+
+class RequestScheduler:
+    """Priority-aware admission control in front of provider API keys."""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        max_retries: int = 4,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, _KeyLimiter] = {}
+        self._seq = itertools.count()
+        RATELIMIT_QUEUE.add_source(self, "_queue_depths")
+
+    def configure(self, provider: str, rpm: int, tpm: int) -> None:
+        """Set limits for a provider; existing keys get fresh buckets but keep their counters."""
+        with self._lock:
+            if self.limits.get(provider) == (rpm, tpm):
+                return
+            self.limits[provider] = (rpm, tpm)
+            limiters = [lim for k, lim in self._limiters.items() if k.startswith(provider + ":")]
+        for limiter in limiters:
+            with limiter.cond:
+                limiter.requests = TokenBucket(rpm)
+                limiter.tokens = TokenBucket(tpm)
+                limiter.cond.notify_all()
+
+    @staticmethod
+    def bucket_key(provider: str, api_key: str) -> str:
+        digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+        return f"{provider}:{digest}"
+
+    def _limiter(self, provider: str, api_key: str) -> _KeyLimiter:
+        key = self.bucket_key(provider, api_key)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                rpm, tpm = self.limits.get(provider, (0, 0))
+                limiter = _KeyLimiter(rpm, tpm)
+                self._limiters[key] = limiter
+            return limiter
+
+    def acquire(
+        self,
+        provider: str,
+        api_key: str,
+        tokens: int = 1,
+        priority: int = PRIORITY_INTERACTIVE,
+        deadline: Optional[Deadline] = None,
+    ) -> None:
+        """
+        Block until this request may be sent. Higher priority (lower number) waiters go first.
+        Raises DeadlineExceeded (giving up its place) if `deadline` passes first.
+        """
+        deadline = deadline or Deadline()
+        limiter = self._limiter(provider, api_key)
+        entry = (priority, next(self._seq))
+        started = time.monotonic()
+        with limiter.cond:
+            heapq.heappush(limiter.waiters, entry)
+            limiter.depth[priority] = limiter.depth.get(priority, 0) + 1
+            try:
+                while True:
+                    if limiter.waiters[0] == entry:
+                        now = time.monotonic()
+                        wait = limiter.wait_time(tokens, now)
+                        if wait <= 0:
+                            limiter.requests.consume(1, now)
+                            limiter.tokens.consume(tokens, now)
+                            heapq.heappop(limiter.waiters)
+                            limiter.admitted[priority] = limiter.admitted.get(priority, 0) + 1
+                            break
+                        deadline.check("ratelimit")
+                        limiter.cond.wait(timeout=deadline.timeout(wait))
+                    else:
+                        deadline.check("ratelimit")
+                        limiter.cond.wait(timeout=deadline.timeout())
+            finally:
+                if entry in limiter.waiters:
+                    limiter.waiters.remove(entry)
+                    heapq.heapify(limiter.waiters)
+                limiter.depth[priority] -= 1
+                limiter.wait_seconds += time.monotonic() - started
+                limiter.cond.notify_all()
+
+    def penalize(self, provider: str, api_key: str, seconds: float) -> None:
+        """Pause every request on this key for `seconds` (e.g. after a 429)."""
+        limiter = self._limiter(provider, api_key)
+        with limiter.cond:
+            now = time.monotonic()
+            limiter.requests.block(seconds, now)
+            limiter.tokens.block(seconds, now)
+            limiter.throttled += 1
+            limiter.cond.notify_all()
+
+    def backoff(self, attempt: int, hint: Optional[float]) -> float:
+        """Full-jitter exponential backoff, never shorter than the provider's retry-after hint."""
+        jittered = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        if hint is None:
+            return jittered
+        return hint + random.uniform(0, min(hint, self.base_backoff) * 0.5)
+
+    def call(
+        self,
+        provider: str,
+        api_key: str,
+        fn: Callable[[], Any],
+        tokens: int = 1,
+        priority: int = PRIORITY_INTERACTIVE,
+        deadline: Optional[Deadline] = None,
+    ) -> Any:
+        """
+        Run `fn` once admitted; retry rate-limited failures with shared, jittered backoff
+        (never past `deadline`).
+        """
+        attempt = 0
+        while True:
+            with span("ratelimit.wait", provider=provider, priority=PRIORITY_NAMES.get(priority, priority)):
+                self.acquire(provider, api_key, tokens, priority, deadline)
+            try:
+                return fn()
+            except Exception as exc:
+                retryable, hint = retry_after(exc)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, hint)
+                self.penalize(provider, api_key, delay)
+                self._limiter(provider, api_key).retries += 1
+                attempt += 1
+
+    def busy(self, priority: int = PRIORITY_BACKGROUND) -> bool:
+        """True while any request more urgent than `priority` is waiting for a slot."""
+        with self._lock:
+            limiters = list(self._limiters.values())
+        for limiter in limiters:
+            with limiter.cond:
+                if any(n for p, n in limiter.depth.items() if p < priority):
+                    return True
+        return False
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queue depth and admission counters per provider/key bucket."""
+        with self._lock:
+            items = list(self._limiters.items())
+        out: Dict[str, Dict[str, Any]] = {}
+        for key, limiter in items:
+            with limiter.cond:
+                out[key] = {
+                    "queue_depth": {PRIORITY_NAMES.get(p, str(p)): n for p, n in limiter.depth.items()},
+                    "admitted": {PRIORITY_NAMES.get(p, str(p)): n for p, n in limiter.admitted.items()},
+                    "throttled": limiter.throttled,
+                    "retries": limiter.retries,
+                    "wait_seconds": round(limiter.wait_seconds, 3),
+                }
+        return out
+
+    def _queue_depths(self) -> Dict[Tuple[str, ...], float]:
+        return {
+            (key, priority): depth
+            for key, stats in self.stats().items()
+            for priority, depth in stats["queue_depth"].items()
+        }
+
+
+_SCHEDULER: Optional[RequestScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler(cfg: Optional[Dict[str, Any]] = None) -> RequestScheduler:
+    """
+    Process-wide scheduler shared by every client. Limits can be tuned via config keys
+    `<provider>_rpm` / `<provider>_tpm` (e.g. `aibuddies config set claude_rpm 100`).
+    """
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = RequestScheduler()
+    if cfg:
+        for provider, (rpm, tpm) in DEFAULT_LIMITS.items():
+            try:
+                rpm = int(cfg.get(f"{provider}_rpm", rpm))
+                tpm = int(cfg.get(f"{provider}_tpm", tpm))
+            except (TypeError, ValueError):
+                continue
+            _SCHEDULER.configure(provider, rpm, tpm)
+    return _SCHEDULER
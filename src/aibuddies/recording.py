@@ -0,0 +1,217 @@
+"""
+Record/replay for LLM traffic.
+
+    aibuddies config set llm_record ~/.aibuddies/logs/traffic.jsonl.gz   # wrap the real client
+    aibuddies config set llm_replay ~/.aibuddies/logs/traffic.jsonl.gz   # serve recordings instead
+
+A recording is gzip-compressed JSON lines, one compact object per call:
+`{"ts","provider","model","buddy","key","system","user","reply","t","error"}`
+where `key` hashes the request (system + user text) and `t` is the provider
+latency in seconds. The file is appended to (one gzip member per process), so
+several runs can share it.
+
+`ReplayClient` answers an exact request match with its recorded reply and
+latency; anything else gets a recorded reply for the same buddy (or any buddy)
+with a latency drawn from the recorded distribution. `speed` scales the sleep
+(0 = no delay) for capacity tests against the rest of the runtime.
+"""
+import atexit
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .deadline import TIMEOUT_MARKER
+from .llm import AskOptions, LLMClient, Usage
+from .metrics import record_llm_call
+
+_ERROR_PREFIXES = ("[Claude error]", "[Claude agent error]", "[OpenAI error]", "[Local error]", TIMEOUT_MARKER)
+
+
+def request_key(persona_prompt: str, user_text: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(persona_prompt.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(user_text.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def is_error_reply(reply: str) -> bool:
+    return reply.startswith(_ERROR_PREFIXES)
+
+
+class _Recorder:
+    """One appending gzip stream per path, shared by every client in the process."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._fh = gzip.open(path, "ab")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._fh.closed:
+                return
+            self._fh.write(line)
+            self._fh.flush()  # sync flush: records survive a crash
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.close()
+
+
+_RECORDERS: Dict[Path, _Recorder] = {}
+_RECORDINGS: Dict[Tuple[Path, float], List[Dict[str, Any]]] = {}
+_REPLAYERS: Dict[Tuple[Path, float, float], "ReplayClient"] = {}
+_LOCK = threading.Lock()
+
+
+def _recorder(path: Path) -> _Recorder:
+    path = Path(path).expanduser().resolve()
+    with _LOCK:
+        rec = _RECORDERS.get(path)
+        if rec is None:
+            rec = _RECORDERS[path] = _Recorder(path)
+        return rec
+
+
+def close_recorders() -> None:
+    with _LOCK:
+        recorders = list(_RECORDERS.values())
+        _RECORDERS.clear()
+    for rec in recorders:
+        rec.close()
+
+
+atexit.register(close_recorders)
+
+
+def load_recording(path: Path) -> List[Dict[str, Any]]:
+    """Parse a recording (cached per path and mtime). A truncated trailing record is ignored."""
+    path = Path(path).expanduser().resolve()
+    key = (path, path.stat().st_mtime)
+    with _LOCK:
+        cached = _RECORDINGS.get(key)
+    if cached is not None:
+        return cached
+    records: List[Dict[str, Any]] = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    except (EOFError, OSError):
+        pass  # recorder still running or killed mid-write; keep what was complete
+    with _LOCK:
+        _RECORDINGS[key] = records
+    return records
+
+
+class RecordingClient(LLMClient):
+    """Pass-through wrapper that appends every call (request, reply, latency) to a recording."""
+
+    def __init__(self, inner: LLMClient, path: Path, model: str = "") -> None:
+        self.inner = inner
+        self.model = getattr(inner, "model", model) or model
+        self._recorder = _recorder(path)
+
+    @property
+    def last_usage(self) -> Optional[Usage]:  # type: ignore[override]
+        return self.inner.last_usage
+
+    @property
+    def on_box(self) -> bool:  # type: ignore[override]
+        return self.inner.on_box
+
+    def _record(self, buddy_name: str, persona_prompt: str, user_text: str, reply: str, seconds: float) -> None:
+        self._recorder.write({
+            "ts": round(time.time(), 3),
+            "provider": type(self.inner).__name__,
+            "model": self.model,
+            "buddy": buddy_name,
+            "key": request_key(persona_prompt, user_text),
+            "system": persona_prompt,
+            "user": user_text,
+            "reply": reply,
+            "t": round(seconds, 4),
+            "error": is_error_reply(reply),
+        })
+
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
+        started = time.perf_counter()
+        reply = self.inner.ask(buddy_name, persona_prompt, user_text, opts)
+        self._record(buddy_name, persona_prompt, user_text, reply, time.perf_counter() - started)
+        return reply
+
+    def stream(
+        self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None
+    ) -> Iterator[str]:
+        started = time.perf_counter()
+        chunks: List[str] = []
+        for chunk in self.inner.stream(buddy_name, persona_prompt, user_text, opts):
+            chunks.append(chunk)
+            yield chunk
+        self._record(buddy_name, persona_prompt, user_text, "".join(chunks), time.perf_counter() - started)
+
+
+class ReplayClient(LLMClient):
+    """Serve recorded replies with recorded latencies instead of calling a provider."""
+
+    def __init__(self, path: Path, speed: float = 1.0, seed: Optional[int] = None) -> None:
+        self.records = load_recording(path)
+        if not self.records:
+            raise RuntimeError(f"recording {path} is empty or unreadable")
+        self.speed = speed
+        self.model = "replay"
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_buddy: Dict[str, List[Dict[str, Any]]] = {}
+        for rec in self.records:
+            self._by_key.setdefault(rec.get("key", ""), []).append(rec)
+            self._by_buddy.setdefault(rec.get("buddy", ""), []).append(rec)
+        self.latencies = [float(rec.get("t", 0.0)) for rec in self.records]
+
+    def pick(self, buddy_name: str, persona_prompt: str, user_text: str) -> Tuple[Dict[str, Any], float]:
+        """Choose (record, latency) for a request."""
+        with self._rng_lock:
+            exact = self._by_key.get(request_key(persona_prompt, user_text))
+            if exact:
+                rec = self._rng.choice(exact)
+                return rec, float(rec.get("t", 0.0))
+            rec = self._rng.choice(self._by_buddy.get(buddy_name) or self.records)
+            return rec, self._rng.choice(self.latencies)
+
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
+        rec, latency = self.pick(buddy_name, persona_prompt, user_text)
+        delay = latency * self.speed
+        if delay > 0:
+            time.sleep(delay)
+        reply = rec.get("reply", "")
+        record_llm_call(
+            (opts or AskOptions()).metrics_buddy(buddy_name), "replay", rec.get("model", self.model), delay,
+            reply if rec.get("error") else None,
+        )
+        return reply
+
+
+def get_replay_client(path: Path, speed: float = 1.0) -> ReplayClient:
+    """Shared ReplayClient per recording, so per-turn client construction does not re-index it."""
+    path = Path(path).expanduser().resolve()
+    key = (path, path.stat().st_mtime, speed)
+    with _LOCK:
+        client = _REPLAYERS.get(key)
+    if client is None:
+        client = ReplayClient(path, speed=speed)
+        with _LOCK:
+            client = _REPLAYERS.setdefault(key, client)
+    return client
@@ -0,0 +1,248 @@
+"""
+Live buddy registry (replaces running.json).
+
+One SQLite row per running buddy in `~/.aibuddies/registry.db`:
+
+- `pid`        process doing the buddy's work (checked for liveness)
+- `owner_pid`  process that manages the buddy and honours stop requests
+               (the same process for `run`/`chat`; the supervisor for sharded workers)
+- `heartbeat_at`, `next_tick_at`, `queue_depth`, `cpu_time` refreshed by the owner
+
+Owners batch their rows into one UPDATE per heartbeat. Readers classify each row
+as `running`, `stale` (process alive but no heartbeat for `stale_after` seconds,
+i.e. hung) or `dead` (process gone), so `status` never reports a buddy whose
+process exited long ago. `request_stop` flags the row; the owner sees the flag
+on its next heartbeat, or immediately when it registered a SIGUSR1 handler.
+"""
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+HEARTBEAT_SECONDS = 5.0
+STALE_AFTER = 3 * HEARTBEAT_SECONDS
+STOP_SIGNAL = getattr(signal, "SIGUSR1", None)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buddies (
+    name TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    owner_pid INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    source TEXT NOT NULL,
+    worker INTEGER,
+    interval TEXT NOT NULL DEFAULT '',
+    schedule_len INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    next_tick_at REAL,
+    queue_depth INTEGER NOT NULL DEFAULT 0,
+    cpu_time REAL NOT NULL DEFAULT 0,
+    handles_signal INTEGER NOT NULL DEFAULT 0,
+    stop_requested INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+_COLUMNS = (
+    "name", "pid", "owner_pid", "host", "source", "worker", "interval", "schedule_len", "started_at",
+    "heartbeat_at", "next_tick_at", "queue_depth", "cpu_time", "handles_signal", "stop_requested",
+)
+
+
+def pid_alive(pid: int) -> Optional[bool]:
+    """True/False when it can be determined locally, None when it can't (e.g. Windows)."""
+    if pid <= 0:
+        return False
+    if sys.platform == "win32":
+        return None  # os.kill(pid, 0) would terminate the process there; rely on heartbeat age
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return None
+    return True
+
+
+@dataclass
+class Entry:
+    name: str
+    pid: int
+    owner_pid: int
+    host: str
+    source: str
+    worker: Optional[int]
+    interval: str
+    schedule_len: int
+    started_at: float
+    heartbeat_at: float
+    next_tick_at: Optional[float]
+    queue_depth: int
+    cpu_time: float
+    handles_signal: bool
+    stop_requested: bool
+    state: str = "running"
+
+    @property
+    def heartbeat_age(self) -> float:
+        return max(0.0, time.time() - self.heartbeat_at)
+
+
+class BuddyRegistry:
+    def __init__(self, path: Path, stale_after: float = STALE_AFTER) -> None:
+        self.path = Path(path)
+        self.stale_after = stale_after
+        self.host = socket.gethostname()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened lazily: commands that never touch the registry don't pay for it.
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- writers -----------------------------------------------------------
+
+    def register(
+        self,
+        name: str,
+        source: str,
+        interval: str = "",
+        schedule_len: int = 0,
+        pid: Optional[int] = None,
+        owner_pid: Optional[int] = None,
+        worker: Optional[int] = None,
+        handles_signal: bool = False,
+        next_tick_at: Optional[float] = None,
+    ) -> None:
+        now = time.time()
+        pid = pid or os.getpid()
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO buddies (name, pid, owner_pid, host, source, worker, interval, schedule_len,"
+                " started_at, heartbeat_at, next_tick_at, handles_signal) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                (name, pid, owner_pid or pid, self.host, source, worker, interval, schedule_len, now, now,
+                 next_tick_at, int(handles_signal)),
+            )
+
+    def heartbeat(self, rows: Iterable[Dict[str, Any]], owner_pid: Optional[int] = None) -> List[str]:
+        """
+        Refresh this owner's rows in one transaction. Each row needs `name` and may carry
+        `pid`, `next_tick_at`, `queue_depth`, `cpu_time`. Returns names with a pending stop request.
+        """
+        owner_pid = owner_pid or os.getpid()
+        now = time.time()
+        params = [
+            (r.get("pid"), now, r.get("next_tick_at"), int(r.get("queue_depth", 0)), float(r.get("cpu_time", 0.0)),
+             r["name"], owner_pid)
+            for r in rows
+        ]
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(
+                    "UPDATE buddies SET pid = COALESCE(?, pid), heartbeat_at = ?, next_tick_at = ?,"
+                    " queue_depth = ?, cpu_time = ? WHERE name = ? AND owner_pid = ?",
+                    params,
+                )
+                stops = [row[0] for row in db.execute(
+                    "SELECT name FROM buddies WHERE owner_pid = ? AND stop_requested = 1", (owner_pid,)
+                )]
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return stops
+
+    def unregister(self, name: str, owner_pid: Optional[int] = None) -> bool:
+        with self._lock:
+            if owner_pid is None:
+                cur = self._db().execute("DELETE FROM buddies WHERE name = ?", (name,))
+            else:
+                cur = self._db().execute("DELETE FROM buddies WHERE name = ? AND owner_pid = ?", (name, owner_pid))
+            return cur.rowcount > 0
+
+    def unregister_owner(self, owner_pid: Optional[int] = None) -> int:
+        with self._lock:
+            cur = self._db().execute("DELETE FROM buddies WHERE owner_pid = ?", (owner_pid or os.getpid(),))
+            return cur.rowcount
+
+    def request_stop(self, name: str) -> Optional[Entry]:
+        """
+        Ask the owning process to stop `name`. Dead entries are removed outright.
+        Returns the entry (with its state) or None if the buddy isn't registered.
+        """
+        entry = self.get(name)
+        if entry is None:
+            return None
+        if entry.state == "dead":
+            self.unregister(name)
+            return entry
+        with self._lock:
+            self._db().execute("UPDATE buddies SET stop_requested = 1 WHERE name = ?", (name,))
+        if entry.handles_signal and STOP_SIGNAL is not None and entry.host == self.host and entry.owner_pid != os.getpid():
+            try:
+                os.kill(entry.owner_pid, STOP_SIGNAL)
+            except OSError:
+                pass
+        return entry
+
+    def prune(self) -> List[str]:
+        """Delete rows whose process is gone. Returns their names."""
+        dead = [e.name for e in self.entries() if e.state == "dead"]
+        for name in dead:
+            self.unregister(name)
+        return dead
+
+    # --- readers -----------------------------------------------------------
+
+    def _entry(self, row: Any) -> Entry:
+        data = dict(zip(_COLUMNS, row))
+        data["handles_signal"] = bool(data["handles_signal"])
+        data["stop_requested"] = bool(data["stop_requested"])
+        entry = Entry(**data)
+        alive: Optional[bool] = None
+        if entry.host == self.host:
+            alive = pid_alive(entry.pid)
+            if alive and entry.owner_pid != entry.pid:
+                alive = pid_alive(entry.owner_pid)
+        if alive is False or (alive is None and entry.heartbeat_age > 4 * self.stale_after):
+            entry.state = "dead"
+        elif entry.heartbeat_age > self.stale_after:
+            entry.state = "stale"
+        elif entry.stop_requested:
+            entry.state = "stopping"
+        return entry
+
+    def get(self, name: str) -> Optional[Entry]:
+        with self._lock:
+            row = self._db().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM buddies WHERE name = ?", (name,)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def entries(self) -> List[Entry]:
+        with self._lock:
+            rows = self._db().execute(f"SELECT {', '.join(_COLUMNS)} FROM buddies ORDER BY name").fetchall()
+        return [self._entry(row) for row in rows]
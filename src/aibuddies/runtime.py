@@ -1,17 +1,36 @@
+import atexit
 import os
 import platform
 import shlex
 import shutil
+import signal
 import subprocess
 import sys
+import threading
 import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from .buddies import Buddy
-from .config import get_config, Paths, load_json, save_json
+from .clock import SYSTEM_CLOCK, Clock
+from .config import get_config, Paths
 from .context import gather_context
-from .llm import build_client
+from .deadline import (
+    CONTEXT_SHARE, TIMEOUT_MARKER, Deadline, DeadlineExceeded, call_with_deadline, iter_with_deadline, timed_out
+)
+from .docs import DocIndex
+from .llm import AskOptions, LLMClient, build_client
+from .local import LOCAL_PREFIX
+from .metrics import PRECOMPUTE, PROACTIVE_MESSAGES, QUEUE_DEPTH, SCHEDULER_LAG
+from .notify import DEFAULT_WINDOW, Coalescer, Digest, Notice, answer_digest
+from .precompute import DEFAULT_LEAD, PrecomputeCache, fingerprint, firing_ref, upcoming
+from .ratelimit import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED, get_scheduler
+from .recording import is_error_reply
+from .registry import HEARTBEAT_SECONDS, STOP_SIGNAL, BuddyRegistry, Entry
+from .tools import ToolCall, ToolEngine
+from .tracing import span
+from .usage import TokenPolicy, UsageLedger, split_usage
 
 
 class RuntimeManager:
@@ -25,16 +44,37 @@ class RuntimeManager:
     - Launch a new terminal window/tab to host the chat UX when a buddy starts.
     """
 
-    def __init__(self, paths: Optional[Paths] = None) -> None:
+    def __init__(
+        self,
+        paths: Optional[Paths] = None,
+        client_factory: Optional[Callable[[Dict[str, Any], str], LLMClient]] = None,
+        clock: Optional[Clock] = None,
+    ) -> None:
         self.running: Dict[str, Buddy] = {}
+        self.clock = clock or SYSTEM_CLOCK  # scheduler time; a VirtualClock replays days in seconds
         self.paths = paths or Paths()
+        self.client_factory = client_factory or build_client
         self.paths.ensure()
         self._scheduler_thread = None
         self._stop_scheduler = False
         self._last_tick: Dict[str, float] = {}
         self._message_queue: Dict[str, List[str]] = {}
         self._schedule_sent: Dict[str, Dict[str, str]] = {}  # buddy -> time_str -> yyyymmdd
-        self._running_state = self._load_running()
+        self.notifications = Coalescer(clock=self.clock.monotonic)  # proactive prompts wait here until the next digest
+        self.precomputed = PrecomputeCache()  # LLM replies for upcoming schedule entries
+        self._precompute_thread: Optional[threading.Thread] = None
+        self.tick_seconds = 60.0  # proactive_tick period of the scheduler loop
+        self._next_pass: Optional[float] = None  # wall time of the next proactive_tick pass
+        self.registry = BuddyRegistry(self.paths.registry_file)
+        self.docs = DocIndex(self.paths)
+        self.usage = TokenPolicy(UsageLedger(self.paths.usage_file))
+        # Asked before running tools with side effects when safety_rules.confirm_commands is on.
+        self.confirm_tool: Optional[Callable[[ToolCall], bool]] = None
+        self._registered: Dict[str, str] = {}  # buddies this process published -> source
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._heartbeat_wake = threading.Event()
+        self._handles_signal = False
+        QUEUE_DEPTH.add_source(self, "_queue_depths")
 
     def start(self, buddy: Buddy, every: Optional[str] = None, once: bool = False) -> str:
         self.running[buddy.name] = buddy
@@ -46,44 +86,198 @@ class RuntimeManager:
         return f"Started {buddy.name} with interval={mode}. {spawn_note}"
 
     def stop(self, name: str) -> bool:
-        if name in self.running:
-            self.running.pop(name)
-        removed = self._running_state.pop(name, None) is not None
-        self._save_running()
-        return name in self.running or removed
+        """Stop a buddy here, or ask the process that owns it (per the registry) to stop it."""
+        local = self.running.pop(name, None) is not None
+        if name in self._registered:
+            self._registered.pop(name)
+            self.registry.unregister(name)
+            return True
+        entry = self.registry.request_stop(name)
+        return local or entry is not None
+
+    def registered(self) -> List[str]:
+        """Names of every buddy in the live registry (any process)."""
+        return [e.name for e in self.registry.entries()]
 
     def status(self) -> Dict[str, str]:
-        # Combine in-process running and persisted running file
-        all_states = dict(self._running_state)
+        """Live state from the registry (heartbeats, pid liveness) plus unregistered in-process buddies."""
+        now = self.clock.time()
+        out = {name: self._format_entry(entry, now) for name, entry in ((e.name, e) for e in self.registry.entries())}
         for name, buddy in self.running.items():
-            all_states[name] = {
-                "interval": buddy.autorun_interval,
-                "schedule_len": len(buddy.schedule),
-                "source": "current",
-            }
-        return {
-            name: f"running (interval={info.get('interval')}, schedule={info.get('schedule_len')} entries, source={info.get('source')})"
-            for name, info in all_states.items()
-        }
+            if name not in out:
+                out[name] = (
+                    f"running (interval={buddy.autorun_interval}, schedule={len(buddy.schedule)} entries, "
+                    f"source=current, queue={len(self._message_queue.get(name, []))})"
+                )
+        return out
+
+    @staticmethod
+    def _format_entry(entry: Entry, now: float) -> str:
+        parts = [
+            f"interval={entry.interval}",
+            f"schedule={entry.schedule_len} entries",
+            f"source={entry.source}",
+        ]
+        if entry.worker is not None:
+            parts.append(f"worker={entry.worker}")
+        parts.append(f"pid={entry.pid}")
+        if entry.next_tick_at is not None and entry.state == "running":
+            parts.append(f"next tick in {_duration(entry.next_tick_at - now)}")
+        parts.append(f"queue={entry.queue_depth}")
+        if entry.cpu_time:
+            parts.append(f"cpu={entry.cpu_time:.2f}s")
+        parts.append(f"heartbeat {_duration(entry.heartbeat_age)} ago")
+        return f"{entry.state} ({', '.join(parts)})"
 
     def send_message(self, buddy_name: str, text: str) -> str:
         return f"[stub] sent message to {buddy_name}: {text}"
 
-    def ask(self, buddy_name: str, text: str) -> str:
-        buddy = self.running.get(buddy_name) or None
-        cfg = get_config(self.paths)
-        # If buddy not running, try to load from store? For now, require running.
-        if not buddy:
-            return f"{buddy_name} is not running. Start it with `aibuddies run --name {buddy_name}`."
-        client = build_client(cfg, buddy.model)
-        context = gather_context(buddy)
+    def _prepare(
+        self, buddy: Buddy, text: str, deadline: Optional[Deadline] = None
+    ) -> Tuple[LLMClient, str, str]:
+        """Build the client plus (system+persona, context+user text) payload for one turn."""
+        with span("config.get"):
+            cfg = get_config(self.paths)
+        model = self._model_for(buddy, cfg)
+        with span("llm.build_client", model=model):
+            client = self.client_factory(cfg, model)
+        with span("context.gather", sources=len(buddy.context_sources)):
+            context = gather_context(buddy, deadline.share(CONTEXT_SHARE) if deadline else None)
         context_block = ""
         if context:
             lines = [f"- {k}: {v}" for k, v in context.items()]
             context_block = "Context:\n" + "\n".join(lines) + "\n\n"
-        system_plus_persona = f"{buddy.system_prompt}\n\n{buddy.persona_prompt}"
-        user_payload = context_block + text
-        return client.ask(buddy_name, system_plus_persona, user_payload)
+        return client, self._stable_prefix(buddy, client.on_box), context_block + text
+
+    @staticmethod
+    def _model_for(buddy: Buddy, cfg: Dict[str, Any]) -> str:
+        """
+        The model every call for this buddy uses. That is the buddy's own model, unless
+        `local_for_private_docs` is on: then a buddy with docs it may not send to the cloud talks
+        to the local server (`local_model`) instead, so its docs can go in the prompt.
+        """
+        if (
+            _enabled(cfg.get("local_for_private_docs"))
+            and cfg.get("local_base_url")
+            and (buddy.docs_enabled or buddy.pinned_docs)
+            and not buddy.doc_privacy.get("allow_cloud_with_docs", False)
+            and not buddy.model.startswith(LOCAL_PREFIX)
+        ):
+            return LOCAL_PREFIX + (cfg.get("local_model") or "")
+        return buddy.model
+
+    def _stable_prefix(self, buddy: Buddy, on_box: bool = False) -> str:
+        """
+        System prompt, persona and pinned docs: identical bytes every turn so providers can
+        cache it. Per-turn context (window, clipboard, ...) must stay out of here.
+        """
+        prefix = f"{buddy.system_prompt}\n\n{buddy.persona_prompt}"
+        if not buddy.pinned_docs or not (on_box or buddy.doc_privacy.get("allow_cloud_with_docs", False)):
+            return prefix
+        sections = []
+        for filename in sorted(buddy.pinned_docs):
+            text = self.docs.read_text(buddy.name, filename)
+            if text is not None:
+                sections.append(f'<doc name="{filename}">\n{text}\n</doc>')
+        if sections:
+            prefix += "\n\nReference documents:\n" + "\n".join(sections)
+        return prefix
+
+    def ask(
+        self,
+        buddy_name: str,
+        text: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        site: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        One turn. `timeout` (seconds; default the buddy's `timeout`, 0 for none) bounds the whole
+        turn; when it runs out the reply is whatever was ready, marked with TIMEOUT_MARKER.
+        """
+        buddy = self.running.get(buddy_name) or None
+        # If buddy not running, try to load from store? For now, require running.
+        if not buddy:
+            return f"{buddy_name} is not running. Start it with `aibuddies run --name {buddy_name}`."
+        deadline = Deadline(buddy.timeout if timeout is None else timeout)
+        with span("runtime.ask", buddy=buddy_name, timeout=deadline.seconds):
+            client, system_plus_persona, user_payload = self._prepare(buddy, text, deadline)
+            site = site or self._call_site(buddy, priority, client.on_box)
+            opts = AskOptions(
+                priority=priority,
+                max_tokens=self.usage.max_tokens(buddy_name, site),
+                tools=self._tool_engine(buddy, client.on_box),
+                deadline=deadline,
+            )
+            started = time.perf_counter()
+            with span("llm.ask", client=type(client).__name__, max_tokens=opts.max_tokens):
+                try:
+                    reply = call_with_deadline(
+                        lambda: client.ask(buddy_name, system_plus_persona, user_payload, opts),
+                        deadline, "llm", buddy_name,
+                    )
+                except DeadlineExceeded:
+                    # Abandoned mid-turn: keep what the model wrote before the tool round it was stuck in.
+                    reply = timed_out(opts.partial, deadline)
+                else:
+                    if deadline.expired() and not reply.startswith(TIMEOUT_MARKER):
+                        # Came back out of time: an error the deadline caused, or a tool loop cut short.
+                        reply = timed_out("" if is_error_reply(reply) else reply, deadline)
+            self._record_usage(buddy, site, client, opts, time.perf_counter() - started, reply)
+            return reply
+
+    @staticmethod
+    def _call_site(buddy: Buddy, priority: int, on_box: bool = False) -> str:
+        """Usage-ledger call site: proactive check-ins, doc Q&A (docs reachable by the model) or chat."""
+        if priority >= PRIORITY_SCHEDULED:
+            return "proactive"
+        if buddy.docs_enabled and (on_box or buddy.doc_privacy.get("allow_cloud_with_docs", False)):
+            return "docs"
+        return "chat"
+
+    def _record_usage(
+        self, buddy: Buddy, site: str, client: LLMClient, opts: AskOptions, seconds: float, reply: str
+    ) -> None:
+        usage = client.last_usage
+        if usage is None:
+            return  # no provider call behind this client (dummy, replay)
+        model = getattr(client, "model", None) or buddy.model
+        self.usage.record(buddy.name, site, model, usage, opts.max_tokens, seconds, is_error_reply(reply))
+
+    def _tool_engine(self, buddy: Buddy, on_box: bool = False) -> Optional[ToolEngine]:
+        engine = ToolEngine(buddy, docs=self.docs, notify=self.enqueue, confirm=self.confirm_tool, on_box=on_box)
+        return engine if engine else None
+
+    def stream(
+        self,
+        buddy_name: str,
+        text: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        site: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[str]:
+        """Like ask(), but yields reply chunks as the provider streams them."""
+        buddy = self.running.get(buddy_name) or None
+        if not buddy:
+            yield f"{buddy_name} is not running. Start it with `aibuddies run --name {buddy_name}`."
+            return
+        deadline = Deadline(buddy.timeout if timeout is None else timeout)
+        client, system_plus_persona, user_payload = self._prepare(buddy, text, deadline)
+        site = site or self._call_site(buddy, priority, client.on_box)
+        opts = AskOptions(priority=priority, max_tokens=self.usage.max_tokens(buddy_name, site), deadline=deadline)
+        started = time.perf_counter()
+        chunks: List[str] = []
+        try:
+            for chunk in iter_with_deadline(
+                client.stream(buddy_name, system_plus_persona, user_payload, opts), deadline, "llm", buddy_name
+            ):
+                chunks.append(chunk)
+                yield chunk
+        except DeadlineExceeded:
+            note = timed_out("", deadline)
+            chunks.append(f"\n{note}" if chunks else note)
+            yield chunks[-1]
+        self._record_usage(buddy, site, client, opts, time.perf_counter() - started, "".join(chunks))
 
     def enqueue(self, buddy_name: str, message: str) -> None:
         self._message_queue.setdefault(buddy_name, []).append(message)
@@ -93,83 +287,274 @@ class RuntimeManager:
         self._message_queue[buddy_name] = []
         return msgs
 
+    def _queue_depths(self) -> Dict[Tuple[str, ...], float]:
+        return {(name,): len(msgs) for name, msgs in list(self._message_queue.items())}
+
     def proactive_tick(self) -> None:
         """
         Iterate running buddies and trigger proactive prompts based on interval.
         This is minimal: supports autorun_interval (manual/1m/5m/1h/2h/5h).
-        Cron-like strings are not implemented yet.
+        Cron-like strings are not implemented yet. Prompts are coalesced and delivered
+        as digests (see notify.py), not queued one by one.
         """
-        now = time.time()
-        today = time.strftime("%Y%m%d", time.localtime(now))
+        now = self.clock.time()
+        local = time.localtime(now)
+        today = time.strftime("%Y%m%d", local)
+        hhmm_now = time.strftime("%H:%M", local)
+        notices: List[Tuple[str, str, str, str]] = []
+        fired: List[Tuple[str, str]] = []  # (buddy, kind) label values, counted in one go
         for buddy in list(self.running.values()):
-            interval = buddy.autorun_interval
-            seconds = self._interval_to_seconds(interval)
-            if seconds is not None:
-                last = self._last_tick.get(buddy.name, 0)
-                if now - last >= seconds:
-                    prompt = "It's time to check in. Share a quick update or I'll suggest something."
-                    self.enqueue(buddy.name, prompt)
-                    self._last_tick[buddy.name] = now
+            seconds = _INTERVAL_SECONDS.get(buddy.autorun_interval)
+            if seconds is not None and now - self._last_tick.get(buddy.name, 0) >= seconds:
+                prompt = "It's time to check in. Share a quick update or I'll suggest something."
+                notices.append((buddy.name, prompt, "interval", ""))
+                fired.append((buddy.name, "interval"))
+                self._last_tick[buddy.name] = now
 
             # Fixed schedule entries HH:MM|text
             if buddy.schedule:
-                sent_map = self._schedule_sent.setdefault(buddy.name, {})
-                hhmm_now = time.strftime("%H:%M", time.localtime(now))
-                for entry in buddy.schedule:
-                    if "|" in entry:
-                        ts, msg = entry.split("|", 1)
+                msg = _schedule_slots(tuple(buddy.schedule)).get(hhmm_now)
+                if msg is not None:
+                    sent_map = self._schedule_sent.setdefault(buddy.name, {})
+                    if sent_map.get(hhmm_now, "") != today:
+                        notices.append((buddy.name, msg, "schedule", firing_ref(today, hhmm_now)))
+                        fired.append((buddy.name, "schedule"))
+                        sent_map[hhmm_now] = today
+        PROACTIVE_MESSAGES.inc_many(fired)
+        self.notifications.extend(notices)
+        cfg = get_config(self.paths)  # once per tick, shared by delivery and precompute
+        self.deliver_notifications(cfg=cfg)
+        self.precompute_upcoming(background=True, cfg=cfg)
+
+    def deliver_notifications(self, force: bool = False, cfg: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Move the pending digest onto the buddies' message queues if the coalescing window allows
+        (or `force`). With `proactive_llm` set, the digest is answered by the LLM in one request per
+        model instead of queuing the prompts themselves. Returns the number of buddies delivered to.
+        """
+        cfg = get_config(self.paths) if cfg is None else cfg
+        self.notifications.window = _seconds(cfg.get("notify_window"), DEFAULT_WINDOW)
+        digest = self.notifications.flush(force)
+        if not digest:
+            return 0
+        ready: Dict[str, List[str]] = {}
+        rest, replies = digest, {}
+        if _enabled(cfg.get("proactive_llm")):
+            ready, rest = self._take_precomputed(digest)
+            if rest:
+                replies = self._answer_digest(rest, cfg)
+        delivered = 0
+        for name in digest.notices:
+            if name in self.running:
+                for reply in ready.get(name, ()):
+                    self.enqueue(name, reply)
+                if name in rest.notices:
+                    self.enqueue(name, replies.get(name) or rest.message(name))
+                delivered += 1
+        return delivered
+
+    def _take_precomputed(self, digest: Digest) -> Tuple[Dict[str, List[str]], Digest]:
+        """
+        Replies generated ahead of time for the digest's schedule entries, per buddy, and the
+        digest of the notices still to answer (everything without a usable precomputed reply).
+        """
+        ready: Dict[str, List[str]] = {}
+        rest: Dict[str, List[Notice]] = {}
+        for name, notices in digest.notices.items():
+            buddy = self.running.get(name)
+            left = notices
+            if buddy is not None and any(n.ref for n in notices):
+                current = fingerprint(buddy, gather_context(buddy))
+                left = []
+                for notice in notices:
+                    reply = self.precomputed.take(name, notice.ref, current) if notice.ref else None
+                    if reply is None:
+                        left.append(notice)
                     else:
-                        ts, msg = entry, entry
-                    ts = ts.strip()
-                    if ts == hhmm_now:
-                        last_sent_date = sent_map.get(ts, "")
-                        if last_sent_date != today:
-                            self.enqueue(buddy.name, msg.strip())
-                            sent_map[ts] = today
+                        ready.setdefault(name, []).append(reply)
+            if left:
+                rest[name] = left
+        return ready, Digest(rest)
+
+    def precompute_upcoming(
+        self, now: Optional[float] = None, background: bool = False, cfg: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """
+        Generate LLM replies for schedule entries due within `precompute_lead` seconds (default 600)
+        when `proactive_llm` is on. Runs at background priority, and not at all while more urgent
+        requests are waiting for a rate-limit slot. Returns the number of buddies asked for.
+        """
+        cfg = get_config(self.paths) if cfg is None else cfg
+        lead = _seconds(cfg.get("precompute_lead"), DEFAULT_LEAD)
+        if lead <= 0 or not _enabled(cfg.get("proactive_llm")) or get_scheduler().busy(PRIORITY_BACKGROUND):
+            return 0
+        if self._precompute_thread is not None and self._precompute_thread.is_alive():
+            return 0
+        now = self.clock.time() if now is None else now
+        digest = Digest()
+        wanted: Dict[str, Tuple[str, str]] = {}  # buddy -> (ref, fingerprint)
+        for buddy in list(self.running.values()):
+            entries = upcoming(buddy, now, lead)
+            if not entries:
+                continue  # context is only gathered for buddies with an entry inside the lead window
+            fp = fingerprint(buddy, gather_context(buddy))
+            for _, ref, msg in entries:
+                if not self.precomputed.has(buddy.name, ref, fp):
+                    digest.notices[buddy.name] = [Notice(msg, "schedule", ref=ref)]
+                    wanted[buddy.name] = (ref, fp)
+                    break
+        if not digest:
+            return 0
+
+        def run() -> None:
+            for name, reply in self._answer_digest(digest, cfg, PRIORITY_BACKGROUND).items():
+                self.precomputed.put(name, *wanted[name], reply)
+                PRECOMPUTE.inc(outcome="generated")
+
+        if background:
+            self._precompute_thread = threading.Thread(target=run, daemon=True, name="aibuddies-precompute")
+            self._precompute_thread.start()
+        else:
+            run()
+        return len(wanted)
+
+    def _answer_digest(
+        self, digest: Digest, cfg: Dict[str, Any], priority: int = PRIORITY_SCHEDULED
+    ) -> Dict[str, str]:
+        by_model: Dict[str, List[Buddy]] = {}
+        for name in digest.notices:
+            buddy = self.running.get(name)
+            if buddy is not None:
+                by_model.setdefault(self._model_for(buddy, cfg), []).append(buddy)
+        replies: Dict[str, str] = {}
+        for model, buddies in by_model.items():
+            client = self.client_factory(cfg, model)
+            limits = {b.name: self.usage.max_tokens(b.name, "proactive") for b in buddies}
+            started = time.perf_counter()
+            with span("runtime.proactive_digest", model=model, buddies=len(buddies)):
+                answered = answer_digest(client, digest, buddies, sum(limits.values()), priority)
+            if client.last_usage is not None:
+                # One row per buddy, so each one's proactive history (and max_tokens) tracks its own replies.
+                seconds = time.perf_counter() - started
+                shares = {name: float(len(answered.get(name, ""))) for name in limits}
+                for name, share in split_usage(client.last_usage, shares).items():
+                    self.usage.record(name, "proactive", model, share, limits[name], seconds, name not in answered)
+            replies.update(answered)
+        return replies
 
     @staticmethod
     def _interval_to_seconds(interval: str) -> Optional[int]:
-        mapping = {
-            "1m": 60,
-            "2m": 120,
-            "5m": 300,
-            "1h": 3600,
-            "2h": 7200,
-            "5h": 18000,
-        }
-        return mapping.get(interval)
+        return _INTERVAL_SECONDS.get(interval)
+
+    def run_scheduler(self, until: Optional[float] = None) -> int:
+        """
+        The scheduler loop: a proactive_tick every `tick_seconds` of `self.clock`, until stopped or
+        (if given) until the clock's wall time reaches `until`. Returns the number of passes.
+        """
+        clock = self.clock
+        due = clock.monotonic()
+        passes = 0
+        while not self._stop_scheduler and (until is None or clock.time() < until):
+            SCHEDULER_LAG.observe(max(0.0, clock.monotonic() - due))
+            try:
+                self.proactive_tick()
+            finally:
+                passes += 1
+                due += self.tick_seconds
+                self._next_pass = clock.time() + max(0.0, due - clock.monotonic())
+                clock.sleep(max(0.0, due - clock.monotonic()))
+        return passes
 
     def _ensure_scheduler(self) -> None:
         if self._scheduler_thread:
             return
-        import threading
+        self._scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
+        self._scheduler_thread.start()
 
-        def loop() -> None:
-            while not self._stop_scheduler:
-                try:
-                    self.proactive_tick()
-                finally:
-                    time.sleep(60)  # check every minute
+    def next_tick_at(self, buddy: Buddy, now: Optional[float] = None) -> Optional[float]:
+        """Wall time of the buddy's next proactive message, aligned to the scheduler's passes."""
+        now = self.clock.time() if now is None else now
+        candidates = []
+        seconds = self._interval_to_seconds(buddy.autorun_interval)
+        if seconds is not None:
+            candidates.append(self._last_tick.get(buddy.name, 0) + seconds)
+        for entry in buddy.schedule:
+            ts = entry.split("|", 1)[0].strip()
+            try:
+                hh, mm = (int(x) for x in ts.split(":", 1))
+            except ValueError:
+                continue
+            local = time.localtime(now)
+            at = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, hh, mm, 0, 0, 0, -1))
+            if at + 60 <= now:
+                at = time.mktime((local.tm_year, local.tm_mon, local.tm_mday + 1, hh, mm, 0, 0, 0, -1))
+            candidates.append(at)
+        if not candidates:
+            return None
+        due = max(now, min(candidates))
+        if self._next_pass is None:
+            return due
+        # Entries only fire on a scheduler pass.
+        passes = max(0.0, -(-(due - self._next_pass) // self.tick_seconds))
+        return self._next_pass + passes * self.tick_seconds
 
-        self._scheduler_thread = threading.Thread(target=loop, daemon=True)
-        self._scheduler_thread.start()
+    def _mark_running(self, buddy: Buddy, source: str) -> None:
+        """Publish `buddy` in the live registry and keep it fresh with heartbeats from this process."""
+        self._ensure_heartbeat()
+        self.registry.register(
+            buddy.name,
+            source,
+            interval=buddy.autorun_interval,
+            schedule_len=len(buddy.schedule),
+            handles_signal=self._handles_signal,
+            next_tick_at=self.next_tick_at(buddy),
+        )
+        self._registered[buddy.name] = source
 
-    def _load_running(self) -> Dict[str, Dict[str, str]]:
-        data = load_json(self.paths.running_file)
-        return data.get("running", {})
+    def heartbeat(self) -> List[str]:
+        """Refresh this process's registry rows; apply pending stop requests. Returns stopped names."""
+        now = self.clock.time()
+        rows = []
+        for name in list(self._registered):
+            buddy = self.running.get(name)
+            rows.append({
+                "name": name,
+                "next_tick_at": self.next_tick_at(buddy, now) if buddy else None,
+                "queue_depth": len(self._message_queue.get(name, [])),
+            })
+        stopped = []
+        for name in self.registry.heartbeat(rows):
+            self.running.pop(name, None)
+            self._registered.pop(name, None)
+            self.registry.unregister(name, os.getpid())
+            stopped.append(name)
+        return stopped
 
-    def _save_running(self) -> None:
-        save_json(self.paths.running_file, {"running": self._running_state})
+    def _ensure_heartbeat(self) -> None:
+        if self._heartbeat_thread:
+            return
+        if STOP_SIGNAL is not None and threading.current_thread() is threading.main_thread():
+            # Wake the heartbeat thread as soon as another process asks us to stop a buddy.
+            signal.signal(STOP_SIGNAL, lambda signum, frame: self._heartbeat_wake.set())
+            self._handles_signal = True
 
-    def _mark_running(self, buddy: Buddy, source: str) -> None:
-        self._running_state[buddy.name] = {
-            "interval": buddy.autorun_interval,
-            "schedule_len": len(buddy.schedule),
-            "source": source,
-            "pid": str(os.getpid()),
-            "started_at": str(time.time()),
-        }
-        self._save_running()
+        def loop() -> None:
+            while True:
+                self._heartbeat_wake.wait(HEARTBEAT_SECONDS)
+                self._heartbeat_wake.clear()
+                try:
+                    self.heartbeat()
+                except Exception:
+                    pass  # registry busy/locked; retry next beat
+
+        self._heartbeat_thread = threading.Thread(target=loop, daemon=True, name="aibuddies-heartbeat")
+        self._heartbeat_thread.start()
+        atexit.register(self._unregister_all)
+
+    def _unregister_all(self) -> None:
+        if self._registered:
+            self.registry.unregister_owner()
+            self._registered.clear()
 
     def _open_chat_window(self, buddy_name: str) -> str:
         """
@@ -234,3 +619,43 @@ class RuntimeManager:
                 pass
 
         return f"Could not auto-open terminal. Run this in another window: {chat_cmd}"
+
+
+_INTERVAL_SECONDS = {
+    "1m": 60,
+    "2m": 120,
+    "5m": 300,
+    "1h": 3600,
+    "2h": 7200,
+    "5h": 18000,
+}
+
+
+@lru_cache(maxsize=4096)
+def _schedule_slots(schedule: Tuple[str, ...]) -> Dict[str, str]:
+    """HH:MM -> message of a schedule (`HH:MM|text` entries; the first entry for a time wins)."""
+    slots: Dict[str, str] = {}
+    for entry in schedule:
+        ts, msg = entry.split("|", 1) if "|" in entry else (entry, entry)
+        slots.setdefault(ts.strip(), msg.strip())
+    return slots
+
+
+def _seconds(value: Any, default: float) -> float:
+    try:
+        return float(value) if value not in (None, "") else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _enabled(value: Any) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _duration(seconds: float) -> str:
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
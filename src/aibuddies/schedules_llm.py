@@ -1,41 +1,152 @@
+import json
 import re
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
 from .buddies import Buddy
 from .config import get_config
-from .llm import build_client
+from .llm import AskOptions, LLMClient, build_client
+from .ratelimit import PRIORITY_BACKGROUND
 
+MAX_ENTRIES = 6
 
-def generate_schedule(buddy: Buddy) -> List[str]:
+_LINE_RE = re.compile(r"^\s*(?:[-*]\s*)?(\d{1,2}):(\d{2})\s*[|-]\s*(.+?)\s*$")
+_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+_SINGLE_PROMPT = (
+    "Generate a concise daily schedule for this buddy. "
+    "Output 3-6 lines, format HH:MM|Message, 24h time, local day cadence. "
+    "Keep messages short and actionable. No extra text."
+)
+
+_BATCH_PERSONA = "You plan daily check-in schedules for several AI buddies at once."
+
+_BATCH_PROMPT = (
+    "For each buddy below, generate a concise daily schedule of 3-6 entries, "
+    "format HH:MM|Message, 24h time, local day cadence, short actionable messages. "
+    "Reply with a single JSON object mapping each buddy name to a list of entry strings, "
+    'e.g. {"GymCoach": ["06:00|Wake up and stretch"]}. No extra text.\n\nBuddies:\n'
+)
+
+
+def normalize_entry(line: str) -> Optional[str]:
+    """Validate one HH:MM|Message line and normalize it; returns None if it is not a valid entry."""
+    m = _LINE_RE.match(line)
+    if not m:
+        return None
+    hh, mm, msg = int(m.group(1)), int(m.group(2)), m.group(3).strip()
+    if hh > 23 or mm > 59 or not msg:
+        return None
+    return f"{hh:02d}:{mm:02d}|{msg}"
+
+
+def parse_schedule(raw: Any) -> List[str]:
+    """Parse an LLM reply (text lines or a JSON list) into at most MAX_ENTRIES normalized entries."""
+    lines = raw if isinstance(raw, list) else str(raw).splitlines()
+    schedule: List[str] = []
+    for ln in lines:
+        entry = normalize_entry(str(ln))
+        if entry:
+            schedule.append(entry)
+        if len(schedule) >= MAX_ENTRIES:
+            break
+    return schedule
+
+
+def parse_batch_reply(raw: str, names: List[str]) -> Dict[str, List[str]]:
+    """
+    Parse a batched reply into {buddy name: schedule}. Buddies whose schedule is
+    missing or invalid are left out so the caller can retry just those.
+    """
+    m = _JSON_RE.search(raw or "")
+    if not m:
+        return {}
+    try:
+        data = json.loads(m.group(0))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    by_lower = {str(k).strip().lower(): v for k, v in data.items()}
+    out: Dict[str, List[str]] = {}
+    for name in names:
+        schedule = parse_schedule(by_lower.get(name.lower()) or [])
+        if schedule:
+            out[name] = schedule
+    return out
+
+
+def generate_schedule(buddy: Buddy, cfg: Optional[Dict[str, Any]] = None, client: Optional[LLMClient] = None) -> List[str]:
     """
     Ask the LLM to propose a daily schedule (HH:MM|Message).
     Returns empty list if AI call fails or no API key configured.
     """
-    cfg = get_config()
-    client = build_client(cfg, buddy.model)
-    prompt = (
-        "Generate a concise daily schedule for this buddy. "
-        "Output 3-6 lines, format HH:MM|Message, 24h time, local day cadence. "
-        "Keep messages short and actionable. No extra text."
-    )
+    cfg = cfg if cfg is not None else get_config()
+    client = client or build_client(cfg, buddy.model)
     try:
-        raw = client.ask(buddy.name, buddy.persona_prompt, prompt)
+        raw = client.ask(buddy.name, buddy.persona_prompt, _SINGLE_PROMPT, AskOptions(priority=PRIORITY_BACKGROUND))
     except Exception:
         return []
-    lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
-    schedule: List[str] = []
-    pattern = re.compile(r"^(\d{1,2}:\d{2})\s*[|-]\s*(.+)$")
-    for ln in lines:
-        m = pattern.match(ln)
-        if m:
-            hhmm = m.group(1)
-            # normalize HH:MM
-            parts = hhmm.split(":")
-            hh = int(parts[0]) if parts and parts[0].isdigit() else 0
-            mm = parts[1]
-            hhmm_norm = f"{hh:02d}:{mm}"
-            msg = m.group(2).strip()
-            schedule.append(f"{hhmm_norm}|{msg}")
-        if len(schedule) >= 6:
-            break
-    return schedule
+    return parse_schedule(raw)
+
+
+def _ask_batch(client: LLMClient, buddies: List[Buddy]) -> Dict[str, List[str]]:
+    listing = "\n".join(f"- {b.name}: {b.persona_prompt.strip()}" for b in buddies)
+    opts = AskOptions(priority=PRIORITY_BACKGROUND, max_tokens=min(4096, 160 * len(buddies)))
+    try:
+        raw = client.ask("schedule-batch", _BATCH_PERSONA, _BATCH_PROMPT + listing, opts)
+    except Exception:
+        return {}
+    return parse_batch_reply(raw, [b.name for b in buddies])
+
+
+def generate_schedules(
+    buddies: List[Buddy],
+    batch_size: int = 10,
+    workers: int = 4,
+    retries: int = 2,
+    cfg: Optional[Dict[str, Any]] = None,
+) -> Dict[str, List[str]]:
+    """
+    Generate schedules for many buddies with a few batched LLM requests run concurrently.
+
+    Buddies are grouped by model (one client per model), split into batches of
+    `batch_size` personas, and each batch asks for a JSON object of schedules.
+    Buddies missing from a reply are retried in smaller batches, ending with
+    single-buddy requests. Returns {name: schedule} for every buddy that succeeded.
+    """
+    cfg = cfg if cfg is not None else get_config()
+    clients: Dict[str, LLMClient] = {}
+    for b in buddies:
+        if b.model not in clients:
+            clients[b.model] = build_client(cfg, b.model)
+
+    results: Dict[str, List[str]] = {}
+    pending = list(buddies)
+    size = max(1, batch_size)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            by_model: Dict[str, List[Buddy]] = {}
+            for b in pending:
+                by_model.setdefault(b.model, []).append(b)
+            futures = []
+            for model, group in by_model.items():
+                for i in range(0, len(group), size):
+                    batch = group[i:i + size]
+                    if len(batch) == 1:
+                        fut = pool.submit(
+                            lambda b=batch[0], c=clients[model]: {b.name: generate_schedule(b, cfg, c)}
+                        )
+                    else:
+                        fut = pool.submit(_ask_batch, clients[model], batch)
+                    futures.append(fut)
+            for fut in futures:
+                for name, schedule in fut.result().items():
+                    if schedule:
+                        results[name] = schedule
+            pending = [b for b in pending if b.name not in results]
+            # Retry only the failures, in smaller batches each round.
+            size = 1 if attempt + 1 >= retries else max(1, size // 2)
+    return results
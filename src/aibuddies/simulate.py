@@ -0,0 +1,253 @@
+"""
+Virtual-time simulation of the proactive scheduler.
+
+`simulate` runs the real scheduler loop (`RuntimeManager.run_scheduler`) on a
+`VirtualClock`, so a week of interval and schedule firings for thousands of
+buddies replays in seconds. Every notice a tick produces is recorded and
+compared with what the buddies' settings say should happen:
+
+- fire counts per kind (interval, schedule) against the expected counts;
+- schedule drift: how long after its HH:MM each entry fired;
+- interval drift: how far consecutive interval fires are from the period;
+- missed entries: schedule firings in the window that never fired (and duplicates).
+
+Providers are replaced by DummyLLM, delivered messages are counted rather than
+queued, and runtime state lives in a scratch directory, so nothing leaves the
+process or touches ~/.aibuddies. `lag` models a slow pass: each proactive_tick
+takes that many virtual seconds. The `scheduler_sim` benchmark uses the same
+driver.
+"""
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .buddies import Buddy
+from .clock import VirtualClock
+from .config import Paths
+from .llm import DummyLLM
+from .notify import Coalescer
+from .precompute import firing_ref
+from .runtime import RuntimeManager
+from .usage import percentile
+
+DAY = 86400.0
+INTERVALS = ("manual", "1h", "2h", "5h")
+
+
+@dataclass
+class SimulationReport:
+    buddies: int
+    start: float
+    end: float
+    passes: int = 0
+    wall_seconds: float = 0.0
+    delivered: int = 0  # messages that reached a buddy's queue (digests count once per buddy)
+    interval_fires: int = 0
+    expected_interval: int = 0
+    schedule_fires: int = 0
+    expected_schedule: int = 0
+    missed: List[str] = field(default_factory=list)  # buddy@yyyymmdd:HH:MM
+    duplicates: List[str] = field(default_factory=list)
+    schedule_drift: Dict[str, float] = field(default_factory=dict)  # p50/p95/max seconds late
+    interval_drift: float = 0.0  # max |gap between fires - period|, seconds
+
+    @property
+    def buddy_ticks_per_second(self) -> float:
+        return self.passes * self.buddies / self.wall_seconds if self.wall_seconds else 0.0
+
+    def problems(self, max_drift: float = 60.0) -> List[str]:
+        """Everything that deviates from the buddies' settings (empty when the run was clean)."""
+        out = []
+        if self.missed:
+            out.append(f"{len(self.missed)} schedule entries never fired (e.g. {', '.join(self.missed[:3])})")
+        if self.duplicates:
+            out.append(f"{len(self.duplicates)} schedule entries fired more than once (e.g. {self.duplicates[0]})")
+        if self.interval_fires < self.expected_interval:
+            out.append(f"{self.expected_interval - self.interval_fires} interval check-ins missing")
+        if self.schedule_drift.get("max", 0.0) > max_drift:
+            out.append(f"schedule drift up to {self.schedule_drift['max']:.0f}s (limit {max_drift:g}s)")
+        if self.interval_drift > max_drift:
+            out.append(f"interval drift up to {self.interval_drift:.0f}s (limit {max_drift:g}s)")
+        return out
+
+    def format(self, max_drift: float = 60.0) -> str:
+        drift = self.schedule_drift
+        lines = [
+            f"Simulated {(self.end - self.start) / DAY:g} day(s) for {self.buddies} buddies: {self.passes} passes "
+            f"in {self.wall_seconds:.2f}s ({self.buddy_ticks_per_second:,.0f} buddy-ticks/s)",
+            f"  interval check-ins {self.interval_fires}/{self.expected_interval}, "
+            f"schedule entries {self.schedule_fires}/{self.expected_schedule}, delivered {self.delivered}",
+            f"  schedule drift p50 {drift.get('p50', 0):.0f}s p95 {drift.get('p95', 0):.0f}s max {drift.get('max', 0):.0f}s, "
+            f"interval drift max {self.interval_drift:.0f}s",
+        ]
+        problems = self.problems(max_drift)
+        lines.extend(f"  PROBLEM: {p}" for p in problems)
+        if not problems:
+            lines.append("  OK: every entry fired on time")
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = dict(self.__dict__)
+        out["buddy_ticks_per_second"] = round(self.buddy_ticks_per_second, 1)
+        return out
+
+
+class _RecordingCoalescer(Coalescer):
+    """Coalescer that also notes when each notice was raised (wall time of the virtual clock)."""
+
+    def __init__(self, clock: VirtualClock) -> None:
+        super().__init__(clock=clock.monotonic)
+        self.wall = clock.time
+        self.fires: List[Tuple[float, str, str, str]] = []  # (time, buddy, kind, ref)
+
+    def extend(self, items: Iterable[Tuple[str, str, str, str]]) -> int:
+        items = list(items)
+        now = self.wall()
+        self.fires.extend((now, buddy, kind, ref) for buddy, _, kind, ref in items)
+        return super().extend(items)
+
+
+def _entries(buddy: Buddy) -> List[Tuple[str, int, int]]:
+    """(HH:MM as written, hour, minute) of the buddy's schedule entries."""
+    out = []
+    for entry in buddy.schedule:
+        ts = entry.split("|", 1)[0].strip()
+        try:
+            hh, mm = (int(x) for x in ts.split(":", 1))
+        except ValueError:
+            continue
+        if 0 <= hh < 24 and 0 <= mm < 60:
+            out.append((ts, hh, mm))
+    return out
+
+
+def _at(day: time.struct_time, hh: int, mm: int) -> float:
+    return time.mktime((day.tm_year, day.tm_mon, day.tm_mday, hh, mm, 0, 0, 0, -1))
+
+
+def expected_firings(buddy: Buddy, start: float, end: float) -> Dict[str, float]:
+    """Schedule firing ref -> local time it is due, for every entry due in [start, end)."""
+    out: Dict[str, float] = {}
+    entries = _entries(buddy)
+    if not entries:
+        return out
+    first = time.localtime(start)
+    days = int((end - start) // DAY) + 2
+    for n in range(days):
+        day = time.localtime(time.mktime((first.tm_year, first.tm_mon, first.tm_mday + n, 12, 0, 0, 0, 0, -1)))
+        stamp = time.strftime("%Y%m%d", day)
+        for ts, hh, mm in entries:
+            at = _at(day, hh, mm)
+            if start <= at < end:
+                out[firing_ref(stamp, ts)] = at
+    return out
+
+
+def synthetic_buddies(n: int, seed: int = 0) -> List[Buddy]:
+    """`n` buddies with a mix of intervals and 0-6 daily schedule entries."""
+    rng = random.Random(seed)
+    buddies = []
+    for i in range(n):
+        times = sorted({f"{rng.randrange(6, 23):02d}:{rng.choice((0, 15, 30, 45)):02d}" for _ in range(rng.randrange(7))})
+        buddies.append(Buddy(
+            name=f"Sim{i:05d}",
+            persona_prompt=f"Simulated buddy {i}.",
+            autorun_interval=rng.choice(INTERVALS),
+            schedule=[f"{t}|Check-in at {t}" for t in times],
+            tools_allowed=[],
+        ))
+    return buddies
+
+
+def simulate(
+    buddies: List[Buddy],
+    days: float = 7.0,
+    start: Optional[float] = None,
+    tick_seconds: float = 60.0,
+    lag: float = 0.0,
+    home: Optional[Path] = None,
+) -> SimulationReport:
+    """
+    Run the scheduler over `days` of virtual time from `start` (default: the coming local
+    midnight) and report fire counts, drift and missed entries.
+    """
+    if start is None:
+        now = time.localtime()
+        start = time.mktime((now.tm_year, now.tm_mon, now.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+    end = start + days * DAY
+    clock = VirtualClock(start)
+    scratch = None
+    if home is None:
+        scratch = tempfile.TemporaryDirectory(prefix="aibuddies-sim-")
+        home = Path(scratch.name)
+    runtime = RuntimeManager(
+        Paths(home=home), client_factory=lambda cfg, model: DummyLLM("simulation"), clock=clock
+    )
+    report = SimulationReport(buddies=len(buddies), start=start, end=end)
+    try:
+        runtime.tick_seconds = tick_seconds
+        recorder = runtime.notifications = _RecordingCoalescer(clock)
+        for buddy in buddies:
+            runtime.running[buddy.name] = buddy
+
+        def enqueue(name: str, message: str) -> None:
+            report.delivered += 1
+
+        tick = runtime.proactive_tick
+
+        def slow_tick() -> None:
+            tick()
+            clock.advance(lag)
+
+        runtime.enqueue = enqueue  # type: ignore[assignment]
+        if lag:
+            runtime.proactive_tick = slow_tick  # type: ignore[assignment]
+        started = time.perf_counter()
+        report.passes = runtime.run_scheduler(until=end)
+        report.wall_seconds = time.perf_counter() - started
+    finally:
+        runtime.usage.ledger.close()
+        runtime.registry.close()
+        if scratch is not None:
+            scratch.cleanup()
+    _score(report, buddies, recorder.fires)
+    return report
+
+
+def _score(report: SimulationReport, buddies: List[Buddy], fires: List[Tuple[float, str, str, str]]) -> None:
+    periods = {b.name: RuntimeManager._interval_to_seconds(b.autorun_interval) for b in buddies}
+    last_interval: Dict[str, float] = {}
+    fired: Dict[Tuple[str, str], int] = {}
+    fired_at: Dict[Tuple[str, str], float] = {}
+    for at, buddy, kind, ref in fires:
+        if kind == "interval":
+            report.interval_fires += 1
+            previous = last_interval.get(buddy)
+            if previous is not None:
+                report.interval_drift = max(report.interval_drift, abs(at - previous - periods[buddy]))
+            last_interval[buddy] = at
+        elif kind == "schedule":
+            report.schedule_fires += 1
+            fired[(buddy, ref)] = fired.get((buddy, ref), 0) + 1
+            fired_at.setdefault((buddy, ref), at)
+    drifts = []
+    for buddy in buddies:
+        period = periods[buddy.name]
+        if period:
+            report.expected_interval += int(-(-(report.end - report.start) // period))
+        for ref, due in sorted(expected_firings(buddy, report.start, report.end).items()):
+            report.expected_schedule += 1
+            key = (buddy.name, ref)
+            if key not in fired:
+                report.missed.append(f"{buddy.name}@{ref}")
+                continue
+            drifts.append(fired_at[key] - due)
+            if fired[key] > 1:
+                report.duplicates.append(f"{buddy.name}@{ref}")
+    drifts.sort()
+    report.schedule_drift = {
+        "p50": percentile(drifts, 0.50), "p95": percentile(drifts, 0.95), "max": drifts[-1] if drifts else 0.0
+    }
@@ -0,0 +1,421 @@
+"""
+Multi-process buddy runtime.
+
+The supervisor shards running buddies across a pool of worker processes so
+CPU-bound per-buddy work (context collection, redaction, prompt assembly) is
+not serialized by one interpreter's GIL. Buddies are placed with a consistent
+hash ring, so adding/losing a worker only moves the buddies that hashed to it.
+
+Each worker hosts a RuntimeManager for its shard, runs the proactive tick,
+answers ask requests and reports per-buddy queue depth and CPU time. Crashed
+workers are restarted in place, so their buddies move straight to the
+replacement. Each worker reports its buddies' scheduler state (last interval
+tick, schedule entries sent today) with its stats, and a moved buddy starts
+from that state on its new worker, so a restart does not fire check-ins twice.
+
+Workers also send a snapshot of their metrics registry with every report. The
+supervisor adds these to its own registry, so its /metrics endpoint covers the
+LLM requests, tokens, queue depths and ticks of the whole pool. Counts from a
+worker that died are kept.
+"""
+import bisect
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .buddies import Buddy
+from .config import Paths
+from .metrics import REGISTRY, Snapshot, merge_snapshots
+from .runtime import RuntimeManager
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes."""
+
+    def __init__(self, nodes: Optional[List[int]] = None, vnodes: int = 64) -> None:
+        self.vnodes = vnodes
+        self._keys: List[int] = []
+        self._owners: Dict[int, int] = {}
+        for node in nodes or []:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+    def add(self, node: int) -> None:
+        for i in range(self.vnodes):
+            h = self._hash(f"worker-{node}#{i}")
+            if h not in self._owners:
+                bisect.insort(self._keys, h)
+            self._owners[h] = node
+
+    def remove(self, node: int) -> None:
+        for i in range(self.vnodes):
+            h = self._hash(f"worker-{node}#{i}")
+            if self._owners.get(h) == node:
+                del self._owners[h]
+                self._keys.pop(bisect.bisect_left(self._keys, h))
+
+    def nodes(self) -> List[int]:
+        return sorted(set(self._owners.values()))
+
+    def node_for(self, key: str) -> Optional[int]:
+        if not self._keys:
+            return None
+        idx = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._owners[self._keys[idx]]
+
+
+def _worker_main(worker_id: int, home: str, inbox: Any, conn: Any, tick_seconds: float, report_seconds: float) -> None:
+    """Worker process loop: host a shard of buddies, tick them, answer asks, report stats."""
+    runtime = RuntimeManager(Paths(home=Path(home)))
+    runtime.tick_seconds = tick_seconds
+    cpu: Dict[str, float] = {}
+    pending: Dict[str, int] = {}
+    lock = threading.Lock()
+    send_lock = threading.Lock()
+
+    def send(msg: Tuple[Any, ...]) -> None:
+        with send_lock:
+            conn.send(msg)
+    # Asks spend most of their time waiting on the network; overlap them within the shard.
+    asks = ThreadPoolExecutor(max_workers=4)
+
+    def answer(req_id: str, name: str, text: str) -> None:
+        started = time.thread_time()
+        try:
+            reply = runtime.ask(name, text)
+        except Exception as e:
+            reply = f"[worker error] {e}"
+        with lock:
+            pending[name] -= 1
+            cpu[name] = cpu.get(name, 0.0) + time.thread_time() - started
+        send(("reply", req_id, reply))
+
+    next_tick = time.monotonic()
+    next_report = 0.0
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_tick and runtime.running:
+                started = time.thread_time()
+                runtime.proactive_tick()
+                share = (time.thread_time() - started) / len(runtime.running)
+                for name in runtime.running:
+                    with lock:
+                        cpu[name] = cpu.get(name, 0.0) + share
+                    for msg in runtime.drain_queue(name):
+                        send(("message", worker_id, name, msg))
+                next_tick = now + tick_seconds
+                next_report = now  # report the new scheduler state right away
+            if now >= next_report:
+                runtime._next_pass = time.time() + max(0.0, next_tick - now)
+                with lock:
+                    report = {
+                        name: {
+                            "queue_depth": pending.get(name, 0) + len(runtime._message_queue.get(name, [])),
+                            "cpu_time": round(cpu.get(name, 0.0), 4),
+                            "next_tick_at": runtime.next_tick_at(buddy),
+                        }
+                        for name, buddy in runtime.running.items()
+                    }
+                state = {
+                    name: {
+                        "last_tick": runtime._last_tick.get(name),
+                        "schedule_sent": dict(runtime._schedule_sent.get(name, {})),
+                    }
+                    for name in runtime.running
+                }
+                send(("stats", worker_id, os.getpid(), report, state))
+                send(("metrics", worker_id, REGISTRY.snapshot()))
+                next_report = now + report_seconds
+            wait = report_seconds
+            if runtime.running:
+                wait = min(wait, max(0.01, next_tick - time.monotonic()))
+            try:
+                msg = inbox.get(timeout=wait)
+            except queue.Empty:
+                continue
+            kind = msg[0]
+            if kind == "shutdown":
+                return
+            if kind == "start":
+                buddy = Buddy.from_dict(msg[1])
+                runtime.running[buddy.name] = buddy
+                state = msg[2] or {}
+                if state.get("last_tick") is not None:
+                    runtime._last_tick[buddy.name] = state["last_tick"]
+                if state.get("schedule_sent"):
+                    runtime._schedule_sent[buddy.name] = dict(state["schedule_sent"])
+            elif kind == "stop":
+                runtime.running.pop(msg[1], None)
+                cpu.pop(msg[1], None)
+            elif kind == "ask":
+                _, req_id, name, text = msg
+                with lock:
+                    pending[name] = pending.get(name, 0) + 1
+                asks.submit(answer, req_id, name, text)
+    except KeyboardInterrupt:
+        return
+    finally:
+        asks.shutdown(wait=False)
+
+
+class Supervisor:
+    """Runs buddies across `workers` processes and keeps the pool healthy."""
+
+    def __init__(
+        self,
+        paths: Optional[Paths] = None,
+        workers: int = 2,
+        tick_seconds: float = 60.0,
+        report_seconds: float = 1.0,
+        on_message: Optional[Callable[[str, str], None]] = None,
+    ) -> None:
+        self.paths = paths or Paths()
+        self.paths.ensure()
+        self.size = max(1, workers)
+        self.tick_seconds = tick_seconds
+        self.report_seconds = report_seconds
+        self.on_message = on_message
+        self.runtime = RuntimeManager(self.paths)  # owns the live registry connection
+        self._ctx = multiprocessing.get_context("spawn")
+        # One pipe per worker: a killed worker can't wedge a shared queue's lock for the others.
+        self._conns: Dict[int, Any] = {}
+        self._procs: Dict[int, Any] = {}
+        self._inboxes: Dict[int, Any] = {}
+        self._ring = HashRing()
+        self._buddies: Dict[str, Buddy] = {}
+        self._owner: Dict[str, int] = {}
+        self._stats: Dict[int, Tuple[int, Dict[str, Dict[str, float]]]] = {}
+        self._published: Dict[str, int] = {}  # buddy -> worker pid last registered
+        self._sched_state: Dict[str, Dict[str, Any]] = {}  # buddy -> last reported scheduler state
+        self._worker_metrics: Dict[int, Snapshot] = {}
+        self._retired_metrics: Snapshot = {}  # final counts of workers that died
+        REGISTRY.add_source(self, "metric_snapshots")
+        self._replies: Dict[str, str] = {}
+        self._cond = threading.Condition()
+        self._lock = threading.RLock()
+        self._stopping = False
+        self.restarts = 0
+        self._reader = threading.Thread(target=self._read_workers, daemon=True)
+
+    # --- lifecycle ---------------------------------------------------------
+
+    def start(self) -> None:
+        for wid in range(self.size):
+            self._spawn(wid)
+            self._ring.add(wid)
+        self._reader.start()
+
+    def _spawn(self, wid: int) -> None:
+        old = self._conns.pop(wid, None)
+        if old is not None:
+            old.close()
+        inbox = self._ctx.Queue()
+        reader, writer = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(wid, str(self.paths.home), inbox, writer, self.tick_seconds, self.report_seconds),
+            daemon=True,
+            name=f"aibuddies-worker-{wid}",
+        )
+        proc.start()
+        writer.close()
+        self._procs[wid] = proc
+        self._inboxes[wid] = inbox
+        self._conns[wid] = reader
+
+    def shutdown(self) -> None:
+        self._stopping = True
+        with self._lock:
+            for wid, inbox in self._inboxes.items():
+                try:
+                    inbox.put(("shutdown",))
+                except (OSError, ValueError):
+                    pass
+            for proc in self._procs.values():
+                proc.join(timeout=5)
+                if proc.is_alive():
+                    proc.terminate()
+            for name in list(self._buddies):
+                self.runtime.registry.unregister(name, os.getpid())
+            self._published.clear()
+
+    # --- placement ---------------------------------------------------------
+
+    def add(self, buddy: Buddy) -> int:
+        with self._lock:
+            self._buddies[buddy.name] = buddy
+            wid = self._ring.node_for(buddy.name)
+            self._place(buddy.name, wid)
+            return wid
+
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            if name not in self._buddies:
+                return False
+            self._buddies.pop(name)
+            wid = self._owner.pop(name, None)
+            if wid is not None and wid in self._inboxes:
+                self._inboxes[wid].put(("stop", name))
+            self._published.pop(name, None)
+            self._sched_state.pop(name, None)
+            self.runtime.registry.unregister(name, os.getpid())
+            return True
+
+    def _place(self, name: str, wid: Optional[int]) -> None:
+        old = self._owner.get(name)
+        if old == wid or wid is None:
+            return
+        if old is not None and old in self._inboxes and self._procs[old].is_alive():
+            self._inboxes[old].put(("stop", name))
+        self._inboxes[wid].put(("start", self._buddies[name].to_dict(), self._sched_state.get(name)))
+        self._owner[name] = wid
+
+    def _rebalance(self) -> None:
+        for name in self._buddies:
+            self._place(name, self._ring.node_for(name))
+
+    def owner(self, name: str) -> Optional[int]:
+        return self._owner.get(name)
+
+    # --- health ------------------------------------------------------------
+
+    def check_workers(self) -> List[int]:
+        """Restart dead workers. Returns the ids that were restarted."""
+        restarted: List[int] = []
+        with self._lock:
+            if self._stopping:
+                return restarted
+            dead = [wid for wid, proc in self._procs.items() if not proc.is_alive()]
+            if not dead:
+                return restarted
+            for wid in dead:
+                for name, owner in list(self._owner.items()):
+                    if owner == wid:
+                        del self._owner[name]
+                self._stats.pop(wid, None)
+                self._retired_metrics = merge_snapshots(self._retired_metrics, self._worker_metrics.pop(wid, {}))
+                self._spawn(wid)
+                self.restarts += 1
+                restarted.append(wid)
+            # The ring is unchanged, so this only starts the dead workers' buddies on their replacements.
+            self._rebalance()
+        return restarted
+
+    def serve_forever(self, poll_seconds: float = 1.0) -> None:
+        while not self._stopping:
+            self.check_workers()
+            time.sleep(poll_seconds)
+
+    # --- requests ----------------------------------------------------------
+
+    def ask(self, name: str, text: str, timeout: float = 120.0) -> str:
+        with self._lock:
+            wid = self._owner.get(name)
+            if wid is None:
+                return f"{name} is not running under the supervisor."
+            req_id = uuid.uuid4().hex
+            self._inboxes[wid].put(("ask", req_id, name, text))
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while req_id not in self._replies:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return f"[supervisor timeout] no reply from worker {wid} for {name}"
+                self._cond.wait(timeout=remaining)
+            return self._replies.pop(req_id)
+
+    def _read_workers(self) -> None:
+        while not self._stopping:
+            with self._lock:
+                conns = list(self._conns.values())
+            try:
+                ready = multiprocessing.connection.wait(conns, timeout=0.5)
+            except (OSError, ValueError):
+                continue  # a pipe was closed by a restart mid-wait
+            for conn in ready:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    # Worker died; check_workers() will replace it and its pipe.
+                    with self._lock:
+                        for wid, c in list(self._conns.items()):
+                            if c is conn:
+                                del self._conns[wid]
+                    continue
+                self._handle(msg)
+
+    def _handle(self, msg: Tuple[Any, ...]) -> None:
+        kind = msg[0]
+        if kind == "reply":
+            with self._cond:
+                self._replies[msg[1]] = msg[2]
+                self._cond.notify_all()
+        elif kind == "stats":
+            _, wid, pid, per_buddy, state = msg
+            with self._lock:
+                self._stats[wid] = (pid, per_buddy)
+                for name, buddy_state in state.items():
+                    if self._owner.get(name) == wid:
+                        self._sched_state[name] = buddy_state
+                self._publish(wid, pid, per_buddy)
+        elif kind == "metrics":
+            with self._lock:
+                self._worker_metrics[msg[1]] = msg[2]
+        elif kind == "message" and self.on_message:
+            self.on_message(msg[2], msg[3])
+
+    def _publish(self, wid: int, pid: int, per_buddy: Dict[str, Dict[str, float]]) -> None:
+        """
+        Heartbeat live placement into the registry so `aibuddies status` in another shell sees
+        real worker/pid/load, and apply `aibuddies stop` requests for supervised buddies.
+        """
+        rows = []
+        for name, info in per_buddy.items():
+            buddy = self._buddies.get(name)
+            if buddy is None or self._owner.get(name) != wid:
+                continue
+            if self._published.get(name) != pid:
+                self.runtime.registry.register(
+                    name,
+                    "supervisor",
+                    interval=buddy.autorun_interval,
+                    schedule_len=len(buddy.schedule),
+                    pid=pid,
+                    owner_pid=os.getpid(),
+                    worker=wid,
+                )
+                self._published[name] = pid
+            rows.append({"name": name, "pid": pid, **info})
+        for name in self.runtime.registry.heartbeat(rows):
+            self.remove(name)
+
+    def metric_snapshots(self) -> List[Snapshot]:
+        """Worker metrics to merge into this process's registry (see metrics.Registry.add_source)."""
+        with self._lock:
+            return [self._retired_metrics, *self._worker_metrics.values()]
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            out: Dict[str, Dict[str, Any]] = {}
+            for name, wid in self._owner.items():
+                pid, per_buddy = self._stats.get(wid, (None, {}))
+                info = per_buddy.get(name, {})
+                out[name] = {
+                    "worker": wid,
+                    "pid": pid,
+                    "queue_depth": info.get("queue_depth", 0),
+                    "cpu_time": info.get("cpu_time", 0.0),
+                }
+            return out
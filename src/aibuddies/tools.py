@@ -0,0 +1,396 @@
+"""
+Tool execution for buddies.
+
+A model turn may request several tool calls at once. `ToolEngine.run` checks
+every call against the buddy's policy first (`tools_allowed`,
+`safety_rules.allowlist_paths` / `allowlist_domains` for tools that touch
+files or URLs, `confirm_commands` for tools with side effects outside the
+app), then runs the permitted calls concurrently on a shared pool, each with
+its own timeout, capped by the request's deadline (an overrunning call is
+reported as timed out and abandoned; its thread cannot be killed). Results are truncated to the tool's size limit.
+Idempotent tools are memoized per buddy (keyed by arguments plus a
+tool-defined version, e.g. the docs directory state for `retrieve_docs`), and
+identical calls in one turn run once.
+
+Built-in tools: `retrieve_docs` (keyword search over the buddy's docs) and
+`notify` (queue a message for the buddy's chat). Register more with
+`register_tool`. A tool whose `available` check fails for the buddy is left
+out of the specs sent to the model, e.g. `retrieve_docs` without docs the
+model may see. Offering such a tool would only cost a failing round trip.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .buddies import Buddy
+from .deadline import Deadline
+from .docs import DocIndex
+from .metrics import REGISTRY
+from .tracing import span
+
+TOOL_CALLS = REGISTRY.counter(
+    "aibuddies_tool_calls_total", "Tool calls by outcome (ok/error/denied/timeout/cached).", ("buddy", "tool", "outcome")
+)
+TOOL_LATENCY = REGISTRY.histogram("aibuddies_tool_latency_seconds", "Tool execution time.", ("tool",))
+
+
+@dataclass
+class ToolContext:
+    buddy: Buddy
+    docs: DocIndex
+    notify: Optional[Callable[[str, str], None]] = None  # (buddy name, message)
+    on_box: bool = False  # the model runs on this machine (see LLMClient.on_box)
+
+
+@dataclass
+class Tool:
+    name: str
+    description: str
+    parameters: Dict[str, Any]  # JSON schema for the arguments object
+    fn: Callable[[Dict[str, Any], ToolContext], str]
+    timeout: float = 10.0
+    max_result_chars: int = 8000
+    idempotent: bool = False
+    memo_ttl: float = 300.0
+    version: Optional[Callable[[ToolContext], str]] = None  # memo key component that changes with the data
+    path_args: Tuple[str, ...] = ()  # arguments checked against safety_rules.allowlist_paths
+    url_args: Tuple[str, ...] = ()  # arguments checked against safety_rules.allowlist_domains
+    needs_confirmation: bool = False  # side effects outside the app: gated by safety_rules.confirm_commands
+    available: Optional[Callable[[ToolContext], bool]] = None  # False: the buddy's policy leaves it nothing to do
+
+
+@dataclass
+class ToolCall:
+    id: str
+    name: str
+    arguments: Optional[Dict[str, Any]]  # None when the model sent unparseable arguments
+
+
+@dataclass
+class ToolResult:
+    call_id: str
+    name: str
+    content: str
+    is_error: bool = False
+    cached: bool = False
+    seconds: float = 0.0
+
+
+TOOLS: Dict[str, Tool] = {}
+
+
+def register_tool(tool: Tool) -> Tool:
+    TOOLS[tool.name] = tool
+    return tool
+
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="aibuddies-tool")
+        return _POOL
+
+
+class _Memo:
+    """Small LRU with per-entry expiry, shared across turns."""
+
+    def __init__(self, size: int = 512) -> None:
+        self.size = size
+        self._data: "OrderedDict[Tuple[str, ...], Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, ...]) -> Optional[str]:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if hit[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key: Tuple[str, ...], value: str, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+MEMO = _Memo()
+
+
+def _within(path: Path, roots: List[str]) -> bool:
+    resolved = path.expanduser().resolve()
+    for root in roots:
+        base = Path(root).expanduser().resolve()
+        if resolved == base or base in resolved.parents:
+            return True
+    return False
+
+
+def _domain_allowed(url: str, domains: List[str]) -> bool:
+    host = (urlparse(url).hostname or "").lower().rstrip(".")
+    if not host:
+        return False
+    for domain in domains:
+        domain = domain.lower().lstrip("*.").rstrip(".")
+        if host == domain or host.endswith("." + domain):
+            return True
+    return False
+
+
+class ToolEngine:
+    """Policy checks plus concurrent, time-limited, memoized execution of one turn's tool calls."""
+
+    max_rounds = 4  # model <-> tools round trips per ask
+
+    def __init__(
+        self,
+        buddy: Buddy,
+        docs: Optional[DocIndex] = None,
+        notify: Optional[Callable[[str, str], None]] = None,
+        confirm: Optional[Callable[[ToolCall], bool]] = None,
+        tools: Optional[Dict[str, Tool]] = None,
+        on_box: bool = False,
+    ) -> None:
+        self.buddy = buddy
+        self.ctx = ToolContext(buddy=buddy, docs=docs or DocIndex(), notify=notify, on_box=on_box)
+        self.confirm = confirm
+        registry = TOOLS if tools is None else tools
+        self.tools = {
+            name: registry[name]
+            for name in sorted(set(buddy.tools_allowed))
+            if name in registry and (registry[name].available is None or registry[name].available(self.ctx))
+        }
+
+    def __bool__(self) -> bool:
+        return bool(self.tools)
+
+    # --- provider tool specs (sorted, so they stay part of the cacheable prefix) ---
+
+    def anthropic_tools(self) -> List[Dict[str, Any]]:
+        return [
+            {"name": t.name, "description": t.description, "input_schema": t.parameters}
+            for t in self.tools.values()
+        ]
+
+    def openai_tools(self) -> List[Dict[str, Any]]:
+        return [
+            {"type": "function", "function": {"name": t.name, "description": t.description, "parameters": t.parameters}}
+            for t in self.tools.values()
+        ]
+
+    # --- policy ------------------------------------------------------------
+
+    def check(self, call: ToolCall, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        Reason the call may not run, or None if it may. Once `deadline` has passed the caller has
+        given up on this turn, so nobody is asked to confirm anything for it.
+        """
+        tool = self.tools.get(call.name)
+        if tool is None:
+            return f"tool '{call.name}' is not allowed for {self.buddy.name}"
+        args = call.arguments
+        if args is None:
+            return "arguments were not a valid JSON object"
+        schema = tool.parameters
+        missing = [k for k in schema.get("required", []) if k not in args]
+        if missing:
+            return f"missing required argument(s): {', '.join(missing)}"
+        unknown = [k for k in args if k not in schema.get("properties", {})]
+        if unknown:
+            return f"unknown argument(s): {', '.join(unknown)}"
+        rules = self.buddy.safety_rules
+        for name in tool.path_args:
+            if name in args and not _within(Path(str(args[name])), list(rules.get("allowlist_paths") or [])):
+                return f"path '{args[name]}' is outside allowlist_paths"
+        for name in tool.url_args:
+            if name in args and not _domain_allowed(str(args[name]), list(rules.get("allowlist_domains") or [])):
+                return f"URL '{args[name]}' is not in allowlist_domains"
+        if tool.needs_confirmation and rules.get("confirm_commands", True) and not rules.get("auto_action", False):
+            if deadline is not None and deadline.expired():
+                return "the request's deadline passed before the user could confirm it"
+            if self.confirm is None or not self.confirm(call):
+                return "not confirmed by the user (confirm_commands is on)"
+        return None
+
+    # --- execution ---------------------------------------------------------
+
+    def _memo_key(self, tool: Tool, args: Dict[str, Any]) -> Tuple[str, ...]:
+        version = tool.version(self.ctx) if tool.version else ""
+        return (self.buddy.name, tool.name, version, json.dumps(args, sort_keys=True, default=str))
+
+    def _execute(self, tool: Tool, args: Dict[str, Any]) -> Tuple[str, float]:
+        """The tool's result, and the monotonic time it finished."""
+        with span("tool.run", tool=tool.name):
+            started = time.perf_counter()
+            try:
+                return str(tool.fn(args, self.ctx)), time.monotonic()
+            finally:
+                TOOL_LATENCY.observe(time.perf_counter() - started, tool=tool.name)
+
+    def run(self, calls: List[ToolCall], deadline: Optional[Deadline] = None) -> List[ToolResult]:
+        """
+        Run one turn's calls; results come back in call order. No call starts after `deadline`,
+        and none still queued when it passes is run.
+        """
+        deadline = deadline or Deadline()
+        results: List[Optional[ToolResult]] = [None] * len(calls)
+        # (call index, tool, future, memo key, submitted at): each timeout runs from submission, so
+        # time spent waiting on a confirmation prompt is not charged to any tool.
+        pending: List[Tuple[int, Tool, Future, Optional[Tuple[str, ...]], float]] = []
+        inflight: Dict[Tuple[str, ...], Tuple[Future, float]] = {}
+        for i, call in enumerate(calls):
+            if deadline.expired():
+                # The caller has given up on this turn (this thread may have been abandoned): start nothing.
+                message = "Tool not run: the request's deadline passed"
+                results[i] = ToolResult(call.id, call.name, message, is_error=True)
+                TOOL_CALLS.inc(buddy=self.buddy.name, tool=call.name, outcome="timeout")
+                continue
+            denied = self.check(call, deadline)
+            if denied:
+                results[i] = ToolResult(call.id, call.name, f"Tool call refused: {denied}", is_error=True)
+                TOOL_CALLS.inc(buddy=self.buddy.name, tool=call.name, outcome="denied")
+                continue
+            tool = self.tools[call.name]
+            args = call.arguments or {}
+            key = self._memo_key(tool, args) if tool.idempotent else None
+            if key is not None:
+                cached = MEMO.get(key)
+                if cached is not None:
+                    results[i] = ToolResult(call.id, call.name, cached, cached=True)
+                    TOOL_CALLS.inc(buddy=self.buddy.name, tool=call.name, outcome="cached")
+                    continue
+                if key in inflight:
+                    future, submitted = inflight[key]
+                    pending.append((i, tool, future, key, submitted))
+                    continue
+            submitted = time.monotonic()
+            future = _pool().submit(self._execute, tool, args)
+            if key is not None:
+                inflight[key] = (future, submitted)
+            pending.append((i, tool, future, key, submitted))
+
+        for i, tool, future, key, submitted in pending:
+            call = calls[i]
+            remaining = max(0.0, submitted + tool.timeout - time.monotonic())
+            remaining = deadline.timeout(remaining)
+            try:
+                content, finished = future.result(timeout=remaining)
+            except FutureTimeout:
+                future.cancel()
+                message = (
+                    "Tool stopped: the request's deadline passed" if deadline.expired()
+                    else f"Tool timed out after {tool.timeout:g}s"
+                )
+                results[i] = ToolResult(call.id, call.name, message, is_error=True)
+                TOOL_CALLS.inc(buddy=self.buddy.name, tool=call.name, outcome="timeout")
+                continue
+            except Exception as e:
+                results[i] = ToolResult(call.id, call.name, f"Tool error: {e}", is_error=True)
+                TOOL_CALLS.inc(buddy=self.buddy.name, tool=call.name, outcome="error")
+                continue
+            if len(content) > tool.max_result_chars:
+                omitted = len(content) - tool.max_result_chars
+                content = content[: tool.max_result_chars] + f"\n[truncated {omitted} chars]"
+            if key is not None:
+                MEMO.put(key, content, tool.memo_ttl)
+            results[i] = ToolResult(call.id, call.name, content, seconds=finished - submitted)
+            TOOL_CALLS.inc(buddy=self.buddy.name, tool=call.name, outcome="ok")
+        return [r for r in results if r is not None]
+
+
+# --- built-in tools --------------------------------------------------------
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _docs_version(ctx: ToolContext) -> str:
+    folder = ctx.docs.buddy_dir(ctx.buddy.name)
+    try:
+        entries = sorted(
+            (e.name, st.st_mtime_ns, st.st_size) for e in os.scandir(folder) if e.is_file() for st in (e.stat(),)
+        )
+    except OSError:
+        return ""
+    return str(hash(tuple(entries)))
+
+
+def _docs_reachable(ctx: ToolContext) -> bool:
+    """Docs are on and may reach this model: it runs on this machine, or doc_privacy allows the cloud."""
+    buddy = ctx.buddy
+    return buddy.docs_enabled and (ctx.on_box or buddy.doc_privacy.get("allow_cloud_with_docs", False))
+
+
+def _retrieve_docs(args: Dict[str, Any], ctx: ToolContext) -> str:
+    if not _docs_reachable(ctx):
+        raise PermissionError("this buddy's docs may not be shared with this model (docs_enabled/doc_privacy)")
+    terms = {w.lower() for w in _WORD_RE.findall(str(args["query"]))}
+    limit = max(1, min(int(args.get("max_results", 3)), 10))
+    scored: List[Tuple[int, str, str]] = []
+    for filename in ctx.docs.list(ctx.buddy.name):
+        text = ctx.docs.read_text(ctx.buddy.name, filename) or ""
+        for para in re.split(r"\n\s*\n", text):
+            score = sum(1 for w in _WORD_RE.findall(para.lower()) if w in terms)
+            if score:
+                scored.append((score, filename, para.strip()))
+    if not scored:
+        return "No matching passages."
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return "\n\n".join(f"[{name}] {para[:1500]}" for _, name, para in scored[:limit])
+
+
+def _notify(args: Dict[str, Any], ctx: ToolContext) -> str:
+    if ctx.notify is None:
+        raise RuntimeError("no notification channel in this session")
+    ctx.notify(ctx.buddy.name, str(args["message"]))
+    return "Queued."
+
+
+register_tool(Tool(
+    name="retrieve_docs",
+    description="Search this buddy's attached documents and return the most relevant passages.",
+    parameters={
+        "type": "object",
+        "properties": {
+            "query": {"type": "string", "description": "Keywords to search for"},
+            "max_results": {"type": "integer", "description": "Passages to return (1-10, default 3)"},
+        },
+        "required": ["query"],
+    },
+    fn=_retrieve_docs,
+    timeout=5.0,
+    idempotent=True,
+    version=_docs_version,
+    available=_docs_reachable,
+))
+
+register_tool(Tool(
+    name="notify",
+    description="Send the user a short notification in their chat with this buddy.",
+    parameters={
+        "type": "object",
+        "properties": {"message": {"type": "string", "description": "Notification text"}},
+        "required": ["message"],
+    },
+    fn=_notify,
+    timeout=2.0,
+    max_result_chars=200,
+    available=lambda ctx: ctx.notify is not None,
+))
@@ -0,0 +1,166 @@
+"""
+Lightweight span tracing for the ask path.
+
+    with span("context.gather", buddy=name):
+        ...
+
+When tracing is disabled (the default) `span()` returns a shared no-op context
+manager, so instrumented code pays one global check per call. Enable with
+`aibuddies --profile ...` (prints a flame-style breakdown), `--trace-file PATH`
+(Chrome/Perfetto trace-event JSON), or AIBUDDIES_PROFILE=1 to also capture work
+done at import time (e.g. loading the buddy store).
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+    def set(self, **attrs: Any) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start_ns", "end_ns", "tid", "depth", "error")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = 0
+        self.end_ns = 0
+        self.tid = 0
+        self.depth = 0
+        self.error = ""
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        stack = _local.__dict__.setdefault("stack", [])
+        self.depth = len(stack)
+        self.tid = threading.get_ident()
+        stack.append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        stack = _local.stack
+        if stack and stack[-1] is self:
+            stack.pop()
+        with _lock:
+            _spans.append(self)
+
+
+_local = threading.local()
+_lock = threading.Lock()
+_spans: List[Span] = []
+_enabled = bool(os.environ.get("AIBUDDIES_PROFILE"))
+
+
+def span(name: str, **attrs: Any):
+    """Context manager timing one unit of work; a shared no-op when tracing is off."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    with _lock:
+        _spans.clear()
+
+
+def spans() -> List[Span]:
+    with _lock:
+        return sorted(_spans, key=lambda s: (s.start_ns, s.depth))
+
+
+def render_flame(width: int = 30) -> str:
+    """Indented call tree per thread with durations and a bar relative to the longest root span."""
+    recorded = spans()
+    if not recorded:
+        return "(no spans recorded)"
+    first_seen: Dict[int, int] = {}
+    for s in recorded:
+        first_seen.setdefault(s.tid, s.start_ns)
+    recorded.sort(key=lambda s: (first_seen[s.tid], s.start_ns, s.depth))
+    roots = [s for s in recorded if s.depth == 0]
+    total = max((s.duration_ms for s in roots), default=0.0) or 1.0
+    lines = []
+    threads: Dict[int, int] = {}
+    multi = len({x.tid for x in recorded}) > 1
+    for s in recorded:
+        label = "  " * s.depth + s.name
+        attrs = " ".join(f"{k}={v}" for k, v in s.attrs.items())
+        bar = "█" * max(1, int(width * s.duration_ms / total))
+        thread = threads.setdefault(s.tid, len(threads))
+        err = f" !{s.error}" if s.error else ""
+        t = f"[t{thread}] " if multi else ""
+        lines.append(f"{t}{label:<40s} {s.duration_ms:10.2f} ms {bar}{err} {attrs}".rstrip())
+    return "\n".join(lines)
+
+
+def write_chrome_trace(path: Path) -> int:
+    """Write spans as Trace Event Format JSON (chrome://tracing, Perfetto). Returns the span count."""
+    recorded = spans()
+    pid = os.getpid()
+    events: List[Dict[str, Any]] = []
+    for s in recorded:
+        args = {k: str(v) for k, v in s.attrs.items()}
+        if s.error:
+            args["error"] = s.error
+        events.append({
+            "name": s.name,
+            "cat": s.name.split(".", 1)[0],
+            "ph": "X",
+            "ts": s.start_ns / 1000.0,
+            "dur": (s.end_ns - s.start_ns) / 1000.0,
+            "pid": pid,
+            "tid": s.tid,
+            "args": args,
+        })
+    Path(path).write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
+    return len(events)
+
+
+def summary(prefix: Optional[str] = None) -> Dict[str, float]:
+    """Total milliseconds per span name (optionally filtered by prefix)."""
+    out: Dict[str, float] = {}
+    for s in spans():
+        if prefix is None or s.name.startswith(prefix):
+            out[s.name] = out.get(s.name, 0.0) + s.duration_ms
+    return out
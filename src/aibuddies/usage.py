@@ -0,0 +1,309 @@
+"""
+Usage ledger and adaptive max_tokens.
+
+Every provider turn the runtime makes is appended to `~/.aibuddies/usage.db`
+(SQLite): token counts, the max_tokens it was sent with, latency and whether it
+failed, keyed by (buddy, call site, model). Key strings are stored once in
+`keys`; each call row is a handful of integers.
+
+Call sites separate traffic with different reply shapes: `chat` turns,
+`proactive` check-ins, `docs` (doc Q&A) and `voice`. `TokenPolicy` sizes
+max_tokens per buddy and site from that history: p95 of recent completion
+lengths plus headroom, doubled while replies keep hitting the limit. Until a key
+has MIN_SAMPLES calls the site default applies.
+"""
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+SITE_DEFAULTS = {"chat": 256, "docs": 1024, "proactive": 160, "voice": 256}
+DEFAULT_SITE = "chat"
+
+MIN_TOKENS = 64
+MAX_TOKENS = 4096
+MIN_SAMPLES = 20
+WINDOW = 200  # most recent successful calls per (buddy, site) the policy looks at
+HEADROOM = 1.25
+TRUNCATION_RATE = 0.05  # above this share of replies hitting the limit, double it
+RETENTION_DAYS = 90
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS keys (
+        id INTEGER PRIMARY KEY,
+        buddy TEXT NOT NULL,
+        site TEXT NOT NULL,
+        model TEXT NOT NULL,
+        UNIQUE (buddy, site, model)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS calls (
+        key INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        input_tokens INTEGER NOT NULL,
+        output_tokens INTEGER NOT NULL,
+        cache_read_tokens INTEGER NOT NULL,
+        cache_write_tokens INTEGER NOT NULL,
+        max_tokens INTEGER NOT NULL,
+        latency_ms INTEGER NOT NULL,
+        error INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS calls_by_key ON calls (key, ts)",
+)
+
+
+class Price(NamedTuple):
+    """USD per million tokens."""
+
+    input: float
+    output: float
+    cache_read: float
+    cache_write: float
+    cached_in_input: bool = False  # OpenAI's prompt_tokens already include the cached ones
+
+
+_SONNET = Price(3.00, 15.00, 0.30, 3.75)
+_OPUS = Price(15.00, 75.00, 1.50, 18.75)
+
+# Matched by model-name prefix, first hit wins. Unknown models report no cost.
+PRICES: Tuple[Tuple[str, Price], ...] = (
+    ("claude-3-5-haiku", Price(0.80, 4.00, 0.08, 1.00)),
+    ("claude-3-haiku", Price(0.25, 1.25, 0.03, 0.30)),
+    ("claude-3-5-sonnet", _SONNET),
+    ("claude-3.5-sonnet", _SONNET),
+    ("claude-3-7-sonnet", _SONNET),
+    ("claude-sonnet-4", _SONNET),
+    ("claude-3-opus", _OPUS),
+    ("claude-opus-4", _OPUS),
+    ("gpt-4o-mini", Price(0.15, 0.60, 0.075, 0.0, cached_in_input=True)),
+    ("gpt-4o", Price(2.50, 10.00, 1.25, 0.0, cached_in_input=True)),
+)
+
+
+def price_for(model: str) -> Optional[Price]:
+    for prefix, price in PRICES:
+        if model.startswith(prefix):
+            return price
+    return None
+
+
+def cost(model: str, input_tokens: int, output_tokens: int, cache_read: int = 0, cache_write: int = 0) -> Optional[float]:
+    price = price_for(model)
+    if price is None:
+        return None
+    uncached = input_tokens - cache_read if price.cached_in_input else input_tokens
+    return (
+        max(0, uncached) * price.input
+        + output_tokens * price.output
+        + cache_read * price.cache_read
+        + cache_write * price.cache_write
+    ) / 1_000_000
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def adaptive_limit(outputs: List[int], limits: List[int], default: int) -> int:
+    """
+    max_tokens for the next call given recent completion lengths and the limits they were
+    sent with (same order). Replies that hit their limit were probably cut off.
+    """
+    if len(outputs) < MIN_SAMPLES:
+        return default
+    target = percentile(sorted(outputs), 0.95) * HEADROOM
+    truncated = [limit for out, limit in zip(outputs, limits) if out >= limit]
+    if len(truncated) > TRUNCATION_RATE * len(outputs):
+        target = max(target, 2 * max(truncated))
+    rounded = -(-int(target) // 32) * 32
+    return max(MIN_TOKENS, min(MAX_TOKENS, rounded))
+
+
+def _apportion(total: int, weights: List[float]) -> List[int]:
+    """Split `total` in proportion to `weights` (largest remainder, so the parts add up)."""
+    whole = sum(weights)
+    if whole <= 0:
+        weights, whole = [1.0] * len(weights), float(len(weights))
+    exact = [total * w / whole for w in weights]
+    parts = [int(x) for x in exact]
+    by_remainder = sorted(range(len(exact)), key=lambda i: parts[i] - exact[i])
+    for i in by_remainder[: total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+def split_usage(usage: Dict[str, int], shares: Dict[str, float]) -> Dict[str, Dict[str, int]]:
+    """
+    Divide one request's usage between the buddies it answered for: output tokens in
+    proportion to `shares` (e.g. each buddy's reply length), prompt tokens evenly.
+    """
+    names = list(shares)
+    out: Dict[str, Dict[str, int]] = {name: {} for name in names}
+    for key, total in usage.items():
+        weights = [shares[n] for n in names] if key == "output_tokens" else [1.0] * len(names)
+        for name, part in zip(names, _apportion(int(total), weights)):
+            out[name][key] = part
+    return out
+
+
+@dataclass
+class UsageRow:
+    buddy: str
+    site: str
+    model: str
+    calls: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    cost_usd: Optional[float] = 0.0
+    latency_ms: Dict[str, float] = field(default_factory=dict)
+    max_tokens: int = 0  # what the policy would send next
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class UsageLedger:
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._keys: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened lazily, like the registry: commands that never call a provider don't pay for it.
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.execute("DELETE FROM calls WHERE ts < ?", (int(time.time()) - RETENTION_DAYS * 86400,))
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _key(self, buddy: str, site: str, model: str) -> int:
+        ident = (buddy, site, model)
+        key = self._keys.get(ident)
+        if key is None:
+            db = self._db()
+            db.execute("INSERT OR IGNORE INTO keys (buddy, site, model) VALUES (?,?,?)", ident)
+            key = db.execute("SELECT id FROM keys WHERE buddy = ? AND site = ? AND model = ?", ident).fetchone()[0]
+            self._keys[ident] = key
+        return key
+
+    def record(
+        self,
+        buddy: str,
+        site: str,
+        model: str,
+        usage: Optional[Dict[str, int]],
+        max_tokens: int,
+        seconds: float,
+        error: bool = False,
+    ) -> None:
+        """`usage` keys: input_tokens, output_tokens, cache_read_tokens, cache_write_tokens."""
+        usage = usage or {}
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO calls VALUES (?,?,?,?,?,?,?,?,?)",
+                (
+                    self._key(buddy, site, model), int(time.time()),
+                    int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0)),
+                    int(usage.get("cache_read_tokens", 0)), int(usage.get("cache_write_tokens", 0)),
+                    max_tokens, int(round(seconds * 1000)), int(error),
+                ),
+            )
+
+    def recent(self, buddy: str, site: str, limit: int = WINDOW) -> List[Tuple[int, int]]:
+        """(output_tokens, max_tokens) of the latest successful calls for `buddy` at `site`, newest first."""
+        with self._lock:
+            return self._db().execute(
+                "SELECT c.output_tokens, c.max_tokens FROM calls c JOIN keys k ON k.id = c.key"
+                " WHERE k.buddy = ? AND k.site = ? AND c.error = 0 ORDER BY c.ts DESC, c.rowid DESC LIMIT ?",
+                (buddy, site, limit),
+            ).fetchall()
+
+    def report(self, since: float = 0.0, buddy: Optional[str] = None) -> List[UsageRow]:
+        """Totals, cost and latency percentiles per (buddy, site, model) for calls since `since`."""
+        sql = (
+            "SELECT k.buddy, k.site, k.model, c.input_tokens, c.output_tokens, c.cache_read_tokens,"
+            " c.cache_write_tokens, c.latency_ms, c.error FROM calls c JOIN keys k ON k.id = c.key WHERE c.ts >= ?"
+        )
+        params: List[Any] = [int(since)]
+        if buddy is not None:
+            sql += " AND k.buddy = ?"
+            params.append(buddy)
+        with self._lock:
+            rows = self._db().execute(sql, params).fetchall()
+        groups: Dict[Tuple[str, str, str], UsageRow] = {}
+        latencies: Dict[Tuple[str, str, str], List[float]] = {}
+        for name, site, model, inp, out, read, write, latency, error in rows:
+            row = groups.setdefault((name, site, model), UsageRow(name, site, model))
+            row.calls += 1
+            row.errors += error
+            row.input_tokens += inp
+            row.output_tokens += out
+            row.cache_read_tokens += read
+            row.cache_write_tokens += write
+            latencies.setdefault((name, site, model), []).append(float(latency))
+        for ident, row in groups.items():
+            row.cost_usd = cost(row.model, row.input_tokens, row.output_tokens, row.cache_read_tokens, row.cache_write_tokens)
+            values = sorted(latencies[ident])
+            row.latency_ms = {q: percentile(values, p) for q, p in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))}
+        return [groups[k] for k in sorted(groups)]
+
+
+class TokenPolicy:
+    """Chooses max_tokens per (buddy, site) from the ledger; recomputed after new calls for that key."""
+
+    def __init__(self, ledger: UsageLedger, defaults: Optional[Dict[str, int]] = None) -> None:
+        self.ledger = ledger
+        self.defaults = dict(SITE_DEFAULTS, **(defaults or {}))
+        self._cache: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def default(self, site: str) -> int:
+        return self.defaults.get(site, self.defaults[DEFAULT_SITE])
+
+    def max_tokens(self, buddy: str, site: str) -> int:
+        with self._lock:
+            cached = self._cache.get((buddy, site))
+        if cached is not None:
+            return cached
+        history = self.ledger.recent(buddy, site)
+        value = adaptive_limit([out for out, _ in history], [limit for _, limit in history], self.default(site))
+        with self._lock:
+            self._cache[(buddy, site)] = value
+        return value
+
+    def record(
+        self,
+        buddy: str,
+        site: str,
+        model: str,
+        usage: Optional[Dict[str, int]],
+        max_tokens: int,
+        seconds: float,
+        error: bool = False,
+    ) -> None:
+        self.ledger.record(buddy, site, model, usage, max_tokens, seconds, error)
+        with self._lock:
+            self._cache.pop((buddy, site), None)
@@ -0,0 +1,360 @@
+"""
+Voice pipeline: audio frames -> STT -> LLM -> TTS -> audio out.
+
+Each stage runs on its own thread and hands work to the next through a bounded
+queue, so stages overlap: the LLM starts as soon as end-of-speech is detected,
+TTS starts on the first complete sentence of the reply, and playback starts on
+the first synthesized chunk while the rest of the reply is still streaming.
+
+Engines are pluggable (see STT_ENGINES / TTS_ENGINES). The stub engines plus
+WavFileSource/WavFileSink make the whole pipeline runnable offline; mic capture
+and speaker playback need the optional `sounddevice` package.
+"""
+import array
+import math
+import queue
+import re
+import threading
+import time
+import wave
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+
+_SENTENCE_END = re.compile(r"[.!?;:\n]\s*$")
+_DONE = object()
+
+
+@dataclass
+class TurnMetrics:
+    """Timestamps (time.perf_counter) for one utterance -> reply turn."""
+
+    transcript: str = ""
+    end_of_speech: float = 0.0
+    first_token: float = 0.0
+    first_audio: float = 0.0
+    llm_done: float = 0.0
+    audio_done: float = 0.0
+    reply: List[str] = field(default_factory=list)
+
+    @staticmethod
+    def _ms(start: float, end: float) -> Optional[float]:
+        return round((end - start) * 1000, 1) if start and end else None
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "eos_to_first_token_ms": self._ms(self.end_of_speech, self.first_token),
+            "eos_to_first_audio_ms": self._ms(self.end_of_speech, self.first_audio),
+            "eos_to_llm_done_ms": self._ms(self.end_of_speech, self.llm_done),
+            "eos_to_audio_done_ms": self._ms(self.end_of_speech, self.audio_done),
+        }
+
+
+def frame_rms(frame: bytes) -> float:
+    """RMS level of a 16-bit mono PCM frame (0..32768)."""
+    samples = array.array("h")
+    samples.frombytes(frame[: len(frame) - len(frame) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+# --- Audio sources / sinks -------------------------------------------------
+
+class WavFileSource:
+    """Yields 16-bit mono PCM frames from a WAV file, optionally paced in real time."""
+
+    def __init__(self, path: Path, frame_ms: int = FRAME_MS, realtime: bool = False) -> None:
+        self.path = Path(path)
+        self.frame_ms = frame_ms
+        self.realtime = realtime
+        with wave.open(str(self.path), "rb") as w:
+            if w.getsampwidth() != 2 or w.getnchannels() != 1:
+                raise RuntimeError("Voice input must be 16-bit mono WAV.")
+            self.sample_rate = w.getframerate()
+
+    def frames(self) -> Iterator[bytes]:
+        per_frame = self.sample_rate * self.frame_ms // 1000
+        with wave.open(str(self.path), "rb") as w:
+            while True:
+                data = w.readframes(per_frame)
+                if not data:
+                    return
+                if self.realtime:
+                    time.sleep(self.frame_ms / 1000)
+                yield data
+
+
+class MicSource:
+    """Microphone capture via the optional `sounddevice` package."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, frame_ms: int = FRAME_MS) -> None:
+        try:
+            import sounddevice  # type: ignore
+        except ImportError:
+            raise RuntimeError("sounddevice not installed. Install sounddevice to use --mic.")
+        self.sd = sounddevice
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+
+    def frames(self) -> Iterator[bytes]:
+        per_frame = self.sample_rate * self.frame_ms // 1000
+        with self.sd.RawInputStream(samplerate=self.sample_rate, channels=1, dtype="int16", blocksize=per_frame) as s:
+            while True:
+                data, _ = s.read(per_frame)
+                yield bytes(data)
+
+
+class WavFileSink:
+    """Appends synthesized PCM chunks to a WAV file as they arrive."""
+
+    def __init__(self, path: Path, sample_rate: int = SAMPLE_RATE) -> None:
+        self.wav = wave.open(str(path), "wb")
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(sample_rate)
+
+    def write(self, chunk: bytes) -> None:
+        self.wav.writeframes(chunk)
+
+    def close(self) -> None:
+        self.wav.close()
+
+
+class SpeakerSink:
+    """Playback via the optional `sounddevice` package."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE) -> None:
+        try:
+            import sounddevice  # type: ignore
+        except ImportError:
+            raise RuntimeError("sounddevice not installed. Install sounddevice for speaker output.")
+        self.stream = sounddevice.RawOutputStream(samplerate=sample_rate, channels=1, dtype="int16")
+        self.stream.start()
+
+    def write(self, chunk: bytes) -> None:
+        self.stream.write(chunk)
+
+    def close(self) -> None:
+        self.stream.stop()
+        self.stream.close()
+
+
+# --- Engines ---------------------------------------------------------------
+
+class STTEngine:
+    """Streaming speech-to-text: feed frames, get partial transcripts, finish() for the final text."""
+
+    def accept(self, frame: bytes) -> Optional[str]:
+        raise NotImplementedError
+
+    def finish(self) -> str:
+        raise NotImplementedError
+
+
+class TTSEngine:
+    """Text-to-speech: synthesize a text chunk into a stream of PCM chunks."""
+
+    sample_rate = SAMPLE_RATE
+
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        raise NotImplementedError
+
+
+class StubSTT(STTEngine):
+    """Offline STT: reveals a known transcript word by word as speech frames arrive."""
+
+    def __init__(self, transcript: str = "", frames_per_word: int = 10) -> None:
+        self.words = transcript.split()
+        self.frames_per_word = frames_per_word
+        self.frames = 0
+
+    def accept(self, frame: bytes) -> Optional[str]:
+        self.frames += 1
+        if self.frames % self.frames_per_word:
+            return None
+        return " ".join(self.words[: self.frames // self.frames_per_word])
+
+    def finish(self) -> str:
+        self.frames = 0
+        return " ".join(self.words)
+
+
+class StubTTS(TTSEngine):
+    """Offline TTS: a quiet tone, ~60 ms per word, emitted in 20 ms chunks."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, ms_per_word: int = 60) -> None:
+        self.sample_rate = sample_rate
+        self.ms_per_word = ms_per_word
+
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        n = self.sample_rate * self.ms_per_word * max(1, len(text.split())) // 1000
+        per_chunk = self.sample_rate * FRAME_MS // 1000
+        for start in range(0, n, per_chunk):
+            samples = array.array(
+                "h", (int(2000 * math.sin(2 * math.pi * 220 * i / self.sample_rate)) for i in range(start, min(n, start + per_chunk)))
+            )
+            yield samples.tobytes()
+
+
+STT_ENGINES: Dict[str, Callable[..., STTEngine]] = {"stub": StubSTT}
+TTS_ENGINES: Dict[str, Callable[..., TTSEngine]] = {"stub": StubTTS}
+
+
+# --- Pipeline --------------------------------------------------------------
+
+class VoicePipeline:
+    """
+    Runs capture -> STT -> LLM -> TTS -> sink as overlapping stages.
+
+    `respond(text)` must yield reply chunks (e.g. RuntimeManager.stream). End of
+    speech is detected by an energy VAD (`silence_ms` of quiet after speech) or
+    by the end of the audio source.
+    """
+
+    def __init__(
+        self,
+        stt: STTEngine,
+        tts: TTSEngine,
+        respond: Callable[[str], Iterable[str]],
+        sink,
+        queue_size: int = 64,
+        silence_ms: int = 400,
+        vad_threshold: float = 500.0,
+        on_partial: Optional[Callable[[str], None]] = None,
+        on_reply_chunk: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.stt = stt
+        self.tts = tts
+        self.respond = respond
+        self.sink = sink
+        self.queue_size = queue_size
+        self.silence_frames = max(1, silence_ms // FRAME_MS)
+        self.vad_threshold = vad_threshold
+        self.on_partial = on_partial
+        self.on_reply_chunk = on_reply_chunk
+        self.turns: List[TurnMetrics] = []
+        self.errors: List[BaseException] = []
+
+    def _stage(
+        self, target: Callable[[], None], inbox: Optional["queue.Queue"], out: Optional["queue.Queue"]
+    ) -> threading.Thread:
+        def run() -> None:
+            try:
+                target()
+            except BaseException as e:  # surface stage failures to the caller
+                self.errors.append(e)
+                # Keep draining so upstream stages never block on a full queue.
+                while inbox is not None and inbox.get() is not _DONE:
+                    pass
+            finally:
+                if out is not None:
+                    out.put(_DONE)
+
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        return t
+
+    def run(self, frames: Iterable[bytes]) -> List[TurnMetrics]:
+        audio_q: "queue.Queue" = queue.Queue(self.queue_size)
+        text_q: "queue.Queue" = queue.Queue(self.queue_size)
+        token_q: "queue.Queue" = queue.Queue(self.queue_size)
+        out_q: "queue.Queue" = queue.Queue(self.queue_size)
+
+        def capture() -> None:
+            for frame in frames:
+                audio_q.put(frame)
+
+        def transcribe() -> None:
+            heard_speech = False
+            quiet = 0
+            while True:
+                frame = audio_q.get()
+                if frame is _DONE:
+                    break
+                loud = frame_rms(frame) >= self.vad_threshold
+                if loud:
+                    heard_speech, quiet = True, 0
+                elif heard_speech:
+                    quiet += 1
+                if heard_speech:
+                    partial = self.stt.accept(frame)
+                    if partial and self.on_partial:
+                        self.on_partial(partial)
+                if heard_speech and quiet >= self.silence_frames:
+                    self._end_utterance(text_q)
+                    heard_speech, quiet = False, 0
+            if heard_speech:
+                self._end_utterance(text_q)
+
+        def think() -> None:
+            while True:
+                turn = text_q.get()
+                if turn is _DONE:
+                    break
+                for chunk in self.respond(turn.transcript):
+                    if not chunk:
+                        continue
+                    if not turn.first_token:
+                        turn.first_token = time.perf_counter()
+                    turn.reply.append(chunk)
+                    if self.on_reply_chunk:
+                        self.on_reply_chunk(chunk)
+                    token_q.put((turn, chunk))
+                turn.llm_done = time.perf_counter()
+                token_q.put((turn, None))
+
+        def speak() -> None:
+            buf = ""
+            while True:
+                item = token_q.get()
+                if item is _DONE:
+                    break
+                turn, chunk = item
+                if chunk is not None:
+                    buf += chunk
+                    if not _SENTENCE_END.search(buf) and len(buf) < 200:
+                        continue
+                text, buf = buf.strip(), ""
+                if text:
+                    for pcm in self.tts.synthesize(text):
+                        out_q.put((turn, pcm))
+                if chunk is None:
+                    out_q.put((turn, None))
+
+        def play() -> None:
+            while True:
+                item = out_q.get()
+                if item is _DONE:
+                    break
+                turn, pcm = item
+                if pcm is None:
+                    turn.audio_done = time.perf_counter()
+                    continue
+                if not turn.first_audio:
+                    turn.first_audio = time.perf_counter()
+                self.sink.write(pcm)
+
+        threads = [
+            self._stage(capture, None, audio_q),
+            self._stage(transcribe, audio_q, text_q),
+            self._stage(think, text_q, token_q),
+            self._stage(speak, token_q, out_q),
+            self._stage(play, out_q, None),
+        ]
+        for t in threads:
+            t.join()
+        if self.errors:
+            raise self.errors[0]
+        return self.turns
+
+    def _end_utterance(self, text_q: "queue.Queue") -> None:
+        text = self.stt.finish().strip()
+        if not text:
+            return
+        turn = TurnMetrics(transcript=text, end_of_speech=time.perf_counter())
+        self.turns.append(turn)
+        text_q.put(turn)
@@ -1,9 +1,12 @@
+import json
 import tempfile
 import unittest
 from pathlib import Path
 
-from aibuddies.buddies import Buddy, BuddyStore
-from aibuddies.config import Paths
+from unittest import mock
+
+from aibuddies.buddies import Buddy, BuddyStore, Change, StoreError, changes_from_document
+from aibuddies.config import Paths, save_json_atomic
 
 
 class BuddyStoreTests(unittest.TestCase):
@@ -38,5 +41,62 @@ class BuddyStoreTests(unittest.TestCase):
         self.assertIsNone(self.store.get("DeleteMe"))
 
 
+class BulkApplyTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = Paths(home=Path(self.tmpdir.name))
+        self.store = BuddyStore(self.paths)
+        for name in ("Keep", "Old"):
+            self.store.create(Buddy(name=name, persona_prompt=f"{name} persona"))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_apply_is_one_write_with_a_diff(self) -> None:
+        changes = [Change("create", f"New{i}", {"persona_prompt": "p", "schedule": ["08:00|Hi"]}) for i in range(3)]
+        changes += [
+            Change("update", "Keep", {"model": "gpt-4o"}),
+            Change("upsert", "Keep", {"emoji": "K"}),
+            Change("delete", "Old"),
+            Change("upsert", "New0", {"persona_prompt": "p"}),  # no-op on top of the create
+        ]
+        with mock.patch("aibuddies.buddies.save_json_atomic", wraps=save_json_atomic) as save:
+            result = self.store.apply(changes)
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual(result.created, ["New0", "New1", "New2"])
+        self.assertEqual(result.deleted, ["Old"])
+        self.assertEqual(result.updated, {"Keep": {"model": ("claude-3-5-sonnet-20240620", "gpt-4o"), "emoji": ("🤖", "K")}})
+        self.assertIn("~ Keep: model 'claude-3-5-sonnet-20240620' -> 'gpt-4o'", result.diff())
+
+        reloaded = BuddyStore(self.paths)
+        self.assertEqual(sorted(reloaded.buddies), ["Keep", "New0", "New1", "New2"])
+        self.assertEqual(reloaded.get("Keep").model, "gpt-4o")
+        self.assertEqual(reloaded.get("New1").schedule, ["08:00|Hi"])
+        on_disk = self.paths.buddies_file.read_text(encoding="utf-8")
+        self.assertEqual(on_disk, json.dumps(json.loads(on_disk), indent=2))  # the layout users hand-edit
+
+    def test_invalid_change_set_changes_nothing(self) -> None:
+        before = self.paths.buddies_file.read_bytes()
+        with self.assertRaises(StoreError) as ctx:
+            self.store.apply([
+                Change("update", "Keep", {"model": "gpt-4o"}),
+                Change("create", "Keep", {"persona_prompt": "dup"}),
+                Change("create", "NoPersona", {}),
+                Change("update", "Keep", {"schedule": "08:00|not a list", "colour": "red"}),
+                Change("delete", "Missing"),
+            ])
+        self.assertEqual(len(ctx.exception.errors), 5)
+        self.assertEqual(self.paths.buddies_file.read_bytes(), before)
+        self.assertEqual(self.store.get("Keep").model, "claude-3-5-sonnet-20240620")
+
+    def test_dry_run_and_documents(self) -> None:
+        doc = json.loads('{"buddies": {"Keep": {"emoji": "K"}, "Fresh": {"persona_prompt": "p"}}, "delete": ["Old"]}')
+        result = self.store.apply(changes_from_document(doc), dry_run=True)
+        self.assertEqual((result.created, list(result.updated), result.deleted), (["Fresh"], ["Keep"], ["Old"]))
+        self.assertIsNotNone(self.store.get("Old"))
+        with self.assertRaises(StoreError):
+            changes_from_document({"buddy": []})
+
+
 if __name__ == "__main__":
     unittest.main()
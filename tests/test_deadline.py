@@ -0,0 +1,119 @@
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from aibuddies import context, metrics
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.deadline import TIMEOUT_MARKER, Deadline, DeadlineExceeded
+from aibuddies.llm import LLMClient
+from aibuddies.ratelimit import RequestScheduler
+from aibuddies.runtime import RuntimeManager
+
+
+class HangingClient(LLMClient):
+    """Answers after `delay` seconds; streams `head` first, then hangs."""
+
+    def __init__(self, delay: float, head: str = "") -> None:
+        self.delay = delay
+        self.head = head
+        self.payloads = []
+        self.release = threading.Event()
+
+    def ask(self, buddy_name, persona_prompt, user_text, opts=None):
+        self.payloads.append(user_text)
+        self.release.wait(self.delay)
+        return "full answer"
+
+    def stream(self, buddy_name, persona_prompt, user_text, opts=None):
+        yield self.head
+        self.release.wait(self.delay)
+        yield " and the rest"
+
+
+class DeadlineTests(unittest.TestCase):
+    def test_budget_shares_and_caps(self) -> None:
+        now = [100.0]
+        deadline = Deadline(10, clock=lambda: now[0])
+        now[0] += 4
+        self.assertEqual(deadline.remaining(), 6)
+        self.assertEqual(deadline.timeout(2), 2)
+        stage = deadline.share(0.5)
+        self.assertEqual(stage.remaining(), 3)
+        now[0] += 7
+        self.assertTrue(deadline.expired() and stage.expired())
+        self.assertRaises(DeadlineExceeded, deadline.check, "llm")
+        self.assertIsNone(Deadline(0).remaining())  # 0 means no deadline
+        self.assertFalse(Deadline(None).share(0.5))
+
+    def test_ratelimit_wait_gives_up_at_the_deadline(self) -> None:
+        scheduler = RequestScheduler({"test": (1, 0)})
+        scheduler.acquire("test", "k")  # the only request this minute
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.acquire("test", "k", deadline=Deadline(0.1))
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(scheduler.stats()[scheduler.bucket_key("test", "k")]["queue_depth"]["interactive"], 0)
+
+
+class RuntimeDeadlineTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.client = HangingClient(delay=5.0, head="Partial")
+        self.runtime = RuntimeManager(Paths(home=Path(self.tmpdir.name)), client_factory=lambda cfg, model: self.client)
+        self.buddy = Buddy(name="Slow", persona_prompt="p", tools_allowed=[], timeout=0.2)
+        self.runtime.running["Slow"] = self.buddy
+
+    def tearDown(self) -> None:
+        self.client.release.set()
+        self.runtime.usage.ledger.close()
+        self.runtime.registry.close()
+        self.tmpdir.cleanup()
+
+    def test_ask_returns_a_marked_reply_when_the_provider_hangs(self) -> None:
+        before = metrics.DEADLINE_EXCEEDED.value(buddy="Slow", stage="llm")
+        started = time.monotonic()
+        reply = self.runtime.ask("Slow", "hello")
+        self.assertLess(time.monotonic() - started, 2.0)
+        self.assertTrue(reply.startswith(TIMEOUT_MARKER))
+        self.assertEqual(metrics.DEADLINE_EXCEEDED.value(buddy="Slow", stage="llm"), before + 1)
+        # An explicit timeout overrides the buddy's; 0 disables it.
+        self.client.release.set()
+        self.assertEqual(self.runtime.ask("Slow", "hello", timeout=0), "full answer")
+
+    def test_ask_keeps_the_text_before_an_unfinished_tool_round(self) -> None:
+        def ask(buddy_name, persona_prompt, user_text, opts=None):
+            opts.partial = "Let me look that up."
+            self.client.release.wait(5.0)
+            return "full answer"
+
+        self.client.ask = ask
+        reply = self.runtime.ask("Slow", "hello")
+        self.assertTrue(reply.startswith("Let me look that up.\n" + TIMEOUT_MARKER), reply)
+
+    def test_stream_keeps_what_arrived_before_the_deadline(self) -> None:
+        chunks = list(self.runtime.stream("Slow", "hello"))
+        self.assertEqual(chunks[0], "Partial")
+        self.assertTrue(chunks[1].startswith("\n" + TIMEOUT_MARKER))
+
+    def test_hung_collector_is_abandoned_and_marked(self) -> None:
+        self.buddy.context_sources = ["window", "clipboard"]
+        self.buddy.timeout = 1.0
+        self.client.delay = 0.0
+        stuck = threading.Event()
+        collectors = dict(context.COLLECTORS, clipboard=lambda buddy: stuck.wait(10) and "never")
+        with mock.patch.object(context, "COLLECTORS", collectors):
+            started = time.monotonic()
+            reply = self.runtime.ask("Slow", "hello")
+        stuck.set()
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(reply, "full answer")
+        self.assertIn("- window: [active window not implemented]", self.client.payloads[-1])
+        self.assertIn(f"- clipboard: {TIMEOUT_MARKER}", self.client.payloads[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
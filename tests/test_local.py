@@ -0,0 +1,201 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.deadline import Deadline
+from aibuddies.llm import AskOptions, DummyLLM, build_client
+from aibuddies.local import LocalClient
+from aibuddies.runtime import RuntimeManager
+
+
+TEMPLATE = "<|system|>{system}\n<|user|>{user}\n<|assistant|>"
+
+
+class _StubServer(BaseHTTPRequestHandler):
+    """OpenAI-compatible stub: echoes the user turn of each prompt; list prompts only if `batching`."""
+
+    protocol_version = "HTTP/1.1"
+    batching = True
+    delay = 0.0
+    requests = []
+    connections = []
+
+    def setup(self) -> None:
+        super().setup()
+        self.connections.append(self.client_address)
+
+    def do_POST(self) -> None:  # noqa: N802 - http.server API
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, body))
+        time.sleep(self.delay)
+        if self.path == "/v1/chat/completions":
+            user = body["messages"][-1]["content"]
+            payload = {
+                "choices": [{"index": 0, "message": {"content": f"{body['model']}: {user}"}}],
+                "usage": {"prompt_tokens": 7, "completion_tokens": 3},
+            }
+        elif self.path == "/v1/completions" and self.batching:
+            prompts = body["prompt"]
+            payload = {"choices": [
+                {"index": i, "text": f" {body['model']}: {p.rsplit('<|user|>', 1)[1].split(chr(10))[0]}"}
+                for i, p in reversed(list(enumerate(prompts)))
+            ]}
+        else:
+            payload = {"error": "prompt must be a string"}
+        data = json.dumps(payload).encode()
+        self.send_response(200 if "error" not in payload else 400)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class LocalProviderTests(unittest.TestCase):
+    def _serve(self, batching: bool = True, delay: float = 0.0) -> str:
+        handler = type(
+            "Stub", (_StubServer,), {"batching": batching, "delay": delay, "requests": [], "connections": []}
+        )
+        self.handler = handler
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    def _ask_concurrently(self, client_for, n: int):
+        replies = [None] * n
+
+        def worker(i: int) -> None:
+            replies[i] = client_for(i).ask(f"B{i}", "persona", f"question {i}")
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        return replies
+
+    def test_concurrent_requests_are_coalesced_into_one_batch(self) -> None:
+        url = self._serve()
+        client = LocalClient(url, "tiny", batch_size=4, batch_wait=5.0, chat_template=TEMPLATE)
+        replies = self._ask_concurrently(lambda i: client, 4)
+        self.assertEqual(replies, [f"tiny: question {i}" for i in range(4)])
+        self.assertEqual([path for path, _ in self.handler.requests], ["/v1/completions"])
+        body = self.handler.requests[0][1]
+        self.assertEqual(body["prompt"][0], "<|system|>persona\n<|user|>question 0\n<|assistant|>")
+        self.assertEqual(len(body["prompt"]), 4)
+
+    def test_without_a_chat_template_every_request_goes_to_chat(self) -> None:
+        url = self._serve()
+        replies = self._ask_concurrently(lambda i: LocalClient(url, "tiny", batch_size=3, batch_wait=5.0), 3)
+        self.assertEqual(replies, [f"tiny: question {i}" for i in range(3)])
+        self.assertEqual([path for path, _ in self.handler.requests], ["/v1/chat/completions"] * 3)
+
+    def test_requests_are_only_batched_with_the_same_max_tokens(self) -> None:
+        url = self._serve()
+        client = LocalClient(url, "tiny", batch_size=2, batch_wait=5.0, chat_template=TEMPLATE)
+        limits = [64, 64, 256, 256]
+        replies = [None] * 4
+
+        def worker(i: int) -> None:
+            replies[i] = client.ask(f"B{i}", "persona", f"question {i}", AskOptions(max_tokens=limits[i]))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(replies, [f"tiny: question {i}" for i in range(4)])
+        batches = sorted((body["max_tokens"], len(body["prompt"])) for _, body in self.handler.requests)
+        self.assertEqual(batches, [(64, 2), (256, 2)])
+
+    def test_falls_back_to_chat_when_server_rejects_batches(self) -> None:
+        url = self._serve(batching=False)
+        replies = self._ask_concurrently(
+            lambda i: LocalClient(url, "tiny", batch_size=3, batch_wait=5.0, chat_template=TEMPLATE), 3
+        )
+        self.assertEqual(replies, [f"tiny: question {i}" for i in range(3)])
+        paths = [path for path, _ in self.handler.requests]
+        self.assertEqual(paths, ["/v1/completions"] + ["/v1/chat/completions"] * 3)
+        client = LocalClient(url, "tiny", batch_size=3, batch_wait=5.0, chat_template=TEMPLATE)
+        self.assertFalse(client.backend.batching)
+        client.ask("B", "persona", "again")  # no longer waits for a batch
+        self.assertEqual(self.handler.requests[-1][0], "/v1/chat/completions")
+
+    def test_batch_request_gives_up_at_the_earliest_deadline(self) -> None:
+        url = self._serve(delay=3.0)
+        client = LocalClient(url, "tiny", batch_size=2, batch_wait=5.0, chat_template=TEMPLATE)
+        replies = [None] * 2
+
+        def worker(i: int) -> None:
+            opts = AskOptions(deadline=Deadline(0.3) if i == 0 else None)
+            replies[i] = client.ask(f"B{i}", "persona", f"question {i}", opts)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertLess(time.monotonic() - started, 2.0)  # not the server's 3 s, nor the pool's 120 s
+        self.assertEqual([path for path, _ in self.handler.requests], ["/v1/completions"])
+        self.assertTrue(all(r.startswith("[Local error]") for r in replies), replies)
+
+    def test_sequential_requests_reuse_one_connection(self) -> None:
+        url = self._serve()
+        client = LocalClient(url, "tiny", batch_wait=0.0)
+        for i in range(5):
+            self.assertEqual(client.ask("B", "persona", f"q{i}"), f"tiny: q{i}")
+        self.assertEqual(len(self.handler.connections), 1)
+        self.assertEqual(client.last_usage["output_tokens"], 3)
+
+    def test_model_selected_per_buddy(self) -> None:
+        url = self._serve()
+        cfg = {"local_base_url": url, "local_model": "fallback-7b", "local_batch_wait_ms": "0"}
+        self.assertEqual(build_client(cfg, "local:coder-1.5b").ask("B", "p", "hi"), "coder-1.5b: hi")
+        self.assertEqual(build_client(cfg, "local:").ask("B", "p", "hi"), "fallback-7b: hi")
+        # With no cloud key configured, every buddy goes to the local server.
+        self.assertIsInstance(build_client(cfg, "claude-3-5-sonnet-20240620"), LocalClient)
+        self.assertIsInstance(build_client({}, "local:coder-1.5b"), DummyLLM)
+        self.assertIsNone(build_client(cfg, "local:").chat_template)
+        cfg["local_chat_template"] = "<|user|>{user}\\n<|assistant|>"  # as typed in `config set`
+        self.assertEqual(build_client(cfg, "local:").chat_template, "<|user|>{user}\n<|assistant|>")
+
+    def test_private_docs_go_to_the_local_server(self) -> None:
+        url = self._serve()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        paths = Paths(home=Path(tmp.name))
+        paths.ensure()
+        paths.config_file.write_text(json.dumps({
+            "openai_api_key": "sk-unused", "local_base_url": url, "local_model": "private-3b",
+            "local_batch_wait_ms": "0", "local_for_private_docs": "true",
+        }), encoding="utf-8")
+        (paths.docs_dir / "Doc").mkdir(parents=True)
+        (paths.docs_dir / "Doc" / "notes.md").write_text("The launch code is 1234.", encoding="utf-8")
+        runtime = RuntimeManager(paths)
+        self.addCleanup(runtime.usage.ledger.close)
+        self.addCleanup(runtime.registry.close)
+        runtime.running["Doc"] = Buddy(name="Doc", persona_prompt="p", pinned_docs=["notes.md"], tools_allowed=[])
+
+        self.assertEqual(runtime.ask("Doc", "what is the code?"), "private-3b: what is the code?")
+        path, body = self.handler.requests[-1]
+        self.assertEqual(path, "/v1/chat/completions")
+        self.assertIn("The launch code is 1234.", body["messages"][0]["content"])
+        # Opt-in only: without the flag the buddy keeps its own model.
+        cfg = {"local_base_url": url, "local_model": "private-3b"}
+        self.assertEqual(RuntimeManager._model_for(runtime.running["Doc"], cfg), runtime.running["Doc"].model)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import sys
+import tempfile
+import types
+import unittest
+import urllib.request
+from pathlib import Path
+from unittest import mock
+
+from aibuddies import metrics
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.llm import ClaudeClient, DummyLLM
+from aibuddies.runtime import RuntimeManager
+
+
+class MetricsTests(unittest.TestCase):
+    def test_counter_and_histogram_render(self) -> None:
+        reg = metrics.Registry()
+        c = reg.counter("t_requests_total", "Requests.", ("buddy",))
+        h = reg.histogram("t_latency_seconds", "Latency.", ("buddy",), buckets=(0.1, 1.0))
+        c.inc(buddy="A")
+        c.inc(2, buddy="A")
+        h.observe(0.05, buddy="A")
+        h.observe(0.5, buddy="A")
+        h.observe(5.0, buddy="A")
+        text = reg.render()
+        self.assertIn('t_requests_total{buddy="A"} 3', text)
+        self.assertIn('t_latency_seconds_bucket{buddy="A",le="0.1"} 1', text)
+        self.assertIn('t_latency_seconds_bucket{buddy="A",le="1"} 2', text)
+        self.assertIn('t_latency_seconds_bucket{buddy="A",le="+Inf"} 3', text)
+        self.assertIn('t_latency_seconds_count{buddy="A"} 3', text)
+
+    def test_snapshots_from_other_processes_are_merged(self) -> None:
+        worker = metrics.Registry()
+        worker.counter("t_requests_total", "Requests.", ("buddy",)).inc(2, buddy="A")
+        worker.histogram("t_latency_seconds", "Latency.", ("buddy",), buckets=(0.1, 1.0)).observe(0.5, buddy="A")
+        retired = metrics.merge_snapshots({}, worker.snapshot())
+
+        class Source:
+            def snapshots(self):
+                return [retired, worker.snapshot()]
+
+        reg = metrics.Registry()
+        reg.counter("t_requests_total", "Requests.", ("buddy",)).inc(buddy="A")
+        reg.histogram("t_latency_seconds", "Latency.", ("buddy",), buckets=(0.1, 1.0)).observe(0.05, buddy="A")
+        source = Source()
+        reg.add_source(source, "snapshots")
+        text = reg.render()
+        self.assertIn('t_requests_total{buddy="A"} 5', text)
+        self.assertIn('t_latency_seconds_bucket{buddy="A",le="0.1"} 1', text)
+        self.assertIn('t_latency_seconds_count{buddy="A"} 3', text)
+
+    def test_errors_are_classified(self) -> None:
+        self.assertEqual(metrics.classify_error("Your credit balance is too low"), "billing")
+        self.assertEqual(metrics.classify_error("Error code: 429 rate_limit_error"), "rate_limit")
+        self.assertEqual(metrics.classify_error("model: not_found_error"), "not_found")
+        before = metrics.LLM_REQUESTS.value(buddy="M", provider="claude", model="x", outcome="error")
+        metrics.record_llm_call("M", "claude", "x", 0.2, error="Request timed out")
+        self.assertEqual(metrics.LLM_REQUESTS.value(buddy="M", provider="claude", model="x", outcome="error"), before + 1)
+        self.assertEqual(metrics.LLM_REQUESTS.value(buddy="M", provider="claude", model="x", outcome="ok"), 0)
+        self.assertGreaterEqual(metrics.LLM_ERRORS.value(buddy="M", provider="claude", model="x", kind="timeout"), 1)
+
+    def test_streamed_turns_are_recorded(self) -> None:
+        class Stream:
+            text_stream = ["hello", " world"]
+
+            def __enter__(self):
+                if fail:
+                    raise RuntimeError("Request timed out")
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def get_final_message(self):
+                return types.SimpleNamespace(usage=types.SimpleNamespace(input_tokens=12, output_tokens=2))
+
+        fail = False
+        fake = types.ModuleType("anthropic")
+        fake.Anthropic = lambda **_: types.SimpleNamespace(messages=types.SimpleNamespace(stream=lambda **kw: Stream()))
+        labels = {"buddy": "Streamer", "provider": "claude", "model": "claude-stream"}
+        with mock.patch.dict(sys.modules, {"anthropic": fake}):
+            client = ClaudeClient("sk-test", "claude-stream")
+            self.assertEqual("".join(client.stream("Streamer", "p", "hi")), "hello world")
+            self.assertEqual(metrics.LLM_REQUESTS.value(outcome="ok", **labels), 1)
+            self.assertEqual(metrics.LLM_TOKENS.value(kind="completion", **labels), 2)
+
+            fail = True
+            self.assertIn("[Claude error]", "".join(client.stream("Streamer", "p", "hi")))
+            self.assertEqual(metrics.LLM_REQUESTS.value(outcome="error", **labels), 1)
+            self.assertEqual(metrics.LLM_ERRORS.value(kind="timeout", **labels), 1)
+            self.assertEqual(metrics.LLM_LATENCY.count(**labels), 2)
+
+    def test_queue_depth_and_endpoint(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            runtime = RuntimeManager(Paths(home=Path(tmp)), client_factory=lambda cfg, model: DummyLLM())
+            buddy = Buddy(name="Depth", persona_prompt="p", autorun_interval="1m")
+            runtime.running[buddy.name] = buddy
+            runtime.proactive_tick()
+            runtime.enqueue(buddy.name, "extra")
+            self.assertEqual(metrics.QUEUE_DEPTH.collect()[("Depth",)], 2)
+
+            server = metrics.serve(0)
+            try:
+                port = server.server_address[1]
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as resp:
+                    body = resp.read().decode("utf-8")
+            finally:
+                server.shutdown()
+                server.server_close()
+            self.assertIn('aibuddies_message_queue_depth{buddy="Depth"} 2', body)
+            self.assertIn('aibuddies_proactive_messages_total{buddy="Depth",kind="interval"}', body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths, set_config
+from aibuddies.llm import LLMClient
+from aibuddies.notify import Coalescer, parse_digest_reply
+from aibuddies.runtime import RuntimeManager
+from aibuddies.usage import split_usage
+
+CHECK_IN = "It's time to check in. Share a quick update or I'll suggest something."
+
+
+class DigestClient(LLMClient):
+    """Answers a digest request for every buddy except those in `skip`."""
+
+    def __init__(self, requests: list, skip=()) -> None:
+        self.requests = requests
+        self.skip = skip
+
+    def ask(self, buddy_name, persona_prompt, user_text, opts=None):
+        self.requests.append(user_text)
+        listing = user_text.split("Buddies:\n", 1)[1].split("\n\n", 1)[0]
+        names = [line[2:].split(":", 1)[0] for line in listing.splitlines()]
+        self.labels = getattr(self, "labels", []) + [opts.label]
+        self.last_usage = {"input_tokens": 1001, "output_tokens": 40, "cache_read_tokens": 0, "cache_write_tokens": 0}
+        return json.dumps({n: f"{n} says hi" for n in names if n not in self.skip})
+
+
+class CoalescerTests(unittest.TestCase):
+    def test_leading_edge_then_one_digest_per_window(self) -> None:
+        now = [0.0]
+        c = Coalescer(window=60, clock=lambda: now[0])
+        c.add("A", "Drink water")
+        first = c.flush()
+        self.assertEqual(first.message("A"), "Drink water")
+
+        now[0] = 10
+        c.add("A", "Drink water")
+        self.assertFalse(c.add("A", "drink  WATER"))  # identical after normalizing
+        c.add("A", "Stretch")
+        c.add("B", "Stand up", kind="schedule")
+        self.assertIsNone(c.flush())  # still inside the window
+        now[0] = 60
+        digest = c.flush()
+        self.assertEqual(digest.message("A"), "2 updates:\n- Drink water (x2)\n- Stretch")
+        self.assertEqual(digest.message("B"), "Stand up")
+        self.assertEqual(c.pending(), 0)
+
+    def test_split_usage_keeps_totals(self) -> None:
+        usage = {"input_tokens": 10, "output_tokens": 7}
+        parts = split_usage(usage, {"A": 3.0, "B": 1.0, "C": 0.0})
+        self.assertEqual([p["input_tokens"] for p in parts.values()], [4, 3, 3])
+        self.assertEqual([p["output_tokens"] for p in parts.values()], [5, 2, 0])
+
+    def test_parse_digest_reply_keeps_known_names(self) -> None:
+        raw = 'Sure! {"a": "hello", "B": "", "C": 3, "Z": "stray"}'
+        self.assertEqual(parse_digest_reply(raw, ["A", "B", "C"]), {"A": "hello"})
+        self.assertEqual(parse_digest_reply("not json", ["A"]), {})
+
+
+class RuntimeDigestTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = Paths(home=Path(self.tmpdir.name))
+        self.requests = []
+        self.runtime = RuntimeManager(
+            self.paths, client_factory=lambda cfg, model: DigestClient(self.requests, skip=("B3",))
+        )
+        self.names = [f"B{i}" for i in range(5)]
+        for name in self.names:
+            self.runtime.running[name] = Buddy(name=name, persona_prompt=f"{name} persona", autorun_interval="1m")
+
+    def tearDown(self) -> None:
+        self.runtime.usage.ledger.close()
+        self.runtime.registry.close()
+        self.tmpdir.cleanup()
+
+    def test_proactive_prompts_for_many_buddies_are_one_llm_request(self) -> None:
+        set_config("proactive_llm", "true", self.paths)
+        self.runtime.proactive_tick()
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.requests[0].count(repr(CHECK_IN)), 1)  # shared prompt listed once
+        self.assertEqual(self.runtime.drain_queue("B0"), ["B0 says hi"])
+        self.assertEqual(self.runtime.drain_queue("B3"), [CHECK_IN])  # missing from reply
+
+    def test_digest_usage_is_recorded_per_buddy(self) -> None:
+        client = DigestClient(self.requests, skip=("B3",))
+        self.runtime.client_factory = lambda cfg, model: client
+        set_config("proactive_llm", "true", self.paths)
+        self.runtime.proactive_tick()
+        self.assertEqual(client.labels, [""])  # metrics do not attribute it to one buddy (or a made-up one)
+        ledger = self.runtime.usage.ledger
+        self.assertEqual(ledger.recent("B0", "proactive"), [(10, 160)])
+        self.assertEqual(ledger.recent("B3", "proactive"), [])  # not answered: recorded as an error
+        rows = ledger.report()
+        self.assertEqual(sorted(row.buddy for row in rows), self.names)
+        self.assertEqual(sum(row.input_tokens for row in rows), 1001)
+
+    def test_ticks_inside_the_window_are_held_and_deduplicated(self) -> None:
+        set_config("notify_window", "600", self.paths)
+        self.runtime.proactive_tick()
+        self.assertEqual(self.runtime.drain_queue("B0"), [CHECK_IN])
+        for _ in range(3):
+            self.runtime._last_tick.clear()
+            self.runtime.proactive_tick()
+        self.assertEqual(self.runtime.drain_queue("B0"), [])
+        self.assertEqual(self.runtime.deliver_notifications(force=True), 5)
+        self.assertEqual(self.runtime.drain_queue("B0"), [f"{CHECK_IN} (x3)"])
+        self.assertEqual(self.requests, [])  # canned prompts unless proactive_llm is set
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import gzip
+import io
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from aibuddies.buddies import Buddy, BuddyStore
+from aibuddies.config import Paths
+from aibuddies.docs import DocIndex
+from aibuddies.packs import PackError, export_pack, import_pack
+
+
+class PackTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = Path(self.tmpdir.name)
+        self.src = Paths(home=root / "src")
+        self.dst = Paths(home=root / "dst")
+        self.out = root / "doctor_pack.tar"
+        self.buddy = Buddy(name="Doctor", persona_prompt="You are a cautious doctor.", docs_enabled=True)
+        self.buddy.doc_privacy["export_allowed"] = True
+        BuddyStore(self.src).create(self.buddy)
+        docs = self.src.docs_dir / "Doctor"
+        docs.mkdir(parents=True)
+        (docs / "history.txt").write_bytes(b"allergies: none\n" * 5000)
+        (docs / "copy.txt").write_bytes(b"allergies: none\n" * 5000)
+        (docs / "notes.md").write_text("take zinc", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_roundtrip_dedupes_identical_content(self) -> None:
+        manifest = export_pack(self.buddy, self.out, include_docs=True, paths=self.src, workers=2)
+        self.assertEqual(len(manifest["files"]), 3)
+        with tarfile.open(self.out) as tar:
+            blobs = [n for n in tar.getnames() if n.startswith("blobs/")]
+        self.assertEqual(len(blobs), 2)  # history.txt and copy.txt share a blob
+
+        store = BuddyStore(self.dst)
+        report = import_pack(self.out, paths=self.dst, store=store)
+        self.assertEqual(report["written"], 2)
+        self.assertEqual(report["reused"], 1)
+        self.assertIsNotNone(store.get("Doctor"))
+        self.assertEqual((self.dst.docs_dir / "Doctor" / "notes.md").read_text(encoding="utf-8"), "take zinc")
+
+        again = import_pack(self.out, paths=self.dst, store=store, overwrite=True)
+        self.assertEqual(again["unchanged"], 3)
+        self.assertEqual(again["written"], 0)
+
+    def test_reused_docs_stay_independent_across_buddies(self) -> None:
+        export_pack(self.buddy, self.out, include_docs=True, paths=self.src)
+        nurse = self.dst.docs_dir / "Nurse" / "notes.md"
+        nurse.parent.mkdir(parents=True)
+        nurse.write_text("take zinc", encoding="utf-8")  # same bytes as the pack's notes.md
+        report = import_pack(self.out, paths=self.dst, store=BuddyStore(self.dst))
+        self.assertGreaterEqual(report["reused"], 1)
+        doctor = self.dst.docs_dir / "Doctor" / "notes.md"
+        self.assertNotEqual(doctor.stat().st_ino, nurse.stat().st_ino)
+
+        update = Path(self.tmpdir.name) / "notes.md"
+        update.write_text("take vitamin D", encoding="utf-8")
+        DocIndex(self.dst).add("Doctor", update)
+        self.assertEqual(doctor.read_text(encoding="utf-8"), "take vitamin D")
+        self.assertEqual(nurse.read_text(encoding="utf-8"), "take zinc")
+
+    def test_export_respects_privacy(self) -> None:
+        self.buddy.doc_privacy["export_allowed"] = False
+        with self.assertRaises(PackError):
+            export_pack(self.buddy, self.out, include_docs=True, paths=self.src)
+        manifest = export_pack(self.buddy, self.out, paths=self.src)
+        self.assertEqual(manifest["files"], [])
+
+    def test_tampered_pack_is_rejected(self) -> None:
+        export_pack(self.buddy, self.out, include_docs=True, paths=self.src)
+        tampered = self.out.with_name("tampered.tar")
+        with tarfile.open(self.out) as src, tarfile.open(tampered, "w") as dst:
+            for member in src.getmembers():
+                data = src.extractfile(member).read()
+                if member.name == "buddy.json":
+                    data = data.replace(b"cautious", b"reckless")
+                    member.size = len(data)
+                dst.addfile(member, io.BytesIO(data))
+        with self.assertRaises(PackError):
+            import_pack(tampered, paths=self.dst)
+        self.assertEqual(list((self.dst.docs_dir).glob("Doctor/*")), [])
+
+    def test_blob_larger_than_its_manifest_entry_is_not_unpacked(self) -> None:
+        manifest = export_pack(self.buddy, self.out, include_docs=True, paths=self.src)
+        notes = next(f for f in manifest["files"] if f["name"] == "notes.md")
+        bomb = self.out.with_name("bomb.tar")
+        with tarfile.open(self.out) as src, tarfile.open(bomb, "w") as dst:
+            for member in src.getmembers():
+                data = src.extractfile(member).read()
+                if member.name == notes["blob"]:
+                    data = gzip.compress(b"\0" * (8 * 1024 * 1024))  # 8 MB behind a few KB
+                    member.size = len(data)
+                dst.addfile(member, io.BytesIO(data))
+        with self.assertRaises(PackError) as err:
+            import_pack(bomb, paths=self.dst)
+        self.assertIn("larger than the manifest says", str(err.exception))
+        self.assertEqual([p.name for p in self.dst.docs_dir.iterdir()], [])
+
+    def test_failed_import_puts_existing_docs_back(self) -> None:
+        export_pack(self.buddy, self.out, include_docs=True, paths=self.src)
+        store = BuddyStore(self.dst)
+        store.create(Buddy(name="Doctor", persona_prompt="old"))
+        docs = self.dst.docs_dir / "Doctor"
+        docs.mkdir(parents=True)
+        (docs / "notes.md").write_text("old notes", encoding="utf-8")
+        with mock.patch.object(BuddyStore, "create", side_effect=OSError("disk full")), self.assertRaises(OSError):
+            import_pack(self.out, paths=self.dst, store=store, overwrite=True)
+        self.assertEqual(sorted(p.name for p in docs.iterdir()), ["notes.md"])
+        self.assertEqual((docs / "notes.md").read_text(encoding="utf-8"), "old notes")
+        self.assertEqual(BuddyStore(self.dst).get("Doctor").persona_prompt, "old")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths, set_config
+from aibuddies.llm import LLMClient
+from aibuddies.precompute import PrecomputeCache, upcoming
+from aibuddies.ratelimit import PRIORITY_BACKGROUND, PRIORITY_SCHEDULED
+from aibuddies.runtime import RuntimeManager
+
+
+class NamingClient(LLMClient):
+    def __init__(self, calls: list) -> None:
+        self.calls = calls
+
+    def ask(self, buddy_name, persona_prompt, user_text, opts=None):
+        self.calls.append(opts.priority)
+        return json.dumps({"Coach": f"reply {len(self.calls)}"})
+
+
+class PrecomputeCacheTests(unittest.TestCase):
+    def test_bounded_and_checked_against_fingerprint(self) -> None:
+        cache = PrecomputeCache(capacity=2)
+        cache.put("A", "r1", "fp", "one")
+        cache.put("A", "r2", "fp", "two")
+        cache.put("A", "r3", "fp", "three")
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.take("A", "r1", "fp"))  # evicted
+        self.assertIsNone(cache.take("A", "r2", "changed"))  # stale, and dropped
+        self.assertIsNone(cache.take("A", "r2", "fp"))
+        self.assertEqual(cache.take("A", "r3", "fp"), "three")
+
+    def test_upcoming_entries_in_lead_window(self) -> None:
+        now = time.mktime((2026, 3, 10, 23, 50, 0, 0, 0, -1))
+        buddy = Buddy(name="A", persona_prompt="p", schedule=["23:55|Wind down", "00:05|Sleep", "12:00|Lunch", "bad"])
+        got = [(ref, msg) for _, ref, msg in upcoming(buddy, now, 20 * 60)]
+        self.assertEqual(got, [("20260310:23:55", "Wind down"), ("20260311:00:05", "Sleep")])
+
+
+class RuntimePrecomputeTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = Paths(home=Path(self.tmpdir.name))
+        set_config("proactive_llm", "true", self.paths)
+        self.calls = []
+        self.runtime = RuntimeManager(self.paths, client_factory=lambda cfg, model: NamingClient(self.calls))
+        self.now = time.time()
+        hhmm = time.strftime("%H:%M", time.localtime(self.now + 300))
+        self.buddy = Buddy(name="Coach", persona_prompt="p", autorun_interval="manual", schedule=[f"{hhmm}|Stretch"])
+        self.runtime.running["Coach"] = self.buddy
+        self.ref = upcoming(self.buddy, self.now, 600)[0][1]
+
+    def tearDown(self) -> None:
+        self.runtime.usage.ledger.close()
+        self.runtime.registry.close()
+        self.tmpdir.cleanup()
+
+    def fire(self) -> list:
+        self.runtime.notifications.add("Coach", "Stretch", "schedule", ref=self.ref)
+        self.runtime.deliver_notifications(force=True)
+        return self.runtime.drain_queue("Coach")
+
+    def test_reply_is_generated_ahead_and_delivered_without_a_request(self) -> None:
+        self.assertEqual(self.runtime.precompute_upcoming(self.now), 1)
+        self.assertEqual(self.calls, [PRIORITY_BACKGROUND])
+        self.assertEqual(self.runtime.precompute_upcoming(self.now), 0)  # already cached
+        self.assertEqual(self.fire(), ["reply 1"])
+        self.assertEqual(len(self.calls), 1)
+
+    def test_precomputed_reply_is_used_alongside_other_notices(self) -> None:
+        self.runtime.precompute_upcoming(self.now)
+        self.runtime.notifications.add("Coach", "It's time to check in.", "interval")
+        self.assertEqual(self.fire(), ["reply 1", "reply 2"])  # the schedule entry, then the rest
+        self.assertEqual(self.calls, [PRIORITY_BACKGROUND, PRIORITY_SCHEDULED])
+
+    def test_persona_change_invalidates_the_precomputed_reply(self) -> None:
+        self.runtime.precompute_upcoming(self.now)
+        self.buddy.persona_prompt = "a different persona"
+        self.assertEqual(self.fire(), ["reply 2"])
+        self.assertEqual(self.calls, [PRIORITY_BACKGROUND, PRIORITY_SCHEDULED])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import json
+import sys
+import tempfile
+import threading
+import types
+import unittest
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+from aibuddies import metrics
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.llm import ClaudeClient, OpenAIClient
+from aibuddies.runtime import RuntimeManager
+
+
+class _StubProvider(BaseHTTPRequestHandler):
+    """Records raw request bodies; reports a cache hit when the prefix before "messages" was seen before."""
+
+    bodies = []
+    prefixes = set()
+
+    def do_POST(self) -> None:  # noqa: N802 - http.server API
+        raw = self.rfile.read(int(self.headers["Content-Length"]))
+        self.bodies.append(raw)
+        prefix = raw[: raw.index(b'"messages"')] if self.path == "/v1/messages" else json.dumps(
+            json.loads(raw)["messages"][0]).encode()
+        hit = prefix in self.prefixes
+        self.prefixes.add(prefix)
+        size = len(prefix) // 4
+        if self.path == "/v1/messages":
+            payload = {
+                "content": [{"text": "ok"}],
+                "usage": {"input_tokens": 5, "output_tokens": 2,
+                          "cache_read_input_tokens": size if hit else 0,
+                          "cache_creation_input_tokens": 0 if hit else size},
+            }
+        else:
+            payload = {
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"prompt_tokens": size + 5, "completion_tokens": 2,
+                          "prompt_tokens_details": {"cached_tokens": size if hit else 0}},
+            }
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _ns(value):
+    if isinstance(value, dict):
+        return types.SimpleNamespace(**{k: _ns(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_ns(v) for v in value]
+    return value
+
+
+def _fake_sdks(base_url: str):
+    """Minimal anthropic/openai SDK stand-ins that send the request kwargs, in order, to the stub server."""
+
+    def post(path, kwargs):
+        req = urllib.request.Request(base_url + path, data=json.dumps(kwargs).encode(), method="POST")
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return _ns(json.loads(resp.read()))
+
+    anthropic = types.ModuleType("anthropic")
+    anthropic.Anthropic = lambda **_: types.SimpleNamespace(
+        messages=types.SimpleNamespace(create=lambda **kw: post("/v1/messages", kw))
+    )
+    openai = types.ModuleType("openai")
+    openai.OpenAI = lambda **_: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=lambda **kw: post("/v1/chat/completions", kw)))
+    )
+    return {"anthropic": anthropic, "openai": openai}
+
+
+class PromptCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = Paths(home=Path(self.tmpdir.name))
+        handler = type("Stub", (_StubProvider,), {"bodies": [], "prefixes": set()})
+        self.handler = handler
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        patcher = mock.patch.dict(sys.modules, _fake_sdks(base_url))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.buddy = Buddy(name="Cache", persona_prompt="You are a careful reviewer.", context_sources=["window"])
+        self.buddy.pinned_docs = ["guide.md"]
+        self.buddy.doc_privacy["allow_cloud_with_docs"] = True
+        doc_dir = self.paths.docs_dir / "Cache"
+        doc_dir.mkdir(parents=True)
+        (doc_dir / "guide.md").write_text("Always check the tests first.\n" * 50, encoding="utf-8")
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def _runtime(self, make_client):
+        clients = []
+
+        def factory(cfg, model):
+            clients.append(make_client(model))
+            return clients[-1]
+
+        runtime = RuntimeManager(self.paths, client_factory=factory)
+        runtime.running[self.buddy.name] = self.buddy
+        return runtime, clients
+
+    def test_claude_prefix_is_cached_and_byte_identical(self) -> None:
+        runtime, clients = self._runtime(lambda model: ClaudeClient("sk-test", model))
+        before = metrics.LLM_TOKENS.value(buddy="Cache", provider="claude", model=self.buddy.model, kind="cache_read")
+        runtime.ask("Cache", "first question")
+        runtime.ask("Cache", "a different second question")
+
+        first, second = self.handler.bodies
+        cut = first.index(b'"messages"')
+        self.assertEqual(first[:cut], second[:cut])
+        self.assertNotEqual(first, second)
+        system = json.loads(first)["system"]
+        self.assertEqual(system[-1]["cache_control"], {"type": "ephemeral"})
+        self.assertIn("Always check the tests first.", system[-1]["text"])
+        user = json.loads(second)["messages"][0]["content"]
+        self.assertTrue(user.startswith("Context:\n") and user.endswith("a different second question"))
+
+        self.assertGreater(clients[0].last_usage["cache_write_tokens"], 0)
+        self.assertEqual(clients[1].last_usage["cache_write_tokens"], 0)
+        self.assertGreater(clients[1].last_usage["cache_read_tokens"], 0)
+        after = metrics.LLM_TOKENS.value(buddy="Cache", provider="claude", model=self.buddy.model, kind="cache_read")
+        self.assertEqual(after - before, clients[1].last_usage["cache_read_tokens"])
+
+    def test_openai_keeps_stable_system_message_first(self) -> None:
+        runtime, clients = self._runtime(lambda model: OpenAIClient("sk-test", model))
+        runtime.ask("Cache", "first question")
+        runtime.ask("Cache", "second question")
+        first, second = (json.loads(b)["messages"] for b in self.handler.bodies)
+        self.assertEqual(first[0]["role"], "system")
+        self.assertEqual(json.dumps(first[0]), json.dumps(second[0]))
+        self.assertIn("Always check the tests first.", first[0]["content"])
+        self.assertEqual(clients[0].last_usage["cache_read_tokens"], 0)
+        self.assertGreater(clients[1].last_usage["cache_read_tokens"], 0)
+
+    def test_pinned_docs_respect_cloud_privacy(self) -> None:
+        self.buddy.doc_privacy["allow_cloud_with_docs"] = False
+        runtime, _ = self._runtime(lambda model: ClaudeClient("sk-test", model))
+        runtime.ask("Cache", "question")
+        system = json.loads(self.handler.bodies[0])["system"]
+        self.assertNotIn("Always check the tests first.", system[0]["text"])
+
+
+if __name__ == "__main__":
+    unittest.main()
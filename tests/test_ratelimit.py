@@ -0,0 +1,96 @@
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+from aibuddies.llm import ClaudeClient
+from aibuddies.ratelimit import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RequestScheduler,
+    TokenBucket,
+    retry_after,
+)
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry: str) -> None:
+        super().__init__("rate limited")
+        self.response = type("Resp", (), {"status_code": 429, "headers": {"retry-after": retry}})()
+
+
+class RequestSchedulerTests(unittest.TestCase):
+    def test_bucket_wait_time(self) -> None:
+        bucket = TokenBucket(60)  # one token per second
+        now = time.monotonic()
+        bucket.consume(60, now)
+        self.assertAlmostEqual(bucket.wait_time(2, now), 2.0, places=2)
+
+    def test_interactive_admitted_before_background(self) -> None:
+        sched = RequestScheduler(limits={"test": (600, 0)})  # 10 requests/sec
+        sched.acquire("test", "k", priority=PRIORITY_BACKGROUND)
+        limiter = sched._limiter("test", "k")
+        limiter.requests.tokens = 0  # next admission waits ~100ms
+        order = []
+
+        def worker(priority: int) -> None:
+            sched.acquire("test", "k", priority=priority)
+            order.append(priority)
+
+        threads = [threading.Thread(target=worker, args=(PRIORITY_BACKGROUND,)) for _ in range(3)]
+        for t in threads:
+            t.start()
+        time.sleep(0.02)
+        interactive = threading.Thread(target=worker, args=(PRIORITY_INTERACTIVE,))
+        interactive.start()
+        for t in threads + [interactive]:
+            t.join(timeout=5)
+        self.assertLessEqual(order.index(PRIORITY_INTERACTIVE), 1)
+        stats = sched.stats()[sched.bucket_key("test", "k")]
+        self.assertEqual(stats["admitted"]["background"], 4)
+        self.assertEqual(sum(stats["queue_depth"].values()), 0)
+
+    def test_retry_after_is_honoured(self) -> None:
+        sched = RequestScheduler(limits={"test": (0, 0)})
+        calls = []
+
+        def flaky() -> str:
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RateLimited("0.05")
+            return "ok"
+
+        self.assertEqual(sched.call("test", "k", flaky), "ok")
+        self.assertGreaterEqual(calls[1] - calls[0], 0.05)
+        self.assertEqual(retry_after(RateLimited("2")), (True, 2.0))
+        self.assertEqual(retry_after(ValueError("boom")), (False, None))
+
+    def test_stream_is_retried_when_opening_it_is_rate_limited(self) -> None:
+        entered = []
+
+        class Stream:
+            text_stream = ["hello", " world"]
+
+            def __enter__(self):
+                entered.append(time.monotonic())
+                if len(entered) == 1:
+                    raise RateLimited("0.01")  # the SDK sends the request on enter
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+        fake = types.ModuleType("anthropic")
+        fake.Anthropic = lambda **_: types.SimpleNamespace(messages=types.SimpleNamespace(stream=lambda **kw: Stream()))
+        with mock.patch.dict(sys.modules, {"anthropic": fake}):
+            client = ClaudeClient("sk-test", "claude-test")
+            self.assertEqual("".join(client.stream("B", "p", "hi")), "hello world")
+        self.assertEqual(len(entered), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
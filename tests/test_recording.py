@@ -0,0 +1,75 @@
+import gzip
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from aibuddies import recording
+from aibuddies.llm import DummyLLM, LLMClient, build_client
+from aibuddies.loadgen import run_load
+
+
+class SlowEcho(LLMClient):
+    model = "echo-1"
+
+    def ask(self, buddy_name, persona_prompt, user_text, opts=None):
+        return f"{buddy_name}: {user_text}"
+
+
+class RecordReplayTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "traffic.jsonl.gz"
+
+    def tearDown(self) -> None:
+        recording.close_recorders()
+        self.tmpdir.cleanup()
+
+    def _record(self) -> None:
+        client = recording.RecordingClient(SlowEcho(), self.path)
+        client.ask("A", "persona A", "hello")
+        client.ask("B", "persona B", "hi there")
+        self.assertEqual("".join(client.stream("A", "persona A", "streamed")), "A: streamed")
+        recording.close_recorders()
+
+    def test_recording_is_compact_jsonl(self) -> None:
+        self._record()
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([r["buddy"] for r in rows], ["A", "B", "A"])
+        self.assertEqual(rows[0]["model"], "echo-1")
+        self.assertEqual(rows[0]["key"], recording.request_key("persona A", "hello"))
+        self.assertFalse(rows[0]["error"])
+        self.assertGreaterEqual(rows[0]["t"], 0)
+
+    def test_replay_matches_requests_and_samples_latency(self) -> None:
+        self._record()
+        replay = recording.ReplayClient(self.path, speed=0, seed=1)
+        self.assertEqual(replay.ask("B", "persona B", "hi there"), "B: hi there")
+        rec, latency = replay.pick("A", "persona A", "never recorded")
+        self.assertEqual(rec["buddy"], "A")
+        self.assertIn(latency, replay.latencies)
+
+    def test_build_client_honours_replay_and_record_config(self) -> None:
+        self._record()
+        client = build_client({"llm_replay": str(self.path), "llm_replay_speed": "0"}, "any")
+        self.assertIsInstance(client, recording.ReplayClient)
+        self.assertIs(client, build_client({"llm_replay": str(self.path), "llm_replay_speed": "0"}, "any"))
+        missing = build_client({"llm_replay": str(self.path) + ".missing"}, "any")
+        self.assertIsInstance(missing, DummyLLM)
+
+    def test_loadgen_reports_latency_percentiles(self) -> None:
+        self._record()
+        replay = recording.ReplayClient(self.path, speed=0, seed=2)
+        report = run_load(lambda cfg, model: replay, buddies=5, duration=0.5, chat_rate=10, proactive_rate=4, workers=4, seed=3)
+        self.assertGreater(report.requests["chat"], 0)
+        self.assertGreater(report.requests["proactive"], 0)
+        self.assertEqual(sum(report.errors.values()), 0)
+        lat = report.latency_ms["chat"]
+        self.assertLessEqual(lat["p50"], lat["p99"])
+        self.assertLessEqual(lat["p99"], lat["max"])
+        self.assertIn("req/s", report.format())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.registry import BuddyRegistry
+from aibuddies.runtime import RuntimeManager
+
+
+class RegistryTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = Paths(home=Path(self.tmpdir.name))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_dead_and_stale_entries_are_detected(self) -> None:
+        reg = BuddyRegistry(self.paths.registry_file, stale_after=0.2)
+        proc = subprocess.Popen([sys.executable, "-c", "pass"])
+        proc.wait()
+        reg.register("Gone", "chat", pid=proc.pid)
+        reg.register("Hung", "chat")
+        reg.register("Live", "chat")
+        time.sleep(0.3)
+        reg.heartbeat([{"name": "Live", "queue_depth": 3}])
+        states = {e.name: e.state for e in reg.entries()}
+        self.assertEqual(states, {"Gone": "dead", "Hung": "stale", "Live": "running"})
+        self.assertEqual(reg.get("Live").queue_depth, 3)
+        self.assertEqual(reg.prune(), ["Gone"])
+
+    def test_status_and_stop_across_processes(self) -> None:
+        owner = RuntimeManager(self.paths)
+        buddy = Buddy(name="Owl", persona_prompt="p", autorun_interval="5m", schedule=["07:00|Morning"])
+        owner.running[buddy.name] = buddy
+        owner._mark_running(buddy, source="chat")
+        owner.enqueue(buddy.name, "hello")
+        owner.heartbeat()
+
+        shell = RuntimeManager(self.paths)
+        line = shell.status()["Owl"]
+        self.assertTrue(line.startswith("running ("), line)
+        self.assertIn(f"pid={os.getpid()}", line)
+        self.assertIn("next tick in", line)
+        self.assertIn("queue=1", line)
+
+        # The stop request is applied by the owner on its next heartbeat.
+        self.assertTrue(shell.stop("Owl"))
+        self.assertTrue(shell.registry.get("Owl").stop_requested)
+        self.assertEqual(owner.heartbeat(), ["Owl"])
+        self.assertNotIn("Owl", owner.running)
+        self.assertEqual(shell.status(), {})
+        self.assertFalse(shell.stop("Owl"))
+
+    def test_next_tick_follows_interval(self) -> None:
+        runtime = RuntimeManager(self.paths)
+        buddy = Buddy(name="Tick", persona_prompt="p", autorun_interval="5m")
+        runtime._last_tick[buddy.name] = 1000.0
+        self.assertEqual(runtime.next_tick_at(buddy, now=1100.0), 1300.0)
+        runtime._next_pass = 1130.0  # scheduler passes at 1130, 1190, ...
+        self.assertEqual(runtime.next_tick_at(buddy, now=1100.0), 1310.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
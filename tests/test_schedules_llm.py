@@ -0,0 +1,51 @@
+import json
+import unittest
+from typing import List, Optional
+from unittest import mock
+
+from aibuddies import schedules_llm
+from aibuddies.buddies import Buddy
+from aibuddies.llm import AskOptions, LLMClient
+from aibuddies.schedules_llm import generate_schedules, normalize_entry, parse_batch_reply
+
+
+class FakeClient(LLMClient):
+    """Answers batches in JSON but drops buddies listed in `drop` on the first batch."""
+
+    def __init__(self, drop: List[str]) -> None:
+        self.drop = set(drop)
+        self.calls: List[str] = []
+
+    def ask(self, buddy_name: str, persona_prompt: str, user_text: str, opts: Optional[AskOptions] = None) -> str:
+        self.calls.append(buddy_name)
+        if buddy_name != "schedule-batch":
+            return "7:5|bad minute\n08:30 | Stretch"
+        names = [ln[2:].split(":", 1)[0] for ln in user_text.splitlines() if ln.startswith("- ")]
+        reply = {n: ["9:00|Check in", "25:00|Invalid"] for n in names if n not in self.drop}
+        self.drop.clear()
+        return "```json\n" + json.dumps(reply) + "\n```"
+
+
+class ScheduleGenerationTests(unittest.TestCase):
+    def test_normalize_entry(self) -> None:
+        self.assertEqual(normalize_entry("6:05 - Wake up"), "06:05|Wake up")
+        self.assertIsNone(normalize_entry("24:00|Too late"))
+        self.assertIsNone(normalize_entry("Good morning"))
+
+    def test_parse_batch_reply_is_case_insensitive(self) -> None:
+        parsed = parse_batch_reply('{"gymcoach": ["06:00|Go"]}', ["GymCoach", "Doctor"])
+        self.assertEqual(parsed, {"GymCoach": ["06:00|Go"]})
+
+    def test_batches_and_retries_only_failures(self) -> None:
+        buddies = [Buddy(name=f"B{i}", persona_prompt=f"Persona {i}") for i in range(5)]
+        client = FakeClient(drop=["B1"])
+        with mock.patch.object(schedules_llm, "build_client", return_value=client):
+            results = generate_schedules(buddies, batch_size=5, workers=2, cfg={})
+        self.assertEqual(sorted(results), [b.name for b in buddies])
+        self.assertEqual(results["B0"], ["09:00|Check in"])
+        # One batched request for all five, then a single retry for B1 only.
+        self.assertEqual(len(client.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
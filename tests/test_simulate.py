@@ -0,0 +1,71 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from aibuddies.buddies import Buddy
+from aibuddies.clock import VirtualClock
+from aibuddies.config import Paths
+from aibuddies.runtime import RuntimeManager
+from aibuddies.simulate import DAY, expected_firings, simulate, synthetic_buddies
+
+
+def _midnight() -> float:
+    now = time.localtime()
+    return time.mktime((now.tm_year, now.tm_mon, now.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+class VirtualClockTests(unittest.TestCase):
+    def test_sleep_advances_instead_of_blocking(self) -> None:
+        clock = VirtualClock(1000.0)
+        started = time.monotonic()
+        clock.sleep(3600)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(clock.time(), 4600.0)
+        self.assertEqual(clock.monotonic(), 3600.0)
+        self.assertRaises(ValueError, clock.advance, -1)
+
+    def test_runtime_reads_the_injected_clock(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            clock = VirtualClock(_midnight())
+            runtime = RuntimeManager(Paths(home=Path(tmp)), clock=clock)
+            try:
+                buddy = Buddy(
+                    name="Early", persona_prompt="p", autorun_interval="manual", schedule=["07:30|Morning"], tools_allowed=[]
+                )
+                self.assertEqual(runtime.next_tick_at(buddy), clock.time() + 7.5 * 3600)
+            finally:
+                runtime.usage.ledger.close()
+                runtime.registry.close()
+
+
+class SimulationTests(unittest.TestCase):
+    def test_two_days_fire_on_time(self) -> None:
+        buddies = [
+            Buddy(name="Hourly", persona_prompt="p", autorun_interval="1h", tools_allowed=[]),
+            Buddy(
+                name="Planner",
+                persona_prompt="p",
+                autorun_interval="manual",
+                schedule=["09:00|Plan the day", "17:45|Wrap up"],
+                tools_allowed=[],
+            ),
+        ]
+        start = _midnight()
+        report = simulate(buddies, days=2, start=start)
+        self.assertEqual(report.passes, 2 * 24 * 60)
+        self.assertEqual((report.interval_fires, report.expected_interval), (48, 48))
+        self.assertEqual((report.schedule_fires, report.expected_schedule), (4, 4))
+        self.assertEqual(report.problems(), [])
+        self.assertLess(report.schedule_drift["max"], 60)
+        self.assertEqual(len(expected_firings(buddies[1], start, start + 2 * DAY)), 4)
+
+    def test_slow_passes_miss_schedule_entries(self) -> None:
+        report = simulate(synthetic_buddies(20, seed=3), days=1, lag=130)
+        self.assertTrue(report.missed)
+        self.assertLess(report.schedule_fires, report.expected_schedule)
+        self.assertTrue(any("never fired" in problem for problem in report.problems()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from aibuddies import metrics
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.runtime import RuntimeManager
+from aibuddies.supervisor import HashRing, Supervisor
+
+
+class HashRingTests(unittest.TestCase):
+    def test_removing_a_node_only_moves_its_keys(self) -> None:
+        ring = HashRing([0, 1, 2, 3])
+        keys = [f"buddy-{i}" for i in range(500)]
+        before = {k: ring.node_for(k) for k in keys}
+        self.assertEqual(set(before.values()), {0, 1, 2, 3})
+        ring.remove(2)
+        after = {k: ring.node_for(k) for k in keys}
+        moved = [k for k in keys if before[k] != after[k]]
+        self.assertTrue(moved)
+        self.assertTrue(all(before[k] == 2 for k in moved))
+        ring.add(2)
+        self.assertEqual({k: ring.node_for(k) for k in keys}, before)
+
+
+class SupervisorTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = Paths(home=Path(self.tmpdir.name))
+        self.sup = Supervisor(self.paths, workers=2, report_seconds=0.1)
+        self.sup.start()
+
+    def tearDown(self) -> None:
+        self.sup.shutdown()
+        self.tmpdir.cleanup()
+
+    def wait_for(self, predicate, timeout: float = 20.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.05)
+        return False
+
+    def test_ask_status_and_restart(self) -> None:
+        names = [f"B{i}" for i in range(6)]
+        for name in names:
+            self.sup.add(Buddy(name=name, persona_prompt="Test buddy."))
+        self.assertIn("User asked: hi", self.sup.ask("B0", "hi", timeout=20))
+        self.assertTrue(self.wait_for(lambda: all(s["pid"] for s in self.sup.status().values())))
+
+        victim = self.sup.owner("B0")
+        old_pid = self.sup._procs[victim].pid
+        self.sup._procs[victim].kill()
+        self.sup._procs[victim].join(timeout=5)
+        self.assertEqual(self.sup.check_workers(), [victim])
+        self.assertNotEqual(self.sup._procs[victim].pid, old_pid)
+        self.assertEqual(self.sup.owner("B0"), victim)  # moved back after rejoining the ring
+        self.assertIn("User asked: again", self.sup.ask("B0", "again", timeout=20))
+        new_pid = self.sup._procs[victim].pid
+        self.assertTrue(self.wait_for(
+            lambda: getattr(self.sup.runtime.registry.get("B0"), "pid", None) == new_pid
+        ))
+        self.assertIn(f"worker={victim}, pid={new_pid}", self.sup.runtime.status()["B0"])
+        self.assertTrue(self.sup.runtime.status()["B0"].startswith("running ("))
+
+    def test_restart_keeps_scheduler_state(self) -> None:
+        messages = []
+        self.sup.on_message = lambda name, msg: messages.append(name)
+        self.sup.add(Buddy(name="Restarted", persona_prompt="Test buddy.", autorun_interval="1h"))
+        self.assertTrue(self.wait_for(lambda: messages == ["Restarted"]))  # the first tick checks in
+        self.assertTrue(self.wait_for(lambda: self.sup._sched_state.get("Restarted", {}).get("last_tick")))
+        fired = 'aibuddies_proactive_messages_total{buddy="Restarted",kind="interval"} 1\n'
+        self.assertTrue(self.wait_for(lambda: fired in metrics.REGISTRY.render()))  # a worker's counter
+
+        victim = self.sup.owner("Restarted")
+        self.sup._procs[victim].kill()
+        self.sup._procs[victim].join(timeout=5)
+        self.assertEqual(self.sup.check_workers(), [victim])
+        self.assertEqual(self.sup.owner("Restarted"), victim)
+        new_pid = self.sup._procs[victim].pid
+        self.assertTrue(self.wait_for(lambda: self.sup.status()["Restarted"]["pid"] == new_pid))
+        time.sleep(0.3)
+        self.assertEqual(messages, ["Restarted"])  # the replacement did not check in again
+        self.assertIn(fired, metrics.REGISTRY.render())  # the dead worker's count is kept
+
+    def test_stop_request_reaches_supervisor(self) -> None:
+        self.sup.add(Buddy(name="S1", persona_prompt="Test buddy."))
+        self.assertTrue(self.wait_for(lambda: self.sup.runtime.registry.get("S1") is not None))
+        other = RuntimeManager(self.paths)  # e.g. `aibuddies stop` in another shell
+        self.assertTrue(other.stop("S1"))
+        self.assertTrue(self.wait_for(lambda: self.sup.owner("S1") is None))
+        self.assertIsNone(other.registry.get("S1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from aibuddies import tools
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.deadline import Deadline
+from aibuddies.docs import DocIndex
+from aibuddies.llm import AskOptions, ClaudeClient
+from aibuddies.tools import Tool, ToolCall, ToolEngine
+
+OBJ = {"type": "object", "properties": {"x": {"type": "string"}}}
+
+
+def _tool(name, fn, **kw):
+    return Tool(name=name, description=name, parameters=kw.pop("parameters", OBJ), fn=fn, **kw)
+
+
+class ToolEngineTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.docs = DocIndex(Paths(home=Path(self.tmpdir.name)))
+        self.buddy = Buddy(name=f"T{id(self)}", persona_prompt="p")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def engine(self, registry, **kw) -> ToolEngine:
+        self.buddy.tools_allowed = list(registry)
+        return ToolEngine(self.buddy, docs=self.docs, tools=registry, **kw)
+
+    def test_independent_calls_run_concurrently_with_timeouts_and_limits(self) -> None:
+        slow = lambda args, ctx: (time.sleep(0.3), "done")[1]  # noqa: E731
+        registry = {
+            "a": _tool("a", slow),
+            "b": _tool("b", slow),
+            "hang": _tool("hang", lambda args, ctx: time.sleep(2), timeout=0.1),
+            "big": _tool("big", lambda args, ctx: "x" * 50, max_result_chars=10),
+        }
+        started = time.monotonic()
+        results = self.engine(registry).run([ToolCall(str(i), n, {}) for i, n in enumerate(["a", "b", "hang", "big"])])
+        elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 0.55)  # not 0.6+ sequentially
+        self.assertEqual([r.call_id for r in results], ["0", "1", "2", "3"])
+        self.assertEqual(results[0].content, "done")
+        self.assertTrue(results[2].is_error and "timed out" in results[2].content)
+        self.assertTrue(results[3].content.startswith("x" * 10 + "\n[truncated 40 chars]"))
+
+    def test_idempotent_tools_are_memoized(self) -> None:
+        calls = []
+        registry = {"lookup": _tool("lookup", lambda args, ctx: calls.append(args) or f"v{len(calls)}", idempotent=True)}
+        engine = self.engine(registry)
+        first = engine.run([ToolCall("1", "lookup", {"x": "q"}), ToolCall("2", "lookup", {"x": "q"})])
+        self.assertEqual([r.content for r in first], ["v1", "v1"])
+        again = engine.run([ToolCall("3", "lookup", {"x": "q"}), ToolCall("4", "lookup", {"x": "other"})])
+        self.assertTrue(again[0].cached)
+        self.assertEqual(again[0].content, "v1")
+        self.assertEqual(len(calls), 2)
+
+    def test_retrieve_docs_memo_tracks_doc_changes(self) -> None:
+        self.buddy.docs_enabled = True
+        self.buddy.doc_privacy["allow_cloud_with_docs"] = True
+        folder = self.docs.buddy_dir(self.buddy.name)
+        folder.mkdir(parents=True)
+        (folder / "a.md").write_text("Billing runs nightly.\n\nUnrelated text.", encoding="utf-8")
+        engine = self.engine({"retrieve_docs": tools.TOOLS["retrieve_docs"]})
+        first = engine.run([ToolCall("1", "retrieve_docs", {"query": "billing"})])[0]
+        self.assertIn("Billing runs nightly.", first.content)
+        self.assertTrue(engine.run([ToolCall("2", "retrieve_docs", {"query": "billing"})])[0].cached)
+        (folder / "b.md").write_text("Billing moved to hourly.", encoding="utf-8")
+        fresh = engine.run([ToolCall("3", "retrieve_docs", {"query": "billing"})])[0]
+        self.assertFalse(fresh.cached)
+        self.assertIn("hourly", fresh.content)
+
+    def test_tools_the_policy_forbids_are_not_offered(self) -> None:
+        self.buddy.tools_allowed = ["retrieve_docs", "notify"]  # the defaults
+        notify = lambda name, msg: None  # noqa: E731
+        self.assertEqual(list(ToolEngine(self.buddy, docs=self.docs, notify=notify).tools), ["notify"])
+        self.assertFalse(ToolEngine(self.buddy, docs=self.docs))  # no notify channel either: no tools at all
+        self.buddy.docs_enabled = True
+        self.assertEqual(list(ToolEngine(self.buddy, docs=self.docs, notify=notify).tools), ["notify"])  # cloud
+        local = ToolEngine(self.buddy, docs=self.docs, notify=notify, on_box=True)
+        self.assertEqual([t["name"] for t in local.anthropic_tools()], ["notify", "retrieve_docs"])
+        folder = self.docs.buddy_dir(self.buddy.name)
+        folder.mkdir(parents=True)
+        (folder / "a.md").write_text("Dosage is 5mg.", encoding="utf-8")
+        result = local.run([ToolCall("1", "retrieve_docs", {"query": "dosage"})])[0]
+        self.assertFalse(result.is_error)
+        self.assertIn("5mg", result.content)
+
+    def test_policy_is_enforced_before_running(self) -> None:
+        ran = []
+        record = lambda args, ctx: ran.append(args) or "ran"  # noqa: E731
+        registry = {
+            "read": _tool("read", record, parameters={"type": "object", "properties": {"path": {}}}, path_args=("path",)),
+            "fetch": _tool("fetch", record, parameters={"type": "object", "properties": {"url": {}}}, url_args=("url",)),
+            "shell": _tool("shell", record, needs_confirmation=True),
+        }
+        self.buddy.safety_rules["allowlist_paths"] = [self.tmpdir.name]
+        self.buddy.safety_rules["allowlist_domains"] = ["example.com"]
+        engine = self.engine(registry)
+        results = engine.run([
+            ToolCall("1", "read", {"path": str(Path(self.tmpdir.name) / "ok.txt")}),
+            ToolCall("2", "read", {"path": str(Path(self.tmpdir.name) / ".." / "etc")}),
+            ToolCall("3", "fetch", {"url": "https://docs.example.com/x"}),
+            ToolCall("4", "fetch", {"url": "https://example.com.evil.net/"}),
+            ToolCall("5", "shell", {"x": "rm -rf /"}),
+            ToolCall("6", "missing", {}),
+            ToolCall("7", "read", None),
+        ])
+        self.assertEqual([r.is_error for r in results], [False, True, False, True, True, True, True])
+        self.assertIn("allowlist_paths", results[1].content)
+        self.assertIn("allowlist_domains", results[3].content)
+        self.assertIn("confirm_commands", results[4].content)
+        self.assertEqual(len(ran), 2)
+
+        confirmed = self.engine(registry, confirm=lambda call: call.arguments == {"x": "ls"})
+        self.assertFalse(confirmed.run([ToolCall("8", "shell", {"x": "ls"})])[0].is_error)
+        self.assertTrue(confirmed.run([ToolCall("9", "shell", {"x": "rm"})])[0].is_error)
+
+    def test_time_waiting_for_confirmation_is_not_charged_to_tools(self) -> None:
+        slow = lambda args, ctx: time.sleep(0.05) or "ran"  # noqa: E731
+        registry = {"shell": _tool("shell", slow, needs_confirmation=True, timeout=0.5)}
+        engine = self.engine(registry, confirm=lambda call: time.sleep(0.6) or True)  # a slow answer each time
+        results = engine.run([ToolCall("1", "shell", {"x": "ls"}), ToolCall("2", "shell", {"x": "pwd"})])
+        self.assertEqual([r.content for r in results], ["ran", "ran"])
+        self.assertTrue(all(r.seconds < 0.5 for r in results))
+
+    def test_no_confirmation_is_asked_once_the_deadline_passed(self) -> None:
+        asked = []
+        registry = {"shell": _tool("shell", lambda args, ctx: "ran", needs_confirmation=True)}
+        engine = self.engine(registry, confirm=lambda call: asked.append(call) or True)
+        now = [0.0]
+        deadline = Deadline(5, clock=lambda: now[0])
+        self.assertFalse(engine.run([ToolCall("1", "shell", {"x": "ls"})], deadline)[0].is_error)
+        now[0] = 5.0  # the caller has given up on the turn; this thread is abandoned
+        result = engine.run([ToolCall("2", "shell", {"x": "ls"})], deadline)[0]
+        self.assertTrue(result.is_error)
+        self.assertIn("deadline passed", result.content)
+        self.assertEqual([call.id for call in asked], ["1"])
+
+    def test_nothing_runs_once_the_deadline_passed(self) -> None:
+        ran = []
+        engine = self.engine({"probe": _tool("probe", lambda args, ctx: ran.append(args) or "ran")})
+        now = [0.0]
+        deadline = Deadline(5, clock=lambda: now[0])
+        now[0] = 5.0
+        results = engine.run([ToolCall("1", "probe", {"x": "a"}), ToolCall("2", "probe", {"x": "b"})], deadline)
+        self.assertTrue(all(r.is_error and "deadline passed" in r.content for r in results))
+        self.assertEqual(ran, [])
+
+
+class ClaudeToolLoopTests(unittest.TestCase):
+    def test_tool_use_round_trip_runs_calls_concurrently(self) -> None:
+        requests = []
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def slow(args, ctx):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return f"result {args['x']}"
+
+        def create(**kw):
+            requests.append(kw)
+            if len(requests) == 1:
+                blocks = [
+                    types.SimpleNamespace(type="text", text="Let me check."),
+                    types.SimpleNamespace(type="tool_use", id="t1", name="probe", input={"x": "1"}),
+                    types.SimpleNamespace(type="tool_use", id="t2", name="probe", input={"x": "2"}),
+                ]
+                return types.SimpleNamespace(content=blocks, stop_reason="tool_use", usage=None)
+            return types.SimpleNamespace(
+                content=[types.SimpleNamespace(type="text", text="Both fine.")], stop_reason="end_turn", usage=None
+            )
+
+        fake = types.ModuleType("anthropic")
+        fake.Anthropic = lambda **_: types.SimpleNamespace(messages=types.SimpleNamespace(create=create))
+        buddy = Buddy(name="Looper", persona_prompt="p", tools_allowed=["probe"])
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        engine = ToolEngine(buddy, docs=DocIndex(Paths(home=Path(tmp.name))), tools={"probe": _tool("probe", slow)})
+        with mock.patch.dict(sys.modules, {"anthropic": fake}):
+            client = ClaudeClient("sk-test", "claude-test")
+            reply = client.ask("Looper", "prefix", "check both", AskOptions(tools=engine))
+
+        self.assertEqual(reply, "Both fine.")
+        self.assertEqual(peak[0], 2)
+        self.assertEqual([t["name"] for t in requests[0]["tools"]], ["probe"])
+        followup = requests[1]["messages"]
+        self.assertEqual([m["role"] for m in followup], ["user", "assistant", "user"])
+        self.assertEqual(
+            [(r["tool_use_id"], r["content"]) for r in followup[2]["content"]],
+            [("t1", "result 1"), ("t2", "result 2")],
+        )
+
+    def test_loop_stops_when_the_deadline_passes_during_a_tool_round(self) -> None:
+        requests = []
+        now = [0.0]
+
+        def create(**kw):
+            requests.append(kw)
+            blocks = [
+                types.SimpleNamespace(type="text", text="Let me check."),
+                types.SimpleNamespace(type="tool_use", id="t1", name="probe", input={"x": "1"}),
+            ]
+            return types.SimpleNamespace(content=blocks, stop_reason="tool_use", usage=None)
+
+        def probe(args, ctx):
+            now[0] = 10.0  # the turn runs out while the tool works
+            return "late"
+
+        fake = types.ModuleType("anthropic")
+        fake.Anthropic = lambda **_: types.SimpleNamespace(messages=types.SimpleNamespace(create=create))
+        buddy = Buddy(name="Late", persona_prompt="p", tools_allowed=["probe"])
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        engine = ToolEngine(buddy, docs=DocIndex(Paths(home=Path(tmp.name))), tools={"probe": _tool("probe", probe)})
+        opts = AskOptions(tools=engine, deadline=Deadline(5, clock=lambda: now[0]))
+        with mock.patch.dict(sys.modules, {"anthropic": fake}):
+            reply = ClaudeClient("sk-test", "claude-test").ask("Late", "prefix", "check", opts)
+
+        self.assertEqual(len(requests), 1)  # the tool results were not sent back
+        self.assertEqual(reply, "Let me check.")
+        self.assertEqual(opts.partial, "Let me check.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from aibuddies import tracing
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.llm import DummyLLM
+from aibuddies.runtime import RuntimeManager
+
+
+class TracingTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        tracing.reset()
+
+    def tearDown(self) -> None:
+        tracing.disable()
+        tracing.reset()
+        self.tmpdir.cleanup()
+
+    def test_disabled_spans_are_noops(self) -> None:
+        tracing.disable()
+        with tracing.span("noop", x=1) as s:
+            s.set(y=2)
+        self.assertEqual(tracing.spans(), [])
+
+    def test_ask_path_is_instrumented(self) -> None:
+        tracing.enable()
+        runtime = RuntimeManager(Paths(home=Path(self.tmpdir.name)), client_factory=lambda cfg, model: DummyLLM())
+        buddy = Buddy(name="Tracer", persona_prompt="Trace me.", context_sources=["window"])
+        runtime.running[buddy.name] = buddy
+        runtime.ask(buddy.name, "hello")
+
+        names = [s.name for s in tracing.spans()]
+        for expected in ("runtime.ask", "config.get", "llm.build_client", "context.gather", "context.collect", "llm.ask"):
+            self.assertIn(expected, names)
+        depths = {s.name: s.depth for s in tracing.spans()}
+        self.assertEqual(depths["runtime.ask"], 0)
+        self.assertEqual(depths["context.collect"], 2)
+        self.assertIn("runtime.ask", tracing.render_flame())
+
+        out = Path(self.tmpdir.name) / "trace.json"
+        count = tracing.write_chrome_trace(out)
+        events = json.loads(out.read_text())["traceEvents"]
+        self.assertEqual(len(events), count)
+        self.assertTrue(all(e["ph"] == "X" and e["dur"] >= 0 for e in events))
+
+
+if __name__ == "__main__":
+    unittest.main()
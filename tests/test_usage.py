@@ -0,0 +1,87 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from aibuddies.buddies import Buddy
+from aibuddies.config import Paths
+from aibuddies.llm import LLMClient
+from aibuddies.ratelimit import PRIORITY_SCHEDULED
+from aibuddies.runtime import RuntimeManager
+from aibuddies.usage import MIN_SAMPLES, SITE_DEFAULTS, adaptive_limit, cost
+
+
+class FixedLengthClient(LLMClient):
+    """Replies with `length` completion tokens, capped by max_tokens like a provider would."""
+
+    model = "claude-3-5-sonnet-20240620"
+
+    def __init__(self, length: int, seen: list) -> None:
+        self.length = length
+        self.seen = seen
+
+    def ask(self, buddy_name, persona_prompt, user_text, opts=None):
+        self.seen.append(opts.max_tokens)
+        out = min(self.length, opts.max_tokens)
+        self.last_usage = {"input_tokens": 100, "output_tokens": out, "cache_read_tokens": 0, "cache_write_tokens": 0}
+        return "ok"
+
+
+class AdaptiveLimitTests(unittest.TestCase):
+    def test_default_until_enough_history(self) -> None:
+        self.assertEqual(adaptive_limit([10] * (MIN_SAMPLES - 1), [256] * (MIN_SAMPLES - 1), 512), 512)
+
+    def test_sized_from_p95_with_headroom(self) -> None:
+        outputs = list(range(100, 300, 2))  # p95 ~ 290
+        self.assertEqual(adaptive_limit(outputs, [1024] * len(outputs), 512), 384)
+        self.assertEqual(adaptive_limit([5] * 50, [1024] * 50, 512), 64)  # floor
+
+    def test_grows_when_replies_hit_the_limit(self) -> None:
+        outputs = [100] * 40 + [256] * 10
+        self.assertEqual(adaptive_limit(outputs, [256] * 50, 256), 512)
+        self.assertEqual(adaptive_limit([4096] * 50, [4096] * 50, 256), 4096)  # ceiling
+
+
+class RuntimeUsageTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.seen = []
+        self.runtime = RuntimeManager(
+            Paths(home=Path(self.tmpdir.name)), client_factory=lambda cfg, model: FixedLengthClient(40, self.seen)
+        )
+        self.runtime.running["Terse"] = Buddy(name="Terse", persona_prompt="p", tools_allowed=[])
+
+    def tearDown(self) -> None:
+        self.runtime.usage.ledger.close()
+        self.runtime.registry.close()
+        self.tmpdir.cleanup()
+
+    def test_terse_buddy_gets_a_smaller_limit_per_site(self) -> None:
+        for _ in range(MIN_SAMPLES):
+            self.runtime.ask("Terse", "hi")
+        self.assertEqual(self.seen, [SITE_DEFAULTS["chat"]] * MIN_SAMPLES)
+        self.runtime.ask("Terse", "hi")
+        self.assertEqual(self.seen[-1], 64)
+        # Proactive check-ins have their own history and default.
+        self.runtime.ask("Terse", "check in", priority=PRIORITY_SCHEDULED)
+        self.assertEqual(self.seen[-1], SITE_DEFAULTS["proactive"])
+
+    def test_report_has_cost_and_latency_percentiles(self) -> None:
+        for _ in range(3):
+            self.runtime.ask("Terse", "hi")
+        self.runtime.ask("Terse", "check in", priority=PRIORITY_SCHEDULED)
+        rows = self.runtime.usage.ledger.report()
+        self.assertEqual([(r.site, r.calls) for r in rows], [("chat", 3), ("proactive", 1)])
+        chat = rows[0]
+        self.assertEqual((chat.input_tokens, chat.output_tokens), (300, 120))
+        self.assertAlmostEqual(chat.cost_usd, cost(chat.model, 300, 120))
+        self.assertLessEqual(chat.latency_ms["p50"], chat.latency_ms["p99"])
+        self.assertEqual(self.runtime.usage.ledger.report(buddy="Other"), [])
+
+    def test_openai_cached_prompt_tokens_are_not_billed_twice(self) -> None:
+        self.assertAlmostEqual(cost("gpt-4o", 1_000_000, 0, cache_read=1_000_000), 1.25)
+        self.assertAlmostEqual(cost("claude-3-5-sonnet-20240620", 0, 0, cache_read=1_000_000), 0.30)
+        self.assertIsNone(cost("some-local-model", 10, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import array
+import math
+import tempfile
+import time
+import unittest
+import wave
+from pathlib import Path
+from typing import Iterator, List
+
+from aibuddies.voice import SAMPLE_RATE, StubSTT, StubTTS, VoicePipeline, WavFileSink, WavFileSource
+
+
+def write_utterance(path: Path, speech_ms: int = 600, silence_ms: int = 600) -> None:
+    speech = [int(8000 * math.sin(2 * math.pi * 300 * i / SAMPLE_RATE)) for i in range(SAMPLE_RATE * speech_ms // 1000)]
+    silence = [0] * (SAMPLE_RATE * silence_ms // 1000)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(array.array("h", speech + silence).tobytes())
+
+
+class VoicePipelineTests(unittest.TestCase):
+    def test_audio_starts_before_reply_finishes(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            wav_in = Path(tmp) / "in.wav"
+            wav_out = Path(tmp) / "out.wav"
+            write_utterance(wav_in)
+            heard: List[str] = []
+
+            def respond(text: str) -> Iterator[str]:
+                heard.append(text)
+                for chunk in ["Drink water. ", "Rest well. ", "See a doctor ", "if it persists."]:
+                    time.sleep(0.05)
+                    yield chunk
+
+            sink = WavFileSink(wav_out)
+            pipeline = VoicePipeline(StubSTT("should I take zinc"), StubTTS(), respond, sink)
+            turns = pipeline.run(WavFileSource(wav_in).frames())
+            sink.close()
+
+            self.assertEqual(heard, ["should I take zinc"])
+            self.assertEqual(len(turns), 1)
+            turn = turns[0]
+            self.assertEqual("".join(turn.reply), "Drink water. Rest well. See a doctor if it persists.")
+            # TTS of the first sentence overlaps with the rest of the LLM stream.
+            self.assertLess(turn.first_audio, turn.llm_done)
+            self.assertIsNotNone(turn.summary()["eos_to_first_audio_ms"])
+            with wave.open(str(wav_out), "rb") as w:
+                self.assertGreater(w.getnframes(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()